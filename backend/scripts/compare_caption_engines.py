@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Caption Engine Comparison
+Compare latency and caption agreement of the fp32 and int8 caption engines.
+
+Usage:
+    python3 scripts/compare_caption_engines.py
+    python3 scripts/compare_caption_engines.py --images path/to/images --threads 4 --num-beams 3
+
+Without --images a small deterministic image set is drawn with Pillow so the
+script runs anywhere. fp32 captions are the reference: agreement is the word
+overlap (difflib ratio) of each engine's caption with the fp32 caption.
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+# Add the src directory to Python path so imports work
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, src_dir)
+
+from PIL import Image, ImageDraw
+from imageCaptioning import CAPTION_ENGINES, decode_image, generate_captions, get_caption_model
+from settings import CAPTION_MAX_LENGTH, CAPTION_NUM_BEAMS, CAPTION_TORCH_THREADS
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+def bundled_images():
+    """Draw a few simple scenes; enough to compare engines, not to judge caption quality"""
+    scenes = []
+
+    image = Image.new("RGB", (640, 480), "skyblue")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 320, 640, 480], fill="forestgreen")
+    draw.ellipse([480, 40, 580, 140], fill="yellow")
+    scenes.append(("landscape", image))
+
+    image = Image.new("RGB", (512, 512), "white")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse([106, 106, 406, 406], fill="red")
+    scenes.append(("red_circle", image))
+
+    image = Image.new("RGB", (800, 400), "white")
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 800, 80):
+        draw.rectangle([x, 0, x + 40, 400], fill="black")
+    scenes.append(("stripes", image))
+
+    image = Image.new("RGB", (600, 400), "navy")
+    draw = ImageDraw.Draw(image)
+    draw.text((40, 180), "SALE 50% OFF", fill="white")
+    scenes.append(("banner_text", image))
+
+    image = Image.new("RGB", (400, 600), "saddlebrown")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([60, 80, 340, 520], fill="beige", outline="black", width=6)
+    scenes.append(("framed_panel", image))
+
+    return scenes
+
+def load_images(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), "rb") as image_file:
+                images.append((name, decode_image(image_file.read())))
+    return images
+
+def agreement(caption, reference):
+    return difflib.SequenceMatcher(None, caption.split(), reference.split()).ratio()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare caption engine latency and caption agreement")
+    parser.add_argument("--images", help="Directory of images (default: bundled synthetic set)")
+    parser.add_argument("--engines", nargs="+", default=list(CAPTION_ENGINES), choices=CAPTION_ENGINES)
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per engine")
+    parser.add_argument("--threads", type=int, default=CAPTION_TORCH_THREADS, help="torch intra-op threads")
+    parser.add_argument("--max-length", type=int, default=CAPTION_MAX_LENGTH)
+    parser.add_argument("--num-beams", type=int, default=CAPTION_NUM_BEAMS)
+    args = parser.parse_args()
+
+    import torch
+    torch.set_num_threads(args.threads)
+
+    images = load_images(args.images) if args.images else bundled_images()
+    if not images:
+        print(f"No images found in {args.images}")
+        return 1
+    names = [name for name, _ in images]
+    pil_images = [image for _, image in images]
+
+    print(f"Comparing {', '.join(args.engines)} on {len(images)} images "
+          f"({args.threads} threads, max_length={args.max_length}, num_beams={args.num_beams})")
+
+    results = {}
+    for engine in args.engines:
+        started = time.perf_counter()
+        get_caption_model(engine)
+        load_seconds = time.perf_counter() - started
+
+        # Untimed warmup run
+        generate_captions(pil_images[:1], engine=engine, max_length=args.max_length, num_beams=args.num_beams)
+
+        single_latencies = []
+        batch_seconds = []
+        captions = None
+        for _ in range(args.runs):
+            for image in pil_images:
+                started = time.perf_counter()
+                generate_captions([image], engine=engine, max_length=args.max_length, num_beams=args.num_beams)
+                single_latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            captions = generate_captions(pil_images, engine=engine, max_length=args.max_length, num_beams=args.num_beams)
+            batch_seconds.append(time.perf_counter() - started)
+
+        results[engine] = {
+            "load": load_seconds,
+            "latency": statistics.median(single_latencies),
+            "throughput": len(pil_images) / statistics.median(batch_seconds),
+            "captions": captions
+        }
+
+    reference = results.get("fp32", results[args.engines[0]])["captions"]
+
+    print()
+    print(f"{'engine':<8}{'load s':>10}{'ms/image':>12}{'images/s (batched)':>22}{'agreement':>12}")
+    for engine, result in results.items():
+        mean_agreement = statistics.mean(
+            agreement(caption, ref) for caption, ref in zip(result["captions"], reference)
+        )
+        print(f"{engine:<8}{result['load']:>10.1f}{result['latency'] * 1000:>12.0f}"
+              f"{result['throughput']:>22.2f}{mean_agreement:>12.2f}")
+
+    print()
+    for index, name in enumerate(names):
+        print(name)
+        for engine, result in results.items():
+            print(f"  {engine:<6} {result['captions'][index]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Two-level cache for image captions
+
+Level one maps a resolved image URL to the hash of its content together with
+the ETag/Last-Modified validators of the response. Level two maps a content
+hash to its caption, so the same image served from several URLs or embedded
+as a data URI is only captioned once.
+"""
+import hashlib
+import time
+from tieredCache import TieredCache
+from settings import (
+    CAPTION_MODEL, CAPTION_ENGINE, CAPTION_MAX_LENGTH, CAPTION_NUM_BEAMS, CAPTION_CACHE_MAX_ENTRIES, CAPTION_CACHE_SQLITE_PATH, IMAGE_URL_FRESH_SECONDS
+)
+
+class CaptionCache:
+    def __init__(self, max_entries=CAPTION_CACHE_MAX_ENTRIES, sqlite_path=CAPTION_CACHE_SQLITE_PATH,
+                 fresh_seconds=IMAGE_URL_FRESH_SECONDS):
+        """
+        Args:
+            max_entries: Maximum in-memory entries per level
+            sqlite_path: Path of the SQLite database for the persistent tier (optional)
+            fresh_seconds: Seconds a URL entry is used without revalidating it
+        """
+        self.fresh_seconds = fresh_seconds
+        self.urls = TieredCache("image_urls", max_entries, sqlite_path)
+        self.captions = TieredCache("image_captions", max_entries, sqlite_path)
+
+    @staticmethod
+    def content_hash(image_data):
+        return hashlib.sha256(image_data).hexdigest()
+
+    @staticmethod
+    def _caption_key(content_hash):
+        # Captions depend on the model and generation settings, so they are part of the key
+        return f"{CAPTION_MODEL}:{CAPTION_ENGINE}:{CAPTION_MAX_LENGTH}:{CAPTION_NUM_BEAMS}:{content_hash}"
+
+    async def get_caption(self, content_hash):
+        return await self.captions.aget(self._caption_key(content_hash))
+
+    def set_caption(self, content_hash, caption):
+        self.captions.set(self._caption_key(content_hash), caption)
+
+    async def get_url(self, url):
+        """
+        Returns:
+            dict: {"hash", "etag", "lastModified", "checked"} or None
+        """
+        return await self.urls.aget(url)
+
+    def set_url(self, url, content_hash, etag=None, last_modified=None):
+        self.urls.set(url, {
+            "hash": content_hash,
+            "etag": etag,
+            "lastModified": last_modified,
+            "checked": time.time()
+        })
+
+    def is_fresh(self, entry):
+        return time.time() - entry["checked"] < self.fresh_seconds
+
+    def stats(self):
+        return {
+            "urls": self.urls.stats(),
+            "captions": self.captions.stats()
+        }
+
+caption_cache = CaptionCache()
@@ -0,0 +1,180 @@
+"""
+Caption service backed by a pool of worker processes
+
+Each worker loads the BLIP model once and runs decoding and inference off the
+event loop. Images submitted while a batch is being collected or while the
+workers are busy are captioned together in one batched BLIP call.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from imageCaptioning import caption_sources, init_caption_worker, warmup_caption_worker
+from settings import (
+    CAPTION_MAX_BATCH_SIZE, CAPTION_BATCH_WINDOW, CAPTION_WORKERS,
+    CAPTION_TORCH_THREADS, CAPTION_INTEROP_THREADS, CAPTION_ENGINE, CAPTION_JOB_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+class CaptionService:
+    def __init__(self, workers=CAPTION_WORKERS, torch_threads=CAPTION_TORCH_THREADS,
+                 max_batch_size=CAPTION_MAX_BATCH_SIZE, batch_window=CAPTION_BATCH_WINDOW,
+                 job_timeout=CAPTION_JOB_TIMEOUT):
+        """
+        Args:
+            workers: Number of caption worker processes
+            torch_threads: torch intra-op threads per worker
+            max_batch_size: Maximum number of images per model call
+            batch_window: Seconds to wait for more images after the first one arrives
+            job_timeout: Seconds a single caption job may take before it is abandoned
+        """
+        self.workers = workers
+        self.torch_threads = torch_threads
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.job_timeout = job_timeout
+        self._pool = None
+        self._queue = None
+        self._dispatcher = None
+        self._slots = None
+        self.batches = 0
+        self.images = 0
+        self.timeouts = 0
+        self.pool_restarts = 0
+        self.model_loaded = False
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn keeps torch state out of the forked server process
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_caption_worker,
+                initargs=(self.torch_threads, CAPTION_INTEROP_THREADS)
+            )
+            logger.info(f"Started {CAPTION_ENGINE} caption pool with {self.workers} workers ({self.torch_threads} torch threads each)")
+        return self._pool
+
+    async def _run_in_pool(self, func, *args):
+        """
+        Run func in a worker process. A crashed worker (e.g. killed when out of
+        memory) breaks the whole pool, so it is replaced for the next jobs; the
+        failed job is not retried since it may be what crashed the worker.
+        """
+        pool = self._get_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            # Concurrent batches fail on the same pool; only the first one replaces it
+            if self._pool is pool:
+                logger.error("💥 Caption worker crashed, restarting the caption pool")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self.pool_restarts += 1
+                self.model_loaded = False
+            raise
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._slots = self._slots or asyncio.Semaphore(self.workers)
+            self._dispatcher = asyncio.get_running_loop().create_task(self._run())
+
+    async def caption(self, image_path_or_url, base_url=None, image_data=None):
+        """
+        Caption one image as part of the next batch
+
+        Args:
+            image_path_or_url: Image URL, local path, or data URI
+            base_url: Base URL to resolve relative paths (optional)
+            image_data: Image bytes already downloaded by the server (optional)
+
+        Raises:
+            asyncio.TimeoutError: the job did not finish within job_timeout
+        """
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(((image_path_or_url, base_url, image_data), future))
+        try:
+            return await asyncio.wait_for(future, timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _run(self):
+        while True:
+            # One batch per worker at a time, jobs keep queueing while all workers are busy
+            await self._slots.acquire()
+            try:
+                batch = [await self._queue.get()]
+                if self._queue.empty() and self.batch_window > 0:
+                    await asyncio.sleep(self.batch_window)
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+            except BaseException:
+                self._slots.release()
+                raise
+            asyncio.get_running_loop().create_task(self._process(batch))
+
+    async def _process(self, batch):
+        try:
+            batch = [(source, future) for source, future in batch if not future.done()]
+            if not batch:
+                return
+
+            self.batches += 1
+            self.images += len(batch)
+            logger.info(f"🖼️  Captioning batch of {len(batch)} images")
+            try:
+                captions = await self._run_in_pool(
+                    caption_sources, [source for source, _ in batch], self.max_batch_size
+                )
+                self.model_loaded = True
+                for (_, future), caption in zip(batch, captions):
+                    if not future.done():
+                        future.set_result(caption)
+            except Exception as e:
+                logger.error(f"Error captioning batch of {len(batch)} images: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    async def warmup(self):
+        """
+        Start the worker processes and load the model in each of them
+
+        Returns:
+            int: Number of distinct workers that loaded the model
+        """
+        pids = await asyncio.gather(*[
+            self._run_in_pool(warmup_caption_worker) for _ in range(self.workers)
+        ])
+        self.model_loaded = True
+        return len(set(pids))
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "engine": CAPTION_ENGINE,
+            "model_loaded": self.model_loaded,
+            "batches": self.batches,
+            "images": self.images,
+            "timeouts": self.timeouts,
+            "pool_restarts": self.pool_restarts,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_batch_size": self.max_batch_size
+        }
+
+caption_service = CaptionService()
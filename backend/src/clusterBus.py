@@ -0,0 +1,253 @@
+"""
+Shared state and message bus for several worker processes
+
+With more than one uvicorn worker, the VS Code socket that answers a source
+request is usually held by a different process than the HTTP request waiting
+for it. Workers share a SQLite file: a table of the VS Code connections each
+worker holds (so any worker can rank all of them), a few shared flags, job
+snapshots, and a message table every worker polls for messages addressed to
+it, e.g. "send request_source on your connection X" or "here is the
+source_response for your session Y".
+
+Nothing here touches SQLite on the event loop: writes are queued to a
+writer thread that commits them in batches, and every poll reads new
+messages, the other workers' connections and the flags on a worker thread.
+The connections and flags are served from that snapshot between polls.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from settings import (
+    CLUSTER_BUS_PATH, CLUSTER_POLL_INTERVAL, CLUSTER_WORKER_TIMEOUT, CLUSTER_MESSAGE_TTL, JOB_RESULT_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+BROADCAST = "*"
+
+class ClusterBus:
+    def __init__(self, path=CLUSTER_BUS_PATH, poll_interval=CLUSTER_POLL_INTERVAL,
+                 worker_timeout=CLUSTER_WORKER_TIMEOUT, message_ttl=CLUSTER_MESSAGE_TTL):
+        """
+        Args:
+            path: SQLite file shared by all workers
+            poll_interval: Seconds between checks for new messages
+            worker_timeout: Seconds without a heartbeat after which a worker counts as gone
+            message_ttl: Seconds before undelivered messages are dropped
+        """
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval
+        self.worker_timeout = worker_timeout
+        self.message_ttl = message_ttl
+        self._handlers = {}
+        # Guards the read connection, used by one worker thread at a time
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        # WAL lets workers read while another one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, target TEXT NOT NULL, sender TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_target ON messages (target, id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS connections (id TEXT PRIMARY KEY, worker TEXT NOT NULL, info TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS flags (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, worker TEXT NOT NULL, info TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+        # Only messages sent from now on are for this worker
+        self._last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        # Snapshot of the shared state, refreshed by every poll
+        self._remote_connections = []
+        self._flags = {}
+        self._live_workers = 0
+        self._writes = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, args=(path,), name="cluster-bus-writer", daemon=True)
+        self._writer.start()
+        self._heartbeat()
+        self._refresh()
+        self.sent = 0
+        self.received = 0
+        logger.info(f"Worker {self.worker_id} joined the cluster bus at {path}")
+
+    def on(self, kind, handler):
+        """Handle messages of a kind; handler(payload) may be a coroutine function"""
+        self._handlers[kind] = handler
+
+    def publish(self, worker, kind, **fields):
+        """Send a message to one worker, or to all others with worker=BROADCAST"""
+        payload = json.dumps({"kind": kind, **fields})
+        self._write(
+            "INSERT INTO messages (target, sender, payload, created) VALUES (?, ?, ?, ?)",
+            (worker, self.worker_id, payload, time.time())
+        )
+        self.sent += 1
+
+    async def run(self):
+        """Background task delivering messages to the handlers and keeping this worker's heartbeat"""
+        last_maintenance = 0.0
+        while True:
+            try:
+                for payload in await asyncio.to_thread(self._poll):
+                    await self._dispatch(payload)
+                now = time.monotonic()
+                if now - last_maintenance > 1:
+                    last_maintenance = now
+                    self._heartbeat()
+                    self._prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cluster bus error: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _poll(self):
+        """Worker thread: read new messages for this worker and refresh the shared state snapshot"""
+        messages = self._receive()
+        self._refresh()
+        return messages
+
+    def _receive(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, target, payload FROM messages WHERE id > ? AND (target = ? OR (target = ? AND sender != ?)) ORDER BY id",
+                (self._last_id, self.worker_id, BROADCAST, self.worker_id)
+            ).fetchall()
+        if not rows:
+            return []
+        self._last_id = rows[-1][0]
+        # Broadcasts are read by several workers and expire instead
+        self._write("DELETE FROM messages WHERE target = ? AND id <= ?", (self.worker_id, self._last_id))
+        self.received += len(rows)
+        return [json.loads(payload) for _, _, payload in rows]
+
+    def _refresh(self):
+        live_since = time.time() - self.worker_timeout
+        with self._lock:
+            connections = self._db.execute(
+                "SELECT c.id, c.worker, c.info FROM connections c JOIN workers w ON w.id = c.worker "
+                "WHERE c.worker != ? AND w.last_seen >= ?",
+                (self.worker_id, live_since)
+            ).fetchall()
+            flags = self._db.execute("SELECT name, value FROM flags").fetchall()
+            workers = self._db.execute("SELECT COUNT(*) FROM workers WHERE last_seen >= ?", (live_since,)).fetchone()[0]
+        self._remote_connections = [(connection_id, worker, json.loads(info)) for connection_id, worker, info in connections]
+        self._flags = {name: json.loads(value) for name, value in flags}
+        self._live_workers = workers
+
+    async def _dispatch(self, payload):
+        handler = self._handlers.get(payload.get("kind"))
+        if handler is None:
+            logger.warning(f"No handler for cluster message {payload.get('kind')}")
+            return
+        try:
+            result = handler(payload)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Error handling cluster message {payload.get('kind')}: {e}")
+
+    def _write(self, sql, params=()):
+        self._writes.put((sql, params))
+
+    def _write_loop(self, path):
+        """Writer thread: apply queued writes in batches, one commit per batch; None stops it"""
+        db = sqlite3.connect(path, timeout=5)
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                for write in batch:
+                    if write is not None:
+                        db.execute(*write)
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                logger.error(f"Cluster bus failed to write {len(batch)} changes: {e}")
+            if stop:
+                db.close()
+                return
+
+    def _heartbeat(self):
+        self._write("INSERT OR REPLACE INTO workers (id, last_seen) VALUES (?, ?)", (self.worker_id, time.time()))
+
+    def _prune(self):
+        now = time.time()
+        self._write("DELETE FROM messages WHERE created < ?", (now - self.message_ttl,))
+        self._write("DELETE FROM jobs WHERE updated < ?", (now - JOB_RESULT_TTL,))
+        # Connections of crashed workers
+        self._write(
+            "DELETE FROM connections WHERE worker NOT IN (SELECT id FROM workers WHERE last_seen >= ?)",
+            (now - self.worker_timeout,)
+        )
+
+    def put_connection(self, connection_id, info):
+        """Publish the registration of a VS Code connection held by this worker"""
+        self._write(
+            "INSERT OR REPLACE INTO connections (id, worker, info) VALUES (?, ?, ?)",
+            (connection_id, self.worker_id, json.dumps(info))
+        )
+
+    def remove_connection(self, connection_id):
+        self._write("DELETE FROM connections WHERE id = ? AND worker = ?", (connection_id, self.worker_id))
+
+    def remote_connections(self):
+        """(connection id, worker id, info) of the connections held by the other live workers, as of the last poll"""
+        return list(self._remote_connections)
+
+    def set_flag(self, name, value):
+        self._flags[name] = value
+        self._write("INSERT OR REPLACE INTO flags (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+
+    def get_flag(self, name, default=None):
+        """Value of a shared flag as of the last poll"""
+        return self._flags.get(name, default)
+
+    def put_job(self, job_id, info):
+        """Publish the status of a job running on this worker"""
+        self._write(
+            "INSERT OR REPLACE INTO jobs (id, worker, info, updated) VALUES (?, ?, ?, ?)",
+            (job_id, self.worker_id, json.dumps(info, default=str), time.time())
+        )
+
+    async def get_job(self, job_id):
+        """(worker id, info) of a job published by any worker, or (None, None)"""
+        return await asyncio.to_thread(self._read_job, job_id)
+
+    def _read_job(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT worker, info FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def close(self):
+        """Leave the cluster: other workers stop routing to this worker's connections"""
+        self._write("DELETE FROM connections WHERE worker = ?", (self.worker_id,))
+        self._write("DELETE FROM workers WHERE id = ?", (self.worker_id,))
+        self._writes.put(None)
+        # Shutdown only: let the last writes reach the file before the process exits
+        self._writer.join(timeout=5)
+
+    def stats(self):
+        return {
+            "worker_id": self.worker_id,
+            "workers": self._live_workers,
+            "sent": self.sent,
+            "received": self.received,
+            "queued_writes": self._writes.qsize()
+        }
@@ -0,0 +1,182 @@
+"""
+Compact LLM response format
+
+Instead of repeating the violation id and a complete rewritten snippet for
+every element, the model answers with the number of the [ELEMENT #n] block
+and a minimal patch: attributes to set or remove, inline style properties,
+and optionally a new tag name. The patch is applied to the node's original
+HTML to rebuild the full suggestion. Fixes that cannot be expressed as a
+patch (e.g. wrapping content in a landmark) may return replacement "html".
+"""
+import html
+import re
+from collections import OrderedDict
+
+COMPACT_INSTRUCTIONS = """
+TASK: Fix each numbered element of the request with the smallest possible change to that element.
+
+RESPONSE FORMAT - Return ONLY valid JSON with this EXACT structure:
+{
+  "fixes": [
+    {
+      "element": 1,
+      "description": "One sentence explaining the fix",
+      "set": [{"name": "aria-label", "value": "Add to cart"}],
+      "remove": ["tabindex"],
+      "style": [{"property": "color", "value": "#333333"}]
+    }
+  ]
+}
+
+RULES:
+1. Create ONE fix for EACH element; "element" is the number n of [ELEMENT #n]
+2. Do NOT repeat the element's HTML, only list what changes
+3. "set" adds or replaces attributes, "remove" deletes attributes, "style" adds or replaces inline CSS properties
+4. Use "tag" only to change the element's tag name, e.g. a clickable div to "button"
+5. Use "html" only when the fix cannot be expressed as a patch, e.g. wrapping content in <main>; it replaces the whole element
+6. Use HTML attribute names (class, for, tabindex); they are converted for JSX automatically
+7. Keep text content unchanged
+8. Use real content and names from the source code, no generic placeholders
+9. Omit "set", "remove", "style", "tag" and "html" when they are not needed
+
+FIX GUIDELINES:
+- color-contrast: set style color/background-color values that meet WCAG AA contrast
+- button-name / link-name: set an aria-label describing the action
+- html-has-lang: set lang on the html element
+- label: set aria-label or aria-labelledby on the form control
+- region / landmark-one-main: use "html" to wrap the element in the appropriate landmark
+"""
+
+OPENING_TAG = re.compile(r"""\s*<([a-zA-Z][\w:-]*)((?:\s+[^\s=>/]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s>]+))?)*)\s*(/?)>""", re.S)
+ATTRIBUTE = re.compile(r"""([^\s=>/]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+TAG_NAME = re.compile(r"^[a-zA-Z][\w-]*$")
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+JSX_ATTRIBUTE_NAMES = {"class": "className", "for": "htmlFor", "tabindex": "tabIndex", "readonly": "readOnly",
+                       "maxlength": "maxLength", "autocomplete": "autoComplete", "autofocus": "autoFocus"}
+
+def parse_attributes(text):
+    attributes = OrderedDict()
+    for match in ATTRIBUTE.finditer(text):
+        # Boolean attributes have no value
+        value = next((group for group in match.groups()[1:] if group is not None), None)
+        attributes[match.group(1)] = None if value is None else html.unescape(value)
+    return attributes
+
+def parse_style(style):
+    properties = OrderedDict()
+    for declaration in (style or "").split(";"):
+        if ":" in declaration:
+            name, value = declaration.split(":", 1)
+            properties[name.strip().lower()] = value.strip()
+    return properties
+
+def js_string(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def render_attribute(name, value, jsx):
+    if jsx:
+        if name == "style":
+            properties = ", ".join(
+                f"{re.sub(r'-([a-z])', lambda m: m.group(1).upper(), prop)}: {js_string(val)}"
+                for prop, val in parse_style(value).items()
+            )
+            return f"style={{{{ {properties} }}}}"
+        name = JSX_ATTRIBUTE_NAMES.get(name.lower(), name)
+    if value is None:
+        return name
+    return f'{name}="{html.escape(value, quote=True)}"'
+
+def apply_patch(node_html, fix, jsx=False):
+    """
+    Apply a compact fix to the original HTML of a violation node
+
+    Returns:
+        str: The fixed element, or None if the fix changes nothing or the
+             element's opening tag cannot be parsed
+    """
+    if isinstance(fix.get("html"), str) and fix["html"].strip():
+        return fix["html"]
+
+    match = OPENING_TAG.match(node_html)
+    if not match:
+        return None
+    tag, attribute_text = match.group(1), match.group(2)
+    attributes = parse_attributes(attribute_text)
+    changed = False
+
+    lowered = {name.lower(): name for name in attributes}
+    for name in fix.get("remove") or []:
+        if isinstance(name, str) and name.lower() in lowered:
+            attributes.pop(lowered.pop(name.lower()))
+            changed = True
+
+    for attribute in fix.get("set") or []:
+        if not isinstance(attribute, dict) or not isinstance(attribute.get("name"), str):
+            continue
+        name = lowered.get(attribute["name"].lower(), attribute["name"])
+        if name.lower() == "style":
+            # Style changes belong in "style"; merge them instead of dropping existing properties
+            fix = dict(fix, style=[
+                {"property": prop, "value": val} for prop, val in parse_style(attribute.get("value")).items()
+            ] + list(fix.get("style") or []))
+            continue
+        attributes[name] = None if attribute.get("value") is None else str(attribute["value"])
+        lowered[name.lower()] = name
+        changed = True
+
+    style_changes = [change for change in fix.get("style") or []
+                     if isinstance(change, dict) and isinstance(change.get("property"), str) and change.get("value") is not None]
+    if style_changes:
+        style_name = lowered.get("style", "style")
+        properties = parse_style(attributes.get(style_name))
+        for change in style_changes:
+            properties[change["property"].strip().lower()] = str(change["value"]).strip()
+        attributes[style_name] = "; ".join(f"{prop}: {val}" for prop, val in properties.items()) + ";"
+        changed = True
+
+    rest = node_html[match.end():]
+    new_tag = fix.get("tag")
+    if isinstance(new_tag, str) and TAG_NAME.match(new_tag) and new_tag.lower() != tag.lower():
+        closing = re.compile(rf"</{re.escape(tag)}\s*>\s*$", re.I)
+        rest = closing.sub(f"</{new_tag}>", rest)
+        tag = new_tag
+        changed = True
+
+    if not changed:
+        return None
+
+    rendered = " ".join(render_attribute(name, value, jsx) for name, value in attributes.items())
+    opening = f"<{tag} {rendered}" if rendered else f"<{tag}"
+    self_closing = match.group(3) or (jsx and tag.lower() in VOID_ELEMENTS)
+    return opening + (" />" if self_closing else ">") + rest
+
+def expand_compact_fix(fix, nodes, jsx=False):
+    """
+    Rebuild a full suggestion from a compact fix
+
+    Args:
+        fix: One item of the "fixes" array
+        nodes: (violation, node) pairs in prompt order, [ELEMENT #1] first
+
+    Returns:
+        tuple: (node index, suggestion dict), or None if the fix is invalid
+    """
+    if not isinstance(fix, dict):
+        return None
+    try:
+        element = int(fix.get("element"))
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= element <= len(nodes):
+        return None
+
+    violation, node = nodes[element - 1]
+    snippet = apply_patch(node.html, fix, jsx)
+    if snippet is None:
+        return None
+    description = fix.get("description")
+    return element - 1, {
+        "violationId": violation.id,
+        "fixDescription": description if isinstance(description, str) and description.strip() else f"Fix the {violation.id} accessibility issue",
+        "codeSnippet": snippet
+    }
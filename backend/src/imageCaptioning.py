@@ -1,13 +1,280 @@
-from transformers import BlipProcessor, BlipForConditionalGeneration
 from PIL import Image
 import requests
 from io import BytesIO
+import os
 import re
+import time
 from urllib.parse import urljoin, urlparse
-import base64
+import binascii
+from settings import (
+    CAPTION_MODEL, CAPTION_ENGINE, CAPTION_MAX_LENGTH, CAPTION_NUM_BEAMS, CAPTION_MAX_BATCH_SIZE,
+    IMAGE_MAX_BYTES, IMAGE_MAX_DECODED_PIXELS, IMAGE_DECODE_SIZE
+)
 
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+CAPTION_ENGINES = ("fp32", "int8")
+
+# Loaded on first use so importing this module stays cheap
+processor = None
+models = {}
+
+def get_caption_model(engine=CAPTION_ENGINE):
+    """
+    Load the BLIP processor and the model for an engine mode on first use
+    
+    Args:
+        engine: "fp32" for the original model, "int8" for dynamically
+                quantized linear layers (faster on CPU, slightly lower quality)
+    
+    Returns:
+        tuple: (BlipProcessor, BlipForConditionalGeneration)
+    """
+    global processor
+    if engine not in CAPTION_ENGINES:
+        raise ValueError(f"Unknown caption engine {engine}, expected one of {CAPTION_ENGINES}")
+    
+    if engine not in models:
+        # transformers and torch are only imported where captioning actually runs
+        import torch
+        from transformers import BlipProcessor, BlipForConditionalGeneration
+        started = time.perf_counter()
+        if processor is None:
+            processor = BlipProcessor.from_pretrained(CAPTION_MODEL)
+        model = BlipForConditionalGeneration.from_pretrained(CAPTION_MODEL).eval()
+        if engine == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        models[engine] = model
+        print(f"Loaded caption model {CAPTION_MODEL} ({engine}) in {time.perf_counter() - started:.1f}s (pid {os.getpid()})")
+    return processor, models[engine]
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+class ImageTooLargeError(Exception):
+    """Raised when an image exceeds the configured size limits"""
+
+def resolve_image_url(image_path_or_url, base_url=None):
+    """
+    Resolve an image src to an absolute http(s) URL
+    
+    Args:
+        image_path_or_url: Image URL, local path, or data URI
+        base_url: Base URL to resolve relative paths (optional)
+    
+    Returns:
+        str: The absolute URL, or None for data URIs and local paths
+    """
+    if image_path_or_url.startswith("data:image"):
+        return None
+    elif image_path_or_url.startswith(("http://", "https://")):
+        return image_path_or_url
+    elif base_url and not image_path_or_url.startswith(("http://", "https://", "/")):
+        return urljoin(base_url, image_path_or_url)
+    elif base_url and image_path_or_url.startswith("/"):
+        parsed_base = urlparse(base_url)
+        return f"{parsed_base.scheme}://{parsed_base.netloc}{image_path_or_url}"
+    return None
+
+def load_image(image_path_or_url, base_url=None, image_data=None):
+    """
+    Load an image from URL, local path, or data URI
+    
+    Args:
+        image_path_or_url: Image URL, local path, or data URI
+        base_url: Base URL to resolve relative paths (optional)
+        image_data: Already downloaded image bytes, skips the download (optional)
+    
+    Returns:
+        PIL.Image: The image converted to RGB
+    """
+    if image_data is not None:
+        return decode_image(image_data)
+    
+    if image_path_or_url.startswith("data:image"):
+        return decode_image(decode_data_uri(image_path_or_url))
+    
+    full_url = resolve_image_url(image_path_or_url, base_url)
+    if full_url:
+        response = requests.get(full_url, timeout=15, headers=HEADERS)
+        response.raise_for_status()
+        return decode_image(response.content)
+    
+    with open(image_path_or_url, "rb") as image_file:
+        return decode_image(image_file.read())
+
+def decode_image(image_data, target_size=IMAGE_DECODE_SIZE, max_pixels=IMAGE_MAX_DECODED_PIXELS,
+                 max_bytes=IMAGE_MAX_BYTES):
+    """
+    Decode image bytes at roughly the caption model's input resolution
+    
+    Only the image header is read before the limits are checked. JPEGs are
+    decoded directly at a reduced DCT scale (draft mode), other formats are
+    converted to RGB and reduced right after decoding so the smaller side is
+    about target_size.
+    
+    Peak memory per image is bounded by len(image_data) plus the decoded
+    pixels: at most 4 * max_pixels bytes (about 96 MB with the default limit,
+    twice that while a non-RGB image is converted), and typically a few MB
+    for large JPEGs since they decode at 1/2 to 1/8 scale.
+    
+    Args:
+        image_data: Encoded image bytes
+        target_size: Smallest side the decoded image is reduced to
+        max_pixels: Maximum number of pixels actually decoded
+        max_bytes: Maximum encoded size
+    
+    Returns:
+        PIL.Image: The RGB image, reduced
+    
+    Raises:
+        ImageTooLargeError: the image exceeds max_bytes or max_pixels
+    """
+    if len(image_data) > max_bytes:
+        raise ImageTooLargeError(f"Image of {len(image_data)} bytes exceeds {max_bytes} bytes")
+    
+    image = Image.open(BytesIO(image_data))
+    # Only changes the decode scale for JPEGs, a no-op for other formats
+    image.draft("RGB", (target_size, target_size))
+    
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f"Image of {width}x{height} pixels exceeds {max_pixels} pixels")
+    
+    # Resampling needs real colours: palette indices or 16-bit/1-bit values would be interpolated as numbers
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    scale = target_size / min(width, height)
+    if scale < 1:
+        # reducing_gap reduces by an integer factor first, then resamples the small image
+        image = image.resize(
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            Image.BICUBIC,
+            reducing_gap=2.0
+        )
+    return image
+
+def caption_for_load_error(image_path_or_url, error):
+    """
+    Fallback alt text for an image that could not be loaded
+    """
+    if isinstance(error, (requests.exceptions.Timeout, TimeoutError)):
+        print(f"Timeout downloading image {image_path_or_url}: {error}")
+        return f"Descriptive alt text needed (timeout)"
+    if isinstance(error, (requests.exceptions.RequestException, ConnectionError)):
+        print(f"Network error downloading image {image_path_or_url}: {error}")
+        return f"Descriptive alt text needed (network error)"
+    if isinstance(error, ImageTooLargeError):
+        print(f"Image too large {image_path_or_url}: {error}")
+        return f"Descriptive alt text needed (image too large)"
+    print(f"Error generating caption for {image_path_or_url}: {error}")
+    return f"Descriptive alt text needed"
+
+def is_fallback_caption(caption):
+    """True for the placeholder alt texts returned when an image could not be captioned"""
+    return caption.startswith("Descriptive alt text needed")
+
+def decode_data_uri(data_uri, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Return the decoded bytes of a base64 image data URI
+    
+    The size limit is checked on the encoded length so oversized images are
+    never decoded. Only the payload after the comma is sliced and decoded;
+    the header is never copied.
+    
+    Raises:
+        ImageTooLargeError: the decoded image would exceed max_bytes
+        ValueError: not a data URI, or the payload is not ASCII base64
+    """
+    comma = data_uri.find(',')
+    if comma == -1:
+        raise ValueError("Invalid data URI: no payload")
+    decoded_size = (len(data_uri) - comma - 1) * 3 // 4
+    if decoded_size > max_bytes:
+        raise ImageTooLargeError(f"Data URI of about {decoded_size} bytes exceeds {max_bytes} bytes")
+    try:
+        return binascii.a2b_base64(data_uri[comma + 1:])
+    except (binascii.Error, UnicodeEncodeError, ValueError) as e:
+        # a2b_base64 rejects non-ASCII strings with ValueError
+        raise ValueError(f"Invalid base64 data URI: {e}") from e
+
+def clean_caption(caption):
+    """Remove generic prefixes from a generated caption"""
+    caption = re.sub(r'^(a picture of |an image of |a photo of )', '', caption, flags=re.IGNORECASE)
+    return caption.strip()
+
+def generate_captions(images, max_batch_size=CAPTION_MAX_BATCH_SIZE, engine=CAPTION_ENGINE,
+                      max_length=CAPTION_MAX_LENGTH, num_beams=CAPTION_NUM_BEAMS):
+    """
+    Generate captions for several images with batched BLIP forward passes
+    
+    Args:
+        images: List of RGB PIL images
+        max_batch_size: Maximum number of images per model.generate call
+        engine: Caption engine mode, see get_caption_model
+        max_length: Maximum caption length in tokens
+        num_beams: Beam search width, 1 for greedy decoding
+    
+    Returns:
+        list: One caption per image, in the same order
+    """
+    import torch
+    processor, model = get_caption_model(engine)
+    captions = []
+    for start in range(0, len(images), max_batch_size):
+        batch = images[start:start + max_batch_size]
+        inputs = processor(images=batch, return_tensors="pt")
+        with torch.inference_mode():
+            out = model.generate(**inputs, max_length=max_length, num_beams=num_beams)
+        captions.extend(clean_caption(caption) for caption in processor.batch_decode(out, skip_special_tokens=True))
+    return captions
+
+def init_caption_worker(torch_threads, interop_threads=1):
+    """
+    Process pool initializer for caption workers. Only sets torch's intra-op and
+    inter-op thread counts; the model is loaded once per worker on its first job
+    or on warmup.
+    """
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(interop_threads)
+
+def warmup_caption_worker():
+    """Load the model in a caption worker ahead of the first real job"""
+    get_caption_model()
+    return os.getpid()
+
+def caption_sources(sources, max_batch_size=CAPTION_MAX_BATCH_SIZE):
+    """
+    Load and caption a batch of images inside a caption worker
+    
+    Args:
+        sources: List of (image_path_or_url, base_url, image_data) tuples,
+                 image_data holds bytes downloaded by the server or None
+        max_batch_size: Maximum number of images per model.generate call
+    
+    Returns:
+        list: One caption per source, fallback alt text for images that failed to load
+    """
+    captions = [None] * len(sources)
+    images = []
+    indexes = []
+    for index, (image_path_or_url, base_url, image_data) in enumerate(sources):
+        try:
+            images.append(load_image(image_path_or_url, base_url, image_data))
+            indexes.append(index)
+        except Exception as e:
+            captions[index] = caption_for_load_error(image_path_or_url, e)
+    
+    if images:
+        try:
+            for index, caption in zip(indexes, generate_captions(images, max_batch_size)):
+                captions[index] = caption
+        except Exception as e:
+            print(f"Error generating captions for batch of {len(images)} images: {e}")
+            for index in indexes:
+                captions[index] = f"Descriptive alt text needed"
+    
+    return captions
 
 def generate_caption(image_path_or_url, base_url=None):
     """
@@ -21,62 +288,12 @@ def generate_caption(image_path_or_url, base_url=None):
         str: Generated caption for the image
     """
     try:
-        image = None
-        
-        if image_path_or_url.startswith("data:image"):
-            header, data = image_path_or_url.split(',', 1)
-            image_data = base64.b64decode(data)
-            image = Image.open(BytesIO(image_data)).convert("RGB")
-            
-        elif image_path_or_url.startswith(("http://", "https://")):
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(image_path_or_url, timeout=15, headers=headers)
-            response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert("RGB")
-            
-        elif base_url and not image_path_or_url.startswith(("http://", "https://", "/")):
-            full_url = urljoin(base_url, image_path_or_url)
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(full_url, timeout=15, headers=headers)
-            response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert("RGB")
-            
-        elif base_url and image_path_or_url.startswith("/"):
-            parsed_base = urlparse(base_url)
-            full_url = f"{parsed_base.scheme}://{parsed_base.netloc}{image_path_or_url}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(full_url, timeout=15, headers=headers)
-            response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert("RGB")
-            
-        else:
-            image = Image.open(image_path_or_url).convert("RGB")
-        
-        if image is None:
-            return "Unable to load image"
-            
-        # Generate caption
-        inputs = processor(images=image, return_tensors="pt")
-        out = model.generate(**inputs, max_length=50)
-        caption = processor.decode(out[0], skip_special_tokens=True)
-        
-        # Clean up the caption
-        caption = re.sub(r'^(a picture of |an image of |a photo of )', '', caption, flags=re.IGNORECASE)
-        
-        return caption.strip()
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Network error downloading image {image_path_or_url}: {e}")
-        return f"Descriptive alt text needed (network error)"
-    except requests.exceptions.Timeout as e:
-        print(f"Timeout downloading image {image_path_or_url}: {e}")
-        return f"Descriptive alt text needed (timeout)"
+        image = load_image(image_path_or_url, base_url)
+    except Exception as e:
+        return caption_for_load_error(image_path_or_url, e)
+    
+    try:
+        return generate_captions([image])[0]
     except Exception as e:
         print(f"Error generating caption for {image_path_or_url}: {e}")
         return f"Descriptive alt text needed"
@@ -0,0 +1,135 @@
+"""
+Async image downloads with pooled connections
+
+Images are streamed through one shared httpx client so that connections to
+the same CDN are reused. Downloads are bounded globally and per host and are
+aborted as soon as they exceed IMAGE_FETCH_MAX_BYTES.
+"""
+import asyncio
+import logging
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+import httpx
+from imageCaptioning import HEADERS, ImageTooLargeError
+from settings import (
+    IMAGE_FETCH_TIMEOUT, IMAGE_FETCH_MAX_CONCURRENT, IMAGE_FETCH_MAX_PER_HOST, IMAGE_FETCH_MAX_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+class FetchedImage(NamedTuple):
+    data: Optional[bytes]  # None when the server answered 304 Not Modified
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    @property
+    def not_modified(self):
+        return self.data is None
+
+class ImageFetcher:
+    def __init__(self, max_concurrent=IMAGE_FETCH_MAX_CONCURRENT, max_per_host=IMAGE_FETCH_MAX_PER_HOST,
+                 max_bytes=IMAGE_FETCH_MAX_BYTES, timeout=IMAGE_FETCH_TIMEOUT):
+        """
+        Args:
+            max_concurrent: Maximum parallel downloads across all hosts
+            max_per_host: Maximum parallel downloads to a single host
+            max_bytes: Maximum image size; larger downloads are aborted
+            timeout: Seconds per download
+        """
+        self.max_concurrent = max_concurrent
+        self.max_per_host = max_per_host
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._client = None
+        self._slots = None
+        self._host_slots = {}
+        self.downloads = 0
+        self.downloaded_bytes = 0
+        self.rejected = 0
+        self.revalidated = 0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent,
+                    max_keepalive_connections=self.max_concurrent
+                )
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        return self._client
+
+    async def fetch(self, url, etag=None, last_modified=None):
+        """
+        Download one image, revalidating with If-None-Match/If-Modified-Since when
+        validators of a previous download are given
+
+        Returns:
+            FetchedImage: the image bytes (None if not modified) and the response validators
+
+        Raises:
+            ImageTooLargeError: Content-Length or the streamed body exceeds max_bytes
+            TimeoutError: the download timed out
+            ConnectionError: network or HTTP status error
+        """
+        client = self._get_client()
+        host_slots = self._host_slots.setdefault(urlparse(url).netloc, asyncio.Semaphore(self.max_per_host))
+
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        # Per-host slot first: requests queued behind a busy host must not hold global slots other hosts could use
+        async with host_slots, self._slots:
+            try:
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304:
+                        self.revalidated += 1
+                        return FetchedImage(None, etag, last_modified)
+                    response.raise_for_status()
+
+                    content_length = response.headers.get("content-length", "")
+                    if content_length.isdigit() and int(content_length) > self.max_bytes:
+                        self.rejected += 1
+                        raise ImageTooLargeError(f"Content-Length {content_length} exceeds {self.max_bytes} bytes")
+
+                    chunks = []
+                    size = 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            self.rejected += 1
+                            raise ImageTooLargeError(f"Image exceeds {self.max_bytes} bytes")
+                        chunks.append(chunk)
+
+                    self.downloads += 1
+                    self.downloaded_bytes += size
+                    return FetchedImage(
+                        b"".join(chunks),
+                        response.headers.get("etag"),
+                        response.headers.get("last-modified")
+                    )
+            except httpx.TimeoutException as e:
+                raise TimeoutError(f"Timeout downloading {url}") from e
+            except httpx.HTTPError as e:
+                raise ConnectionError(f"Error downloading {url}: {e}") from e
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {
+            "downloads": self.downloads,
+            "downloaded_bytes": self.downloaded_bytes,
+            "rejected": self.rejected,
+            "not_modified": self.revalidated
+        }
+
+image_fetcher = ImageFetcher()
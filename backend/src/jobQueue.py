@@ -0,0 +1,264 @@
+"""
+Asynchronous analysis jobs
+
+POST /jobs answers 202 with a job id right away instead of holding the
+connection open for the VS Code wait, captioning and Gemini. Jobs wait in a
+bounded queue for one of a fixed number of workers. Their progress is
+reported per stage and can be polled or followed as a stream of status
+events; queued and running jobs can be cancelled. In a multi-worker
+deployment job snapshots are published on the cluster bus so that any worker
+can answer status requests.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from settings import JOB_WORKERS, JOB_QUEUE_MAX_SIZE, JOB_RESULT_TTL
+
+logger = logging.getLogger(__name__)
+
+# Stages in the order a job reaches them
+JOB_STAGES = ("waiting_for_source", "captioning", "llm")
+FINAL_STATES = ("done", "failed", "cancelled")
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full"""
+
+class AnalysisJob:
+    def __init__(self, session_id, request):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.request = request
+        self.status = "queued"
+        # Stage name -> {"state": pending|running|done|failed, ...details}
+        self.stages = {stage: {"state": "pending"} for stage in JOB_STAGES}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at = None
+        self.task = None
+        # Called with the job after every change, e.g. to publish it to other workers
+        self.on_change = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINAL_STATES
+
+    def update_stage(self, stage, state, **details):
+        """Record the progress of one stage and derive the job status from it"""
+        self.stages[stage] = {"state": state, **details}
+        # Stages overlap (captions run while waiting for the source); report the earliest one still running
+        running = next((name for name in JOB_STAGES if self.stages[name]["state"] == "running"), None)
+        if running is not None and not self.finished:
+            self.status = running
+        self._notify()
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        for stage in self.stages.values():
+            if stage["state"] == "running":
+                stage["state"] = "done" if status == "done" else status
+        self._notify()
+
+    def _notify(self):
+        self.updated_at = time.time()
+        self._changed.set()
+        self._changed = asyncio.Event()
+        if self.on_change is not None:
+            self.on_change(self)
+
+    async def wait_for_change(self):
+        await self._changed.wait()
+
+    def info(self):
+        info = {
+            "jobId": self.id,
+            "sessionId": self.session_id,
+            "status": self.status,
+            "stages": self.stages,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at
+        }
+        if self.status == "done":
+            info["result"] = self.result
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_MAX_SIZE, result_ttl=JOB_RESULT_TTL):
+        """
+        Args:
+            workers: Number of jobs running at the same time
+            max_queued: Jobs allowed to wait for a worker
+            result_ttl: Seconds a finished job is kept
+        """
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._queue = None
+        self._worker_tasks = []
+        self._runner = None
+        self.bus = None
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def start(self, runner):
+        """
+        Start the workers
+
+        Args:
+            runner: Coroutine function run(job) returning the job's result
+        """
+        self._runner = runner
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._worker_tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} analysis job workers")
+
+    def attach_bus(self, bus, poll_interval=0.25):
+        """Publish job snapshots to the other workers of a multi-worker deployment"""
+        self.bus = bus
+        self.poll_interval = poll_interval
+        bus.on("cancel_job", lambda payload: self._cancel_local(payload["jobId"]))
+
+    def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                self._cancel_local(job.id)
+
+    def submit(self, job):
+        """
+        Queue a job
+
+        Raises:
+            JobQueueFullError: max_queued jobs are already waiting
+        """
+        self._prune()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFullError(f"{self.max_queued} analysis jobs are already queued")
+        self._jobs[job.id] = job
+        if self.bus is not None:
+            job.on_change = lambda changed: self.bus.put_job(changed.id, changed.info())
+            job.on_change(job)
+        logger.info(f"📥 Queued analysis job {job.id} ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id):
+        self._prune()
+        return self._jobs.get(job_id)
+
+    async def lookup(self, job_id):
+        """Info of a job of this worker or, in a multi-worker deployment, of another one; None if unknown"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.info()
+        if self.bus is not None:
+            return (await self.bus.get_job(job_id))[1]
+        return None
+
+    async def cancel(self, job_id):
+        """Cancel a queued or running job of any worker. Returns False if it already finished."""
+        if job_id not in self._jobs and self.bus is not None:
+            worker, info = await self.bus.get_job(job_id)
+            if info is None or info["status"] in FINAL_STATES:
+                return False
+            self.bus.publish(worker, "cancel_job", jobId=job_id)
+            return True
+        return self._cancel_local(job_id)
+
+    def _cancel_local(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        # A queued job is skipped when a worker picks it up
+        job.finish("cancelled")
+        self.cancelled += 1
+        logger.info(f"🛑 Cancelled analysis job {job_id}")
+        return True
+
+    async def events(self, job_id):
+        """Yield the job's info on every change until it finishes"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            # Job of another worker: follow its published snapshots
+            last = None
+            while True:
+                info = await self.lookup(job_id)
+                if info is None:
+                    return
+                if info != last:
+                    yield info
+                    last = info
+                if info["status"] in FINAL_STATES:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        while True:
+            yield job.info()
+            if job.finished:
+                return
+            await job.wait_for_change()
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.finished:
+                    continue
+                job.task = asyncio.ensure_future(self._runner(job))
+                try:
+                    result = await job.task
+                except asyncio.CancelledError:
+                    # Cancelling the worker also cancels the job it awaits; only a stop of the worker itself is pending here
+                    if asyncio.current_task().cancelling():
+                        job.task.cancel()
+                        raise
+                    if job.status == "cancelled":
+                        continue
+                    # Cancelled from inside, e.g. shared work it was waiting for: the client must not poll forever
+                    logger.error(f"Analysis job {job.id} was cancelled unexpectedly")
+                    job.finish("failed", error="Analysis was cancelled")
+                    self.failed += 1
+                    continue
+                except Exception as e:
+                    logger.error(f"Analysis job {job.id} failed: {e}")
+                    job.finish("failed", error=getattr(e, "detail", None) or str(e))
+                    self.failed += 1
+                    continue
+                job.finish("done", result=result)
+                self.completed += 1
+                logger.info(f"✅ Analysis job {job.id} done in {job.finished_at - job.created_at:.2f}s")
+            finally:
+                self._queue.task_done()
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > self.result_ttl:
+                del self._jobs[job_id]
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": sum(1 for job in self._jobs.values() if not job.finished and job.task is not None),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected
+        }
+
+job_queue = JobQueue()
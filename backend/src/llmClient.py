@@ -0,0 +1,156 @@
+"""
+Async Gemini client with a bounded number of in-flight requests
+
+All LLM calls go through generate_content or generate_content_stream so that
+a slow Gemini response only occupies one concurrency slot instead of blocking
+the event loop. Calls are wrapped by llmResilience for deadlines, hedged
+requests, retries and the circuit breaker.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from settings import LLM_MAX_CONCURRENT_REQUESTS, LLM_MAX_QUEUED_REQUESTS
+from llmResilience import ResilientCaller
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_semaphore = None
+_in_flight = 0
+_queued = 0
+
+class LLMQueueFullError(Exception):
+    """Raised when more than LLM_MAX_QUEUED_REQUESTS calls are waiting for a slot"""
+
+def get_client():
+    """
+    Create the Gemini client on first use so the API key from .env is loaded
+    and the genai SDK is only imported when it is needed
+    """
+    global _client
+    if _client is None:
+        from google import genai
+        _client = genai.Client(
+            api_key=os.environ.get("GEMINI_API_KEY"),
+        )
+    return _client
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENT_REQUESTS)
+    return _semaphore
+
+@asynccontextmanager
+async def _llm_slot():
+    """
+    Hold one of the LLM_MAX_CONCURRENT_REQUESTS slots, waiting in a bounded queue
+    
+    Raises:
+        LLMQueueFullError: the queue of waiting requests is full
+    """
+    global _in_flight, _queued
+    
+    semaphore = _get_semaphore()
+    if semaphore.locked() and _queued >= LLM_MAX_QUEUED_REQUESTS:
+        raise LLMQueueFullError(f"LLM queue is full ({_queued} requests waiting)")
+    
+    _queued += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        _queued -= 1
+    
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        semaphore.release()
+
+async def _call_gemini(model, contents, config):
+    """One Gemini request through the async client, holding a concurrency slot"""
+    async with _llm_slot():
+        logger.info(f"🤖 Sending Gemini request ({_in_flight} in flight, {_queued} queued)")
+        return await get_client().aio.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+
+async def _stream_gemini(model, contents, config):
+    """One streamed Gemini request; the slot is held until the stream is exhausted or closed"""
+    async with _llm_slot():
+        logger.info(f"🤖 Streaming Gemini request ({_in_flight} in flight, {_queued} queued)")
+        stream = await get_client().aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+        async for chunk in stream:
+            yield chunk
+
+# A hedged duplicate that would only wait for a free slot adds load without saving time
+llm_caller = ResilientCaller(
+    _call_gemini, _stream_gemini,
+    can_hedge=lambda: not _get_semaphore().locked(),
+    passthrough=(LLMQueueFullError,)
+)
+
+async def generate_content(model, contents, config):
+    """
+    Call Gemini with a deadline, a hedged duplicate for slow answers and retries
+    
+    Raises:
+        LLMQueueFullError: the queue of waiting requests is full
+        CircuitOpenError: Gemini is degraded, use the local fallback right away
+        asyncio.TimeoutError: no answer before LLM_CALL_DEADLINE
+    """
+    return await llm_caller(model=model, contents=contents, config=config)
+
+async def generate_content_stream(model, contents, config):
+    """
+    Stream a Gemini response chunk by chunk, with timeouts for the first chunk
+    and between chunks
+    
+    Raises:
+        LLMQueueFullError: the queue of waiting requests is full
+        CircuitOpenError: Gemini is degraded, use the local fallback right away
+        asyncio.TimeoutError: the stream did not start or stalled
+    """
+    async for chunk in llm_caller.stream(model=model, contents=contents, config=config):
+        yield chunk
+
+async def create_cached_content(model, system_instruction, ttl, display_name):
+    """
+    Register a system instruction as Gemini cached content so later calls can
+    reference it by name instead of sending it again
+
+    Returns:
+        The cached content's name
+    """
+    async with _llm_slot():
+        cache = await get_client().aio.caches.create(
+            model=model,
+            config={
+                "display_name": display_name,
+                "system_instruction": system_instruction,
+                "ttl": f"{ttl}s",
+            },
+        )
+        return cache.name
+
+def is_client_ready():
+    return _client is not None
+
+def get_llm_stats():
+    """Current LLM concurrency usage for /health"""
+    return {
+        "in_flight": _in_flight,
+        "queued": _queued,
+        "max_concurrent": LLM_MAX_CONCURRENT_REQUESTS,
+        "max_queued": LLM_MAX_QUEUED_REQUESTS,
+        "client_ready": is_client_ready(),
+        "resilience": llm_caller.stats()
+    }
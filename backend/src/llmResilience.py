@@ -0,0 +1,362 @@
+"""
+Deadlines, hedging, retries and a circuit breaker for LLM calls
+
+A slow Gemini response used to hold a request for as long as Gemini took,
+and failures only fell back to placeholders after the full wait. Every call
+now has a deadline. If the first attempt has not answered by the
+LLM_HEDGE_PERCENTILE of recent latencies, a duplicate is sent and whichever
+answers first wins. Failed attempts are retried with jittered exponential
+backoff, and after repeated failures the circuit opens: calls fail fast with
+CircuitOpenError so callers go straight to their local fallbacks until a
+probe call succeeds again.
+
+ResilientCaller wraps any coroutine function, so it can be exercised with a
+fake call that sleeps or raises instead of the Gemini client.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from settings import (
+    LLM_CALL_DEADLINE, LLM_HEDGE_PERCENTILE, LLM_HEDGE_DEFAULT_DELAY, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MIN_SAMPLES,
+    LLM_LATENCY_WINDOW, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_TIMEOUT, LLM_STREAM_FIRST_CHUNK_TIMEOUT, LLM_STREAM_IDLE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes of requests that fail the same way when repeated
+NON_RETRYABLE_STATUS = {400, 401, 403, 404}
+
+class CircuitOpenError(Exception):
+    """Raised without calling the LLM while the circuit breaker is open"""
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and connection errors are retried; invalid requests are not"""
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return not (isinstance(status, int) and status in NON_RETRYABLE_STATUS)
+
+class LatencyTracker:
+    def __init__(self, window=LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, percent):
+        """Latency below which percent of the recent calls answered, or None without samples"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURE_THRESHOLD, reset_timeout=LLM_BREAKER_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe call is allowed
+            clock: Time source, replaceable in tests
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self._probing = False
+
+    def allow(self):
+        """True if a call may go upstream; while half open only one probe at a time"""
+        if self.state == "open":
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("🟢 LLM circuit closed, upstream recovered")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"🔴 LLM circuit opened after {self.failures} failures, using local fallbacks for {self.reset_timeout}s")
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = self.clock()
+            self._probing = False
+
+    def abandon(self):
+        """A call was cancelled before it told anything about the upstream; let the next probe through"""
+        self._probing = False
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened}
+
+class ResilientCaller:
+    def __init__(self, call, stream_call=None, deadline=LLM_CALL_DEADLINE, hedge_percentile=LLM_HEDGE_PERCENTILE,
+                 hedge_default_delay=LLM_HEDGE_DEFAULT_DELAY, hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+                 hedge_min_samples=LLM_HEDGE_MIN_SAMPLES, max_retries=LLM_MAX_RETRIES,
+                 retry_base_delay=LLM_RETRY_BASE_DELAY, retry_max_delay=LLM_RETRY_MAX_DELAY,
+                 first_chunk_timeout=LLM_STREAM_FIRST_CHUNK_TIMEOUT, idle_timeout=LLM_STREAM_IDLE_TIMEOUT,
+                 breaker=None, can_hedge=None, passthrough=(), jitter=random.uniform):
+        """
+        Args:
+            call: Coroutine function making one upstream request
+            stream_call: Async generator function streaming one upstream response (optional)
+            deadline: Seconds a call may take, hedges and retries included
+            hedge_percentile: Latency percentile after which a duplicate request is sent (None disables hedging)
+            hedge_default_delay: Hedge delay until hedge_min_samples latencies are known
+            hedge_min_delay: Lower bound of the hedge delay
+            max_retries: Retries after a failed attempt
+            retry_base_delay: Backoff before the first retry, doubled per retry
+            retry_max_delay: Upper bound of the backoff
+            first_chunk_timeout: Seconds a stream may take to produce its first chunk
+            idle_timeout: Seconds allowed between two chunks of a stream
+            breaker: CircuitBreaker shared by the calls (a new one by default)
+            can_hedge: Returns False when a hedge would only wait for capacity (optional)
+            passthrough: Local errors (e.g. a full queue) raised as they are, without retry or breaker
+            jitter: jitter(low, high) picking the backoff, replaceable in tests
+        """
+        self.call = call
+        self.stream_call = stream_call
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.first_chunk_timeout = first_chunk_timeout
+        self.idle_timeout = idle_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.can_hedge = can_hedge or (lambda: True)
+        self.passthrough = tuple(passthrough)
+        self.jitter = jitter
+        self.latencies = LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.short_circuited = 0
+
+    def hedge_delay(self):
+        if self.hedge_percentile is None:
+            return None
+        if len(self.latencies) < self.hedge_min_samples:
+            return max(self.hedge_min_delay, self.hedge_default_delay)
+        return max(self.hedge_min_delay, self.latencies.percentile(self.hedge_percentile))
+
+    def backoff(self, retry):
+        """Full jitter: anywhere between 0 and the exponential bound"""
+        return self.jitter(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** retry))
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError("LLM circuit is open, upstream is degraded")
+
+    async def __call__(self, **kwargs):
+        """
+        Make the call with deadline, hedging and retries
+
+        Raises:
+            CircuitOpenError: the circuit is open, nothing was sent
+            asyncio.TimeoutError: no attempt answered before the deadline
+            Exception: the last attempt's error once retries are exhausted or it is not retryable
+        """
+        self._check_circuit()
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        retry = 0
+        while True:
+            started = loop.time()
+            try:
+                result = await self._attempt(kwargs, deadline)
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if isinstance(e, self.passthrough):
+                    self.breaker.abandon()
+                    raise
+                if not is_retryable(e):
+                    # The upstream is fine, the request is not
+                    self.breaker.record_success()
+                    raise
+                self.failures += 1
+                self.breaker.record_failure()
+                delay = self.backoff(retry)
+                if retry >= self.max_retries or self.breaker.state == "open" or loop.time() + delay >= deadline:
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}: {e}), retry {retry} in {delay:.2f}s")
+                await self._sleep_before_retry(delay)
+                continue
+            self.latencies.record(loop.time() - started)
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, kwargs, deadline):
+        """One attempt: the call plus a hedged duplicate if it is slow; first success wins"""
+        loop = asyncio.get_running_loop()
+        first = asyncio.ensure_future(self.call(**kwargs))
+        tasks = [first]
+        hedge_at = None
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None:
+            hedge_at = loop.time() + hedge_delay
+        error = None
+        try:
+            while tasks:
+                now = loop.time()
+                if now >= deadline:
+                    raise asyncio.TimeoutError(f"LLM call exceeded its {self.deadline}s deadline")
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(tasks, timeout=max(0, wake_at - now), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not done and hedge_at is not None and loop.time() >= hedge_at:
+                    hedge_at = None
+                    if self.can_hedge():
+                        self.hedges += 1
+                        logger.info(f"⏱️  LLM call slower than {hedge_delay:.1f}s, sending a hedged request")
+                        tasks.append(asyncio.ensure_future(self.call(**kwargs)))
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, **kwargs):
+        """
+        Stream a response with a deadline for the first chunk and between chunks
+
+        Failures before the first chunk are retried like calls; once chunks
+        have been yielded the stream cannot be restarted and errors propagate.
+        Streams are not hedged.
+        """
+        self._check_circuit()
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        retry = 0
+        while True:
+            started = loop.time()
+            stream = self.stream_call(**kwargs)
+            try:
+                first_chunk = await asyncio.wait_for(
+                    stream.__anext__(), timeout=max(0, min(self.first_chunk_timeout, deadline - loop.time()))
+                )
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                await stream.aclose()
+                raise
+            except StopAsyncIteration:
+                self.breaker.record_success()
+                return
+            except Exception as e:
+                await stream.aclose()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if isinstance(e, self.passthrough):
+                    self.breaker.abandon()
+                    raise
+                if not is_retryable(e):
+                    self.breaker.record_success()
+                    raise
+                self.failures += 1
+                self.breaker.record_failure()
+                delay = self.backoff(retry)
+                if retry >= self.max_retries or self.breaker.state == "open" or loop.time() + delay >= deadline:
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning(f"LLM stream failed to start ({type(e).__name__}: {e}), retry {retry} in {delay:.2f}s")
+                await self._sleep_before_retry(delay)
+                continue
+            break
+
+        self.latencies.record(loop.time() - started)
+        # None while the outcome is unknown: the consumer closed the stream early or it was cancelled
+        succeeded = None
+        try:
+            yield first_chunk
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"LLM stream exceeded its {self.deadline}s deadline")
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=min(self.idle_timeout, remaining))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+            succeeded = True
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+            succeeded = False
+            raise
+        finally:
+            await stream.aclose()
+            if succeeded:
+                self.breaker.record_success()
+            elif succeeded is False:
+                self.failures += 1
+                self.breaker.record_failure()
+            else:
+                # Frees the probe slot if this stream was the half-open probe
+                self.breaker.abandon()
+
+    async def _sleep_before_retry(self, delay):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # The failure is already recorded; only the probe slot must not stay taken
+            self.breaker.abandon()
+            raise
+
+    def stats(self):
+        p50 = self.latencies.percentile(50)
+        p95 = self.latencies.percentile(95)
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "hedge_delay": self.hedge_delay(),
+            "circuit": self.breaker.stats()
+        }
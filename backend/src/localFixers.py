@@ -0,0 +1,239 @@
+"""
+Rule-based fixes for trivial violations
+
+Some axe rules can be fixed mechanically from the node HTML alone: a missing
+lang attribute, a missing <title>, an icon-only button, a decorative image.
+Fixers are registered per axe rule id and return None whenever they are not
+confident, in which case the node goes to the LLM as before. Fixes are built
+by patching the node's own HTML, so they keep its attributes and content.
+"""
+import html
+import logging
+import re
+from collections import Counter
+from compactResponse import OPENING_TAG, apply_patch, parse_attributes
+from settings import LOCAL_FIXERS_ENABLED, LOCAL_FIX_DEFAULT_LANG
+
+logger = logging.getLogger(__name__)
+
+LOCAL_FIXERS = {}
+fix_counts = Counter()
+
+# Icon class names and symbols mapped to the action they usually stand for
+ICON_LABELS = {
+    "close": "Close", "times": "Close", "xmark": "Close", "x": "Close", "×": "Close", "✕": "Close", "✖": "Close", "❌": "Close",
+    "menu": "Open menu", "bars": "Open menu", "hamburger": "Open menu", "☰": "Open menu",
+    "search": "Search", "magnifying": "Search", "🔍": "Search", "🔎": "Search",
+    "cart": "Shopping cart", "basket": "Shopping cart", "🛒": "Shopping cart",
+    "trash": "Delete", "delete": "Delete", "bin": "Delete", "🗑": "Delete", "🗑️": "Delete",
+    "edit": "Edit", "pencil": "Edit", "pen": "Edit", "✏": "Edit", "✏️": "Edit",
+    "plus": "Add", "add": "Add", "+": "Add", "➕": "Add",
+    "minus": "Remove", "remove": "Remove", "−": "Remove", "➖": "Remove",
+    "settings": "Settings", "cog": "Settings", "gear": "Settings", "⚙": "Settings", "⚙️": "Settings",
+    "home": "Home", "house": "Home", "🏠": "Home",
+    "user": "Account", "account": "Account", "profile": "Account", "👤": "Account",
+    "heart": "Add to favorites", "favorite": "Add to favorites", "like": "Like", "❤": "Add to favorites", "❤️": "Add to favorites", "♥": "Add to favorites",
+    "star": "Favorite", "⭐": "Favorite", "★": "Favorite",
+    "share": "Share", "download": "Download", "upload": "Upload", "print": "Print", "🖨": "Print",
+    "play": "Play", "▶": "Play", "▶️": "Play", "pause": "Pause", "⏸": "Pause", "⏸️": "Pause",
+    "refresh": "Refresh", "reload": "Refresh", "🔄": "Refresh", "↻": "Refresh",
+    "bell": "Notifications", "notifications": "Notifications", "🔔": "Notifications",
+    "mail": "Email", "envelope": "Email", "email": "Email", "✉": "Email", "✉️": "Email",
+    "info": "More information", "ℹ": "More information", "ℹ️": "More information",
+    "help": "Help", "question": "Help", "?": "Help", "❓": "Help",
+    "next": "Next", "forward": "Next", "→": "Next", "›": "Next", "»": "Next",
+    "previous": "Previous", "prev": "Previous", "back": "Previous", "←": "Previous", "‹": "Previous", "«": "Previous",
+    # Multi-word icon names; class names are only matched as a whole
+    "magnifying-glass": "Search", "shopping-cart": "Shopping cart", "cart-shopping": "Shopping cart",
+    "trash-can": "Delete", "trash-alt": "Delete", "pen-to-square": "Edit", "circle-info": "More information",
+    "info-circle": "More information", "circle-question": "Help", "question-circle": "Help",
+    "arrow-right": "Next", "chevron-right": "Next", "arrow-left": "Previous", "chevron-left": "Previous",
+}
+# Class name parts that only say "this is an icon"
+ICON_PREFIXES = {"fa", "fas", "far", "fab", "fa-solid", "fa-regular", "icon", "icons", "bi", "glyphicon", "material", "mdi", "svg", "ion", "ri", "lucide"}
+# Matched against the whole filename stem (spacer.gif, divider-2.png), not words inside it like team-divider-photo.jpg
+DECORATIVE_SOURCE = re.compile(r"^(?:spacer|pixel|blank|transparent|divider|separator|decoration|decorative|ornament|shim)(?:[-_]?\d+)?$", re.I)
+# Matched against each whole class name, so section-divider-photo is not decorative
+DECORATIVE_CLASS = re.compile(r"(?:decorative|decoration|ornament|divider|separator|spacer)", re.I)
+# Not app/root: those containers also hold the header, nav and footer, which must stay outside <main>
+MAIN_CANDIDATE = re.compile(r"^(?:main|main-content|maincontent|content|page-content)$", re.I)
+LANG_ATTRIBUTE = re.compile(r"""<html\b[^>]*\blang\s*=\s*["']([a-zA-Z]{2,3}(?:-[a-zA-Z0-9]{2,8})*)["']""", re.I)
+# Images at least this wide and high (in px) are treated as content unless marked up as decorative
+CONTENT_IMAGE_MIN_SIZE = 48
+HEADING = re.compile(r"<h1\b[^>]*>(.*?)</h1>", re.I | re.S)
+
+def local_fixer(rule_id):
+    """Register a fixer for an axe rule id"""
+    def register(fixer):
+        LOCAL_FIXERS[rule_id] = fixer
+        return fixer
+    return register
+
+def fix_locally(violation, node, source_content=None, jsx=False):
+    """
+    Fix one violation node with its registered fixer
+
+    Args:
+        violation: The node's violation
+        node: Violation node
+        source_content: Source file content from VS Code (optional)
+        jsx: Render attributes as JSX
+
+    Returns:
+        dict: Suggestion, or None if no fixer is registered or it is not confident
+    """
+    fixer = LOCAL_FIXERS.get(violation.id)
+    if not LOCAL_FIXERS_ENABLED or fixer is None:
+        return None
+    try:
+        fix = fixer(node.html, source_content or "", jsx)
+    except Exception as e:
+        logger.error(f"Local fixer for {violation.id} failed: {e}")
+        return None
+    if fix is None:
+        return None
+    description, code_snippet = fix
+    fix_counts[violation.id] += 1
+    return {
+        "violationId": violation.id,
+        "fixDescription": description,
+        "codeSnippet": code_snippet
+    }
+
+def opening_tag(node_html):
+    match = OPENING_TAG.match(node_html)
+    return match.group(0).strip() if match else None
+
+def visible_text(node_html):
+    return " ".join(html.unescape(re.sub(r"<[^>]+>", " ", node_html)).split())
+
+@local_fixer("html-has-lang")
+def fix_html_lang(node_html, source_content, jsx):
+    tag = opening_tag(node_html)
+    if not tag or not tag.lower().startswith("<html"):
+        return None
+    match = LANG_ATTRIBUTE.search(source_content)
+    lang = match.group(1) if match else LOCAL_FIX_DEFAULT_LANG
+    # Only the opening tag: node HTML of <html> is the whole (truncated) document
+    snippet = apply_patch(tag, {"set": [{"name": "lang", "value": lang}]}, jsx)
+    if snippet is None:
+        return None
+    return f"Declare the page language with lang=\"{lang}\" on the html element", snippet
+
+@local_fixer("document-title")
+def fix_document_title(node_html, source_content, jsx):
+    # The page's main heading is the only title we can take with confidence
+    for text in (node_html, source_content):
+        match = HEADING.search(text)
+        if match:
+            title = visible_text(match.group(1))
+            # Interpolated JSX text is not a usable title
+            if title and "{" not in title:
+                return ("Add a <title> describing the page, taken from its main heading",
+                        f"<title>{html.escape(title, quote=False)}</title>")
+    return None
+
+@local_fixer("button-name")
+def fix_icon_button(node_html, source_content, jsx):
+    match = OPENING_TAG.match(node_html)
+    if not match:
+        return None
+    attributes = {name.lower(): value for name, value in parse_attributes(match.group(2)).items()}
+    if attributes.get("aria-label") or attributes.get("aria-labelledby"):
+        return None
+
+    label = icon_label(node_html[match.end():])
+    if label is None:
+        return None
+    return (f"Name the icon-only button with aria-label=\"{label}\"",
+            apply_patch(node_html, {"set": [{"name": "aria-label", "value": label}]}, jsx))
+
+def icon_label(inner_html):
+    """Label for button content that consists of a single known icon, or None"""
+    text = visible_text(inner_html)
+    if text:
+        return ICON_LABELS.get(text.lower()) if len(text) <= 2 or not text.isascii() else None
+
+    labels = set()
+    for value in re.findall(r"""\b(?:class|className|data-icon|name)\s*=\s*["']([^"']*)["']""", inner_html):
+        for part in re.split(r"[\s_]+", value.lower()):
+            if part in ICON_PREFIXES:
+                continue
+            words = [word for word in part.split("-") if word not in ICON_PREFIXES]
+            # Only the whole icon name: single words of add-to-cart-icon or user-plus name a different action
+            name = "-".join(words)
+            if name in ICON_LABELS:
+                labels.add(ICON_LABELS[name])
+    # Several different icons are ambiguous
+    return labels.pop() if len(labels) == 1 else None
+
+def is_decorative_image(node_html):
+    """True for images that only decorate and need an empty alt instead of a caption"""
+    if not LOCAL_FIXERS_ENABLED:
+        return False
+    match = OPENING_TAG.match(node_html)
+    if not match or match.group(1).lower() != "img":
+        return False
+    attributes = {name.lower(): value or "" for name, value in parse_attributes(match.group(2)).items()}
+    # Explicit markup first
+    if attributes.get("role") in ("presentation", "none") or attributes.get("aria-hidden") == "true":
+        return True
+    sizes = [image_size(attributes.get(size)) for size in ("width", "height")]
+    if all(size is not None and size <= 1 for size in sizes):
+        return True
+    if all(size is not None and size >= CONTENT_IMAGE_MIN_SIZE for size in sizes):
+        return False
+    stem = attributes.get("src", "").split("?")[0].split("#")[0].rstrip("/").rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    classes = (attributes.get("class") or attributes.get("classname") or "").split()
+    return bool(DECORATIVE_SOURCE.match(stem) or any(DECORATIVE_CLASS.fullmatch(name) for name in classes))
+
+def image_size(value):
+    """Pixel size of a width/height attribute (HTML or JSX), or None if missing or not in px"""
+    value = (value or "").strip().strip("{}").lower()
+    if value.endswith("px"):
+        value = value[:-2].strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+@local_fixer("image-alt")
+def fix_decorative_image(node_html, source_content, jsx):
+    if not is_decorative_image(node_html):
+        return None
+    snippet = apply_patch(node_html, {"set": [{"name": "alt", "value": ""}]}, jsx)
+    return "Mark the decorative image with an empty alt so screen readers skip it", snippet
+
+@local_fixer("landmark-one-main")
+def fix_missing_main(node_html, source_content, jsx):
+    # Promote the obvious page content container to <main>
+    for match in OPENING_TAG.finditer(node_html):
+        if match.group(1).lower() not in ("div", "section", "article"):
+            continue
+        attributes = parse_attributes(match.group(2))
+        names = [attributes.get("id") or ""] + (attributes.get("class") or attributes.get("className") or "").split()
+        if any(MAIN_CANDIDATE.match(name) for name in names):
+            element = whole_element(node_html, match)
+            # A truncated container cannot be rewritten without dropping its content; leave it to the LLM
+            if element is None:
+                return None
+            snippet = apply_patch(element, {"tag": "main"}, jsx)
+            return "Turn the page content container into a <main> landmark", snippet
+    return None
+
+def whole_element(node_html, match):
+    """The element opened by an OPENING_TAG match, up to its closing tag, or None if that is missing"""
+    tag = re.escape(match.group(1))
+    depth = 1
+    for tag_match in re.finditer(rf"<(/?){tag}\b[^>]*?(/?)>", node_html[match.end():], re.I):
+        if tag_match.group(1):
+            depth -= 1
+        elif not tag_match.group(2):
+            depth += 1
+        if depth == 0:
+            return node_html[match.start():match.end() + tag_match.end()].strip()
+    return None
+
+def get_local_fix_stats():
+    """Nodes fixed locally per axe rule id"""
+    return dict(fix_counts)
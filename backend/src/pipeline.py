@@ -0,0 +1,72 @@
+"""
+Analysis pipeline as a dependency graph of stages
+
+Each stage is started as a task as soon as the stages it depends on have
+finished, so work that does not need the source file (image downloads and
+captions) runs while the developer is still picking the file in VS Code, and
+only the LLM stage waits for it.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Pipeline:
+    def __init__(self, label):
+        """
+        Args:
+            label: Name used in log messages, e.g. the session id
+        """
+        self.label = label
+        self._tasks = {}
+        self._cleanups = []
+        self.started = time.monotonic()
+        # Stage name -> seconds from pipeline start to the stage finishing
+        self.timings = {}
+
+    def add(self, name, func, after=(), cleanup=None):
+        """
+        Add a stage and start it once its dependencies are done
+
+        Args:
+            name: Stage name
+            func: Called with the results of the stages in after; returns a coroutine
+            after: Names of the stages this one depends on, already added
+            cleanup: Called with the stage's result when the pipeline is cancelled,
+                     e.g. to cancel background work the stage started
+
+        If a dependency fails, the stage fails with the same exception.
+        """
+        dependencies = [self._tasks[dependency] for dependency in after]
+
+        async def run():
+            inputs = [await dependency for dependency in dependencies]
+            result = await func(*inputs)
+            self.timings[name] = round(time.monotonic() - self.started, 3)
+            return result
+
+        task = asyncio.ensure_future(run())
+        # Failures surface in result(); a stage nobody waits for must not log "never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[name] = task
+        if cleanup is not None:
+            self._cleanups.append((task, cleanup))
+        return task
+
+    async def result(self, name):
+        """Wait for a stage and return its result"""
+        return await self._tasks[name]
+
+    def done(self, name):
+        task = self._tasks.get(name)
+        return task is not None and task.done()
+
+    def cancel(self):
+        """Cancel the stages that are still running"""
+        for task in self._tasks.values():
+            task.cancel()
+        for task, cleanup in self._cleanups:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                cleanup(task.result())
+        logger.info(f"Pipeline {self.label} stage timings: {self.timings}")
@@ -1,19 +1,48 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+import time
+
+# Measures import and startup time of the server, logged once the app is ready
+STARTUP_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import Dict
 import asyncio
 import json
 import logging
 import re
-from google import genai
-from google.genai import types
-import os
+import hashlib
 from datetime import datetime
 import uuid
+from collections import deque
 from models import *
-from settings import GEMINI_CONFIG, MODEL
+from settings import (
+    GEMINI_CONFIG, GEMINI_COMPACT_CONFIG, LLM_RESPONSE_FORMAT, MODEL, SOURCE_CODE_TIMEOUT, VSCODE_ACK_TIMEOUT, LLM_BATCH_MAX_NODES,
+    SUGGESTION_CACHE_VERSION, SUGGESTION_CACHE_MAX_ENTRIES, SUGGESTION_CACHE_SQLITE_PATH, PROMPT_PREFIX_VERSION,
+    CLUSTER_BUS_PATH, SESSION_STORE_BACKEND
+)
 from dotenv import load_dotenv
-from imageCaptioning import generate_caption, extract_image_src_from_html
+from imageCaptioning import (
+    extract_image_src_from_html, resolve_image_url, caption_for_load_error,
+    decode_data_uri, is_fallback_caption
+)
+from captionCache import caption_cache
+from imageFetcher import image_fetcher
+from captionService import caption_service
+from llmClient import generate_content, generate_content_stream, get_client, get_llm_stats
+from streamingJson import SuggestionStreamParser
+from sourceContext import extract_source_context
+from compactResponse import expand_compact_fix
+from promptPrefix import prompt_prefixes, get_prefix_key
+from localFixers import fix_locally, is_decorative_image, get_local_fix_stats
+from sourceCache import source_cache, content_hash
+from vscodeConnections import vscode_registry
+from tieredCache import TieredCache
+from sessionStore import create_session_store
+from singleFlight import SingleFlight
+from pipeline import Pipeline
+from jobQueue import AnalysisJob, JobQueueFullError, job_queue
+from clusterBus import ClusterBus
 
 load_dotenv()
 
@@ -30,136 +59,497 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-client = genai.Client(
-    api_key=os.environ.get("GEMINI_API_KEY"),
-)
-
-# In-memory storage for sessions (use Redis/etc. in production)
-active_sessions: Dict[str, Dict[str, Any]] = {}
-vscode_connections: Dict[str, WebSocket] = {}
+# Sessions expire after SESSION_TTL and are bounded by entry and byte budgets
+session_store = create_session_store()
+# Futures resolved as soon as VS Code answers a request_source for a session
+pending_source_requests: Dict[str, asyncio.Future] = {}
+# Futures resolved with True when the targeted VS Code window acknowledges a request_source, False if it declines
+pending_source_acks: Dict[str, asyncio.Future] = {}
 # Flag to disable source code requests for testing
 DISABLE_VSCODE_REQUESTS = False
+# Set once the app has started; heavy models are loaded lazily or through /warmup
+SERVER_READY = False
+session_sweeper = None
+vscode_heartbeat = None
+# Shared state and messages between worker processes, None when running a single process
+cluster_bus = ClusterBus() if CLUSTER_BUS_PATH else None
+cluster_listener = None
 
-@app.post("/suggest-fixes")
-async def suggest_fixes(request: AnalysisRequest):
+# Suggestions for individual violation nodes, shared across sessions
+suggestion_cache = TieredCache(
+    "suggestions",
+    max_entries=SUGGESTION_CACHE_MAX_ENTRIES,
+    sqlite_path=SUGGESTION_CACHE_SQLITE_PATH
+)
+# Identical analyses running at the same time share one computation
+analysis_flights = SingleFlight("analysis")
+caption_flights = SingleFlight("caption")
+# Response schema matching the prompt built by build_suggestion_contents
+LLM_CONFIG = GEMINI_COMPACT_CONFIG if LLM_RESPONSE_FORMAT == "compact" else GEMINI_CONFIG
+
+class SourceRequestCancelled(Exception):
+    """Raised in the waiting request when its source code request is cancelled"""
+
+class NoVSCodeConnectionError(Exception):
+    """Raised when no VS Code window accepted a source code request"""
+
+def vscode_requests_disabled():
+    """DISABLE_VSCODE_REQUESTS, shared by all workers in a multi-worker deployment"""
+    if cluster_bus is not None:
+        return cluster_bus.get_flag("disable_vscode_requests", DISABLE_VSCODE_REQUESTS)
+    return DISABLE_VSCODE_REQUESTS
+
+async def forward_to_session_worker(session_id, kind, **fields):
     """
-    Endpoint called by browser extension to get AI suggestions for violations
+    In a multi-worker deployment, hand a message about a session to the worker
+    whose request is waiting for it
+    
+    Returns:
+        bool: True if the message was sent to another worker, False if it is
+              for this worker (or there is only one)
+    """
+    if cluster_bus is None or session_id in pending_source_requests:
+        return False
+    session = await session_store.get(session_id)
+    worker = session.get("worker") if session else None
+    if worker == cluster_bus.worker_id:
+        return False
+    # Without a shared session store the owner is unknown; every worker checks its own waits
+    cluster_bus.publish(worker or "*", kind, **fields)
+    return True
+
+async def handle_cluster_message(payload):
+    """Handle a session message forwarded by the worker that received it"""
+    session_id = payload.get("sessionId") or payload.get("message", {}).get("sessionId")
+    if payload["kind"] == "vscode_message":
+        if session_id in pending_source_requests or await session_store.exists(session_id):
+            await handle_vscode_message(vscode_registry.get(payload["connectionId"]), payload["message"])
+    elif payload["kind"] == "source_code":
+        await store_source_code(session_id, payload["filePath"], payload["content"])
+    elif payload["kind"] == "cancel_source":
+        cancel_source_request(session_id)
+
+def create_source_waiter(session_id):
+    """
+    Register a future for the session's source code. Must be called before
+    request_source is sent so that an immediate answer is never missed.
+    """
+    future = asyncio.get_running_loop().create_future()
+    pending_source_requests[session_id] = future
+    return future
+
+async def store_source_code(session_id, file_path, content, digest=None):
+    """Store a source_response in the session and wake up the request waiting for it"""
+    if content is not None and digest is None:
+        digest = source_cache.put(file_path, content)
+    # The session only references the file version, its content lives in the source cache
+    await session_store.update(session_id, source_code={"filePath": file_path, "contentHash": digest})
+    
+    future = pending_source_requests.get(session_id)
+    if future is not None and not future.done():
+        future.set_result({
+            "filePath": file_path,
+            "content": content,
+            "contentHash": digest
+        })
+
+def cancel_source_request(session_id):
+    """Cancel a pending source code wait. Returns True if a request was waiting."""
+    future = pending_source_requests.get(session_id)
+    if future is None or future.done():
+        return False
+    future.set_exception(SourceRequestCancelled(f"Source code request cancelled for session {session_id}"))
+    return True
+
+def acknowledge_source_request(session_id, accepted):
+    """Resolve the acknowledgement of the VS Code window a request_source was routed to"""
+    ack = pending_source_acks.get(session_id)
+    if ack is not None and not ack.done():
+        ack.set_result(accepted)
+
+async def route_source_request(session_id, source_request, url=None, timeout=SOURCE_CODE_TIMEOUT):
     """
+    Send request_source to the best matching VS Code window and wait for its answer
+    
+    Windows are tried in vscode_registry.rank(url) order. A window that declines,
+    cannot be reached or does not acknowledge within VSCODE_ACK_TIMEOUT is sent
+    cancel_source and the next one is tried. Once a window acknowledges, the
+    developer has the rest of the timeout to pick a file.
+    
+    Raises:
+        asyncio.TimeoutError: no answer within the timeout
+        SourceRequestCancelled: the wait was cancelled through cancel_source_request
+        NoVSCodeConnectionError: every window declined or was unreachable
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    future = pending_source_requests.get(session_id) or create_source_waiter(session_id)
+    cancel_message = {"type": "cancel_source", "sessionId": session_id}
+    timed_out = False
+    
     try:
-        session_id = str(uuid.uuid4())
-        # Store session data
-        active_sessions[session_id] = {
-            "violations": request.violations,
-            "url": request.url,
-            "timestamp": datetime.now(),
-            "source_code": None,
-            "suggestions": None
-        }
-        
-        logger.info(f"Created session {session_id} with {len(request.violations)} violations")
-        
-        # Debug: Log violation IDs
-        violation_ids = [v.id for v in request.violations]
-        logger.info(f"Violation IDs received: {violation_ids}")
-        
-        # Check for image-alt violations specifically
-        image_alt_violations = [v for v in request.violations if v.id == "image-alt"]
-        logger.info(f"Image-alt violations found: {len(image_alt_violations)}")
-        
-        # Always request fresh source code from VS Code for every request
-        # This ensures developer must choose a file every time
-        source_code = None
-        logger.info(f"Starting source code request process. VS Code connections: {len(vscode_connections)}, DISABLE_VSCODE_REQUESTS: {DISABLE_VSCODE_REQUESTS}")
-        
-        if vscode_connections and not DISABLE_VSCODE_REQUESTS:
-            logger.info("🎯 ENTERING VS Code request flow - will wait for file selection")
-            source_request = {
-                "type": "request_source",
-                "sessionId": session_id,
-                "violations": [v.dict() for v in request.violations],
-                "url": request.url
-            }
+        for connection in vscode_registry.rank(url):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
             
-            # Send to all connected VSCode instances
-            dead_connections = []
-            for connection_id, ws in vscode_connections.items():
-                try:
-                    await ws.send_text(json.dumps(source_request))
-                    logger.info(f"✅ Sent source code request to VS Code connection {connection_id}")
-                except Exception as e:
-                    logger.error(f"❌ Failed to send to connection {connection_id}: {e}")
-                    dead_connections.append(connection_id)
+            ack = loop.create_future()
+            pending_source_acks[session_id] = ack
+            if not await vscode_registry.send(connection, source_request):
+                continue
+            logger.info(f"✅ Sent source code request to VS Code connection {connection.id}")
             
-            # Remove dead connections
-            for connection_id in dead_connections:
-                del vscode_connections[connection_id]
+            # Windows of older extensions never acknowledge, they get the whole timeout
+            if connection.registered:
+                await asyncio.wait([ack, future], timeout=min(VSCODE_ACK_TIMEOUT, remaining), return_when=asyncio.FIRST_COMPLETED)
+                if not future.done() and not (ack.done() and ack.result()):
+                    timed_out = timed_out or not ack.done()
+                    reason = "declined" if ack.done() else "did not acknowledge"
+                    logger.info(f"↪️  VS Code connection {connection.id} {reason} the request for session {session_id}, trying the next one")
+                    await vscode_registry.send(connection, cancel_message)
+                    continue
             
-            if vscode_connections:  # Only wait if we have active connections
-                logger.info(f"⏳ Waiting for source code from VS Code... ({len(vscode_connections)} active connections)")
-                for i in range(30):  # 30 second timeout
-                    await asyncio.sleep(1)
-                    current_source = active_sessions[session_id]["source_code"]
-                    has_valid_source = current_source is not None and current_source.get('content') is not None
-                    
-                    # Debug logging
-                    if current_source is not None:
-                        file_path = current_source.get('filePath')
-                        content_length = len(current_source.get('content') or '')
-                        logger.info(f"⏱️  Wait iteration {i+1}/30 - Source exists: True, FilePath: {file_path}, ContentLength: {content_length}, Valid: {has_valid_source}")
-                    else:
-                        logger.info(f"⏱️  Wait iteration {i+1}/30 - Source exists: False, Valid: {has_valid_source}")
-                    
-                    if has_valid_source:
-                        source_code = current_source
-                        logger.info(f"✅ Received VALID source code after {i+1} seconds: {source_code.get('filePath', 'Unknown file')}")
-                        break
-                
-                if source_code is None:
-                    # Check if user cancelled or no file was selected
-                    current_source = active_sessions[session_id]["source_code"]
-                    if current_source is not None and current_source.get('content') is None:
-                        logger.warning("👤 User cancelled file selection or no file was selected")
-                        raise HTTPException(status_code=400, detail="File selection cancelled. Please select a source file to get context-aware suggestions.")
-                    else:
-                        logger.warning("⏰ Timeout waiting for source code from VS Code after 30 seconds")
-                        raise HTTPException(status_code=408, detail="Timeout waiting for source code selection. Please ensure VS Code extension is active and you select a file.")
-            else:
-                logger.warning("❌ No active VS Code connections after sending requests")
-                raise HTTPException(status_code=503, detail="No VS Code connection available. Please ensure VS Code extension is installed and active.")
-        else:
-            if DISABLE_VSCODE_REQUESTS:
-                logger.info("🚫 VS Code requests disabled, proceeding without source code")
-            else:
-                logger.warning("❌ No VS Code connections available")
-                raise HTTPException(status_code=503, detail="No VS Code connection available. Please ensure VS Code extension is installed and active.")
+            logger.info(f"⏳ Waiting for source code from VS Code connection {connection.id} (timeout {max(0, deadline - loop.time()):.0f}s)")
+            try:
+                source_code = await asyncio.wait_for(asyncio.shield(future), timeout=max(0, deadline - loop.time()))
+            except BaseException:
+                # Timeout, /cancel or client disconnect: close the file picker
+                await vscode_registry.send(connection, cancel_message)
+                raise
+            vscode_registry.record_answer(connection, url)
+            return source_code
         
-        # Debug what we're passing to generate_suggestions
-        if source_code is None:
-            logger.error("🚨 CRITICAL: No source code available - cannot generate context-aware suggestions")
-            raise HTTPException(status_code=400, detail="No source code available. Please select a file in VS Code to get context-aware suggestions.")
+        if timed_out or deadline - loop.time() <= 0:
+            raise asyncio.TimeoutError()
+        raise NoVSCodeConnectionError("No VS Code window accepted the source code request")
+    finally:
+        pending_source_requests.pop(session_id, None)
+        pending_source_acks.pop(session_id, None)
+
+async def create_session(request: AnalysisRequest):
+    """Create the session of an analysis request and return its id"""
+    session_id = str(uuid.uuid4())
+    # Store session data
+    await session_store.create(session_id, {
+        "violations": [v.dict() for v in request.violations],
+        "url": request.url,
+        "timestamp": datetime.now().isoformat(),
+        "source_code": None,
+        "suggestions": None,
+        # Worker process waiting for VS Code answers about this session
+        "worker": cluster_bus.worker_id if cluster_bus else None
+    })
+    
+    logger.info(f"Created session {session_id} with {len(request.violations)} violations")
+    
+    # Debug: Log violation IDs
+    violation_ids = [v.id for v in request.violations]
+    logger.info(f"Violation IDs received: {violation_ids}")
+    
+    # Check for image-alt violations specifically
+    image_alt_violations = [v for v in request.violations if v.id == "image-alt"]
+    logger.info(f"Image-alt violations found: {len(image_alt_violations)}")
+    
+    return session_id
+
+async def acquire_source_code(session_id, request: AnalysisRequest):
+    """
+    Request the source file from VS Code and wait for the developer to pick one
+    
+    Raises:
+        HTTPException: no VS Code connection, timeout, cancellation or empty file
+    """
+    # Always request fresh source code from VS Code for every request
+    # This ensures developer must choose a file every time
+    source_code = None
+    requests_disabled = vscode_requests_disabled()
+    logger.info(f"Starting source code request process. VS Code connections: {len(vscode_registry)}, DISABLE_VSCODE_REQUESTS: {requests_disabled}")
+    
+    if len(vscode_registry) and not requests_disabled:
+        logger.info("🎯 ENTERING VS Code request flow - will wait for file selection")
+        source_request = {
+            "type": "request_source",
+            "sessionId": session_id,
+            "violations": [v.dict() for v in request.violations],
+            "url": request.url,
+            # Lets VS Code answer with a hash or a delta instead of the whole file
+            "cachedFiles": source_cache.known_files()
+        }
         
-        file_path = source_code.get('filePath', 'No path')
-        content = source_code.get('content', '')
-        content_length = len(content or '')
+        try:
+            source_code = await route_source_request(session_id, source_request, request.url)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏰ Timeout waiting for source code from VS Code after {SOURCE_CODE_TIMEOUT} seconds")
+            raise HTTPException(status_code=408, detail="Timeout waiting for source code selection. Please ensure VS Code extension is active and you select a file.")
+        except SourceRequestCancelled:
+            logger.warning(f"🛑 Source code request cancelled for session {session_id}")
+            raise HTTPException(status_code=400, detail="Source code request cancelled.")
+        except NoVSCodeConnectionError:
+            logger.warning("❌ No VS Code connection accepted the source code request")
+            raise HTTPException(status_code=503, detail="No VS Code connection available. Please ensure VS Code extension is installed and active.")
         
-        if not content:
-            logger.error("🚨 CRITICAL: Source code content is empty - cannot generate context-aware suggestions")
-            raise HTTPException(status_code=400, detail="Source code content is empty. Please select a valid file with content in VS Code.")
-            
-        logger.info(f"✅ About to generate context-aware suggestions with source_code: {file_path} ({content_length} chars)")
+        if source_code.get('content') is None:
+            # Check if user cancelled or no file was selected
+            logger.warning("👤 User cancelled file selection or no file was selected")
+            raise HTTPException(status_code=400, detail="File selection cancelled. Please select a source file to get context-aware suggestions.")
         
-        suggestions = await generate_suggestions(
-            request.violations,
-            source_code
+        logger.info(f"✅ Received VALID source code: {source_code.get('filePath', 'Unknown file')}")
+    else:
+        if requests_disabled:
+            logger.info("🚫 VS Code requests disabled, proceeding without source code")
+        else:
+            logger.warning("❌ No VS Code connections available")
+            raise HTTPException(status_code=503, detail="No VS Code connection available. Please ensure VS Code extension is installed and active.")
+    
+    # Debug what we're passing to generate_suggestions
+    if source_code is None:
+        logger.error("🚨 CRITICAL: No source code available - cannot generate context-aware suggestions")
+        raise HTTPException(status_code=400, detail="No source code available. Please select a file in VS Code to get context-aware suggestions.")
+    
+    file_path = source_code.get('filePath', 'No path')
+    content = source_code.get('content', '')
+    content_length = len(content or '')
+    
+    if not content:
+        logger.error("🚨 CRITICAL: Source code content is empty - cannot generate context-aware suggestions")
+        raise HTTPException(status_code=400, detail="Source code content is empty. Please select a valid file with content in VS Code.")
+    
+    logger.info(f"✅ About to generate context-aware suggestions with source_code: {file_path} ({content_length} chars)")
+    return source_code
+
+def make_analysis_key(request: AnalysisRequest, source_code):
+    """Canonical hash of an analysis request and the source file it runs against"""
+    source_code = source_code or {}
+    content = source_code.get("content")
+    key_data = json.dumps({
+        # timestamp differs between callers and does not change the result
+        "violations": [v.dict() for v in request.violations],
+        "url": request.url,
+        "filePath": source_code.get("filePath"),
+        "contentHash": source_code.get("contentHash") or (content_hash(content) if content else None)
+    }, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+def start_analysis_pipeline(session_id, request: AnalysisRequest):
+    """
+    Start the stages of an analysis that do not depend on each other: the
+    source code request and the image captions, which run while the developer
+    picks the file. Endpoints add the source-dependent suggestion stage.
+    """
+    image_nodes, _ = split_image_nodes(request.violations)
+    pipeline = Pipeline(session_id)
+    pipeline.add("source", lambda: acquire_source_code(session_id, request))
+    pipeline.add(
+        "captions",
+        lambda: prefetch_image_captions(image_nodes, request.url),
+        cleanup=lambda tasks: [task.cancel() for task in tasks if task is not None]
+    )
+    return pipeline
+
+def take_caption_tasks(caption_tasks):
+    """
+    Hand the prefetched caption tasks over to the computation that uses them
+
+    The computation may be shared with concurrent identical requests
+    (analysis_flights), so it must outlive the request that started it: the
+    tasks are removed from the list the pipeline cancels on cleanup and are
+    cancelled by the computation itself when it stops early.
+    """
+    owned = list(caption_tasks)
+    caption_tasks.clear()
+    return owned
+
+@app.post("/suggest-fixes")
+async def suggest_fixes(request: AnalysisRequest):
+    """
+    Endpoint called by browser extension to get AI suggestions for violations
+    """
+    try:
+        session_id = await create_session(request)
+        pipeline = start_analysis_pipeline(session_id, request)
+        # Concurrent identical requests wait for the same suggestions; each keeps its own session
+        pipeline.add(
+            "suggestions",
+            lambda source_code, caption_tasks: analysis_flights.run(
+                make_analysis_key(request, source_code),
+                lambda: generate_suggestions(request.violations, source_code, take_caption_tasks(caption_tasks))
+            ),
+            after=("source", "captions")
         )
+        try:
+            suggestions = await pipeline.result("suggestions")
+        finally:
+            pipeline.cancel()
         
-        active_sessions[session_id]["suggestions"] = suggestions
+        await session_store.update(session_id, suggestions=suggestions)
         return {"suggestions": suggestions, "sessionId": session_id}
         
     except Exception as e:
         logger.error(f"Error in suggest_fixes: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/suggest-fixes/stream")
+async def suggest_fixes_stream(request: AnalysisRequest, http_request: Request):
+    """
+    Streaming variant of /suggest-fixes. Source code is requested from VS Code
+    the same way (captions start meanwhile), then every suggestion is sent as
+    soon as it is ready.
+    
+    Events are newline-delimited JSON, or server-sent events when the client
+    sends Accept: text/event-stream:
+        {"type": "session", "sessionId": ..., "total": <number of suggestions>}
+        {"type": "suggestion", "index": <position in the /suggest-fixes result>, "suggestion": {...}}
+        {"type": "error", "detail": ...}
+        {"type": "done", "count": <number of suggestions sent>}
+    """
+    session_id = await create_session(request)
+    pipeline = start_analysis_pipeline(session_id, request)
+    try:
+        source_code = await pipeline.result("source")
+        caption_tasks = await pipeline.result("captions")
+    except BaseException:
+        pipeline.cancel()
+        raise
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    
+    def encode(event):
+        return encode_event(event, use_sse)
+    
+    analysis_key = make_analysis_key(request, source_code)
+    
+    async def events():
+        total = sum(len(violation.nodes) for violation in request.violations)
+        suggestions = [None] * total
+        count = 0
+        yield encode({"type": "session", "sessionId": session_id, "total": total})
+        
+        try:
+            suggestion_stream = analysis_flights.stream(
+                analysis_key,
+                lambda: stream_suggestions(request.violations, source_code, take_caption_tasks(caption_tasks))
+            )
+            async for index, suggestion in suggestion_stream:
+                suggestions[index] = suggestion
+                count += 1
+                if count == 1:
+                    logger.info(f"⚡ First suggestion for session {session_id} ready")
+                yield encode({"type": "suggestion", "index": index, "suggestion": suggestion})
+        except Exception as e:
+            logger.error(f"Error in suggest_fixes_stream: {str(e)}")
+            yield encode({"type": "error", "detail": str(e)})
+        finally:
+            pipeline.cancel()
+        
+        await session_store.update(session_id, suggestions={
+            "suggestions": [suggestion for suggestion in suggestions if suggestion is not None]
+        })
+        yield encode({"type": "done", "count": count})
+    
+    return event_stream_response(events(), use_sse)
+
+def encode_event(event, use_sse):
+    """One event as an NDJSON line or a server-sent event named after its type"""
+    data = json.dumps(event)
+    if use_sse:
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+def event_stream_response(events, use_sse):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_analysis_job(job: AnalysisJob):
+    """Run a queued analysis through the pipeline, reporting the progress of each stage"""
+    request = job.request
+    pipeline = start_analysis_pipeline(job.session_id, request)
+    job.update_stage("waiting_for_source", "running")
+    try:
+        prefetched = await pipeline.result("captions")
+        caption_tasks = [task for task in prefetched if task is not None]
+        
+        def caption_done(_):
+            if not job.finished:
+                done = sum(1 for task in caption_tasks if task.done())
+                job.update_stage("captioning", "done" if done == len(caption_tasks) else "running",
+                                 done=done, total=len(caption_tasks))
+        
+        caption_done(None)
+        for task in caption_tasks:
+            task.add_done_callback(caption_done)
+        
+        source_code = await pipeline.result("source")
+        job.update_stage("waiting_for_source", "done", filePath=source_code.get("filePath"))
+        
+        job.update_stage("llm", "running")
+        suggestions = await analysis_flights.run(
+            make_analysis_key(request, source_code),
+            lambda: generate_suggestions(request.violations, source_code, take_caption_tasks(prefetched))
+        )
+        job.update_stage("llm", "done")
+        
+        await session_store.update(job.session_id, suggestions=suggestions)
+        return {"suggestions": suggestions, "sessionId": job.session_id}
+    finally:
+        pipeline.cancel()
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: AnalysisRequest):
+    """
+    Queue an analysis and return its job id right away. Progress and the
+    result (shaped like the /suggest-fixes response) are available from
+    GET /jobs/{job_id}, or pushed by GET /jobs/{job_id}/events.
+    """
+    session_id = await create_session(request)
+    try:
+        job = job_queue.submit(AnalysisJob(session_id, request))
+    except JobQueueFullError as e:
+        await session_store.delete(session_id)
+        logger.warning(f"❌ Rejected analysis job: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "jobId": job.id,
+        "sessionId": session_id,
+        "status": job.status,
+        "statusUrl": f"/jobs/{job.id}",
+        "eventsUrl": f"/jobs/{job.id}/events"
+    }
+
+async def get_job_or_404(job_id):
+    """Info of a job run by this or, in a multi-worker deployment, any other worker"""
+    info = await job_queue.lookup(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return info
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, per-stage progress and, once done, the result of an analysis job"""
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, http_request: Request):
+    """
+    Push the job's status on every change until it is done, failed or
+    cancelled, as NDJSON or server-sent events (Accept: text/event-stream)
+    """
+    await get_job_or_404(job_id)
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    
+    async def events():
+        async for info in job_queue.events(job_id):
+            yield encode_event({"type": "status", **info}, use_sse)
+    
+    return event_stream_response(events(), use_sse)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running analysis job, including its source code request"""
+    await get_job_or_404(job_id)
+    return {"cancelled": await job_queue.cancel(job_id), "jobId": job_id}
+
 @app.post("/source-code")
 async def receive_source_code(response: SourceCodeResponse):
     """
@@ -167,11 +557,10 @@ async def receive_source_code(response: SourceCodeResponse):
     """
     try:
         session_id = response.sessionId
-        if session_id in active_sessions:
-            active_sessions[session_id]["source_code"] = {
-                "filePath": response.filePath,
-                "content": response.content
-            }
+        if await session_store.exists(session_id):
+            if not await forward_to_session_worker(session_id, "source_code", sessionId=session_id,
+                                                   filePath=response.filePath, content=response.content):
+                await store_source_code(session_id, response.filePath, response.content)
             logger.info(f"Received source code for session {session_id}")
             return {"status": "received"}
         else:
@@ -180,51 +569,52 @@ async def receive_source_code(response: SourceCodeResponse):
         logger.error(f"Error receiving source code: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/cancel/{session_id}")
+async def cancel_session(session_id: str):
+    """
+    Cancel a /suggest-fixes request that is still waiting for source code
+    """
+    if not await session_store.exists(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    # The waiting request may run on another worker, which is then asked to cancel it
+    cancelled = await forward_to_session_worker(session_id, "cancel_source", sessionId=session_id) or cancel_source_request(session_id)
+    if cancelled:
+        logger.info(f"🛑 Cancelled source code wait for session {session_id}")
+    return {"cancelled": cancelled, "sessionId": session_id}
+
 @app.websocket("/vscode")
 async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket endpoint for VSCode extension connection
     """
     await websocket.accept()
-    connection_id = str(uuid.uuid4())
-    vscode_connections[connection_id] = websocket
+    connection = vscode_registry.add(websocket)
+    connection_id = connection.id
     logger.info(f"VSCode extension connected: {connection_id}")
     
     try:
         while True:
             data = await websocket.receive_text()
-            logger.info(f"Received WebSocket message: {data}")
+            vscode_registry.touch(connection)
+            logger.info(f"Received WebSocket message ({len(data)} chars)")
             
             try:
                 message = json.loads(data)
                 
-                if message.get("type") == "source_response":
-                    session_id = message.get("sessionId")
-                    logger.info(f"📨 Received source_response for session {session_id}")
-                    if session_id in active_sessions:
-                        file_path = message.get("filePath")
-                        content = message.get("content")
-                        
-                        if file_path is None and content is None:
-                            logger.info(f"� User cancelled file selection for session {session_id}")
-                        else:
-                            logger.info(f"�📄 Source code details - File: {file_path}, Content length: {len(content) if content else 0}")
-                        
-                        # Store in session
-                        active_sessions[session_id]["source_code"] = {
-                            "filePath": file_path,
-                            "content": content
-                        }
-                        
-                        if file_path is not None and content is not None:
-                            logger.info(f"✅ Stored source code for session {session_id}: {file_path}")
-                        else:
-                            logger.info(f"❌ No source code for session {session_id} (user cancelled or no file selected)")
-                    else:
-                        logger.warning(f"❌ Session {session_id} not found in active_sessions")
+                if message.get("type") == "register":
+                    vscode_registry.register(connection, message)
+                elif message.get("type") == "focus":
+                    vscode_registry.set_focus(connection, message.get("focused"))
+                elif message.get("type") in ("source_request_ack", "source_request_declined", "source_response"):
+                    # In a multi-worker deployment the request may be waiting on another worker
+                    if not await forward_to_session_worker(message.get("sessionId"), "vscode_message", connectionId=connection_id, message=message):
+                        await handle_vscode_message(connection, message)
                 elif message.get("type") == "ping":
                     # Respond to ping messages
                     await websocket.send_text(json.dumps({"type": "pong"}))
+                elif message.get("type") == "pong":
+                    # Answer to the heartbeat, last_seen is already updated
+                    pass
                     
             except json.JSONDecodeError:
                 logger.error(f"Invalid JSON received: {data}")
@@ -235,19 +625,65 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"WebSocket error for connection {connection_id}: {str(e)}")
     finally:
         # Clean up connection
-        if connection_id in vscode_connections:
-            del vscode_connections[connection_id]
+        vscode_registry.remove(connection_id)
         logger.info(f"VSCode extension connection cleaned up: {connection_id}")
 
-async def generate_suggestions(violations, source_code = None):
+async def handle_vscode_message(connection, message):
+    """
+    Handle a VS Code answer to request_source: acknowledgement, decline or
+    source_response. connection may be held by another worker.
+    """
+    if message.get("type") in ("source_request_ack", "source_request_declined"):
+        acknowledge_source_request(message.get("sessionId"), message.get("type") == "source_request_ack")
+        return
+    
+    session_id = message.get("sessionId")
+    logger.info(f"📨 Received source_response for session {session_id}")
+    if not await session_store.exists(session_id):
+        logger.warning(f"❌ Session {session_id} not found in session store")
+        return
+    
+    file_path = message.get("filePath")
+    content = None
+    digest = None
+    
+    if file_path is None:
+        logger.info(f"🚫 User cancelled file selection for session {session_id}")
+    else:
+        content, digest = await source_cache.resolve(message)
+        if content is None:
+            # The referenced version is not cached (anymore), ask for the whole file
+            if connection is not None:
+                await vscode_registry.send(connection, {
+                    "type": "request_source_content",
+                    "sessionId": session_id,
+                    "filePath": file_path
+                })
+            return
+        logger.info(f"📄 Source code details - File: {file_path}, Content length: {len(content)}")
+    
+    # Store in session and resolve the waiting request
+    await store_source_code(session_id, file_path, content, digest)
+    
+    if file_path is not None and content is not None:
+        logger.info(f"✅ Stored source code for session {session_id}: {file_path}")
+    else:
+        logger.info(f"❌ No source code for session {session_id} (user cancelled or no file selected)")
+
+async def generate_suggestions(violations, source_code = None, caption_tasks = None):
     """
     Generate AI suggestions using Gemini API (single call for all violations)
     Special handling for image-alt violations using image captioning model
+    
+    Args:
+        caption_tasks: Captions of the image-alt nodes already started by
+                       prefetch_image_captions (optional)
     """
     try:
         logger.info(f"Processing {len(violations)} violations in generate_suggestions")
         
         suggestions = []
+        image_nodes = []
         regular_violations = []
         
         # Process each violation
@@ -256,47 +692,15 @@ async def generate_suggestions(violations, source_code = None):
             
             if violation.id == "image-alt":
                 logger.info(f"Found image-alt violation with {len(violation.nodes)} nodes")
-                for node in violation.nodes:
-                    try:
-                        img_src = extract_image_src_from_html(node.html)
-                        
-                        if img_src:
-                            base_url = None
-                            if source_code and source_code.get("url"):
-                                base_url = source_code.get("url")
-                            
-                            caption = generate_caption(img_src, base_url)
-                            
-                            tech_context = get_tech_context(source_code)
-                            
-                            if "react" in tech_context.lower() or "jsx" in tech_context.lower():
-                                code_snippet = f'<img src="{img_src}" alt="{caption}" />'
-                            else:
-                                code_snippet = f'<img src="{img_src}" alt="{caption}">'
-                            
-                            suggestions.append({
-                                "violationId": violation.id,
-                                "fixDescription": f"Add descriptive alt text to image: '{caption}'",
-                                "codeSnippet": code_snippet
-                            })
-                        else:
-                            suggestions.append({
-                                "violationId": violation.id,
-                                "fixDescription": "Add descriptive alt text to image",
-                                "codeSnippet": '<img src="..." alt="Describe the image content here">'
-                            })
-                    except Exception as e:
-                        logger.error(f"Error processing image-alt violation: {e}")
-                        suggestions.append({
-                            "violationId": violation.id,
-                            "fixDescription": "Add descriptive alt text to image",
-                            "codeSnippet": '<img src="..." alt="Describe the image content here">'
-                        })
+                image_nodes.extend((violation, node) for node in violation.nodes)
             else:
                 regular_violations.append(violation)
         
+        if image_nodes:
+            suggestions.extend(await generate_image_alt_suggestions(image_nodes, source_code, caption_tasks))
+        
         if regular_violations:
-            regular_suggestions = await generate_regular_suggestions(regular_violations, source_code)
+            regular_suggestions = await generate_cached_suggestions(regular_violations, source_code)
             if isinstance(regular_suggestions, dict) and "suggestions" in regular_suggestions:
                 suggestions.extend(regular_suggestions["suggestions"])
             
@@ -306,6 +710,184 @@ async def generate_suggestions(violations, source_code = None):
         logger.error(f"Error in generate_suggestions: {e}")
         return {"error": f"An error occurred: {e}"}
 
+async def caption_image_data(image_data, img_src):
+    """Caption image bytes, reusing the caption of identical content"""
+    content_hash = caption_cache.content_hash(image_data)
+    caption = await caption_cache.get_caption(content_hash)
+    if caption is None:
+        caption = await caption_service.caption(img_src, None, image_data)
+        if not is_fallback_caption(caption):
+            caption_cache.set_caption(content_hash, caption)
+    return content_hash, caption
+
+async def caption_remote_image(url, img_src):
+    """
+    Caption a remote image through the URL and content caches. A fresh URL entry
+    skips the network, a stale one is revalidated with its ETag/Last-Modified.
+    """
+    entry = await caption_cache.get_url(url)
+    fetched = None
+    if entry:
+        if caption_cache.is_fresh(entry):
+            caption = await caption_cache.get_caption(entry["hash"])
+            if caption is not None:
+                return caption
+        
+        fetched = await image_fetcher.fetch(url, entry.get("etag"), entry.get("lastModified"))
+        if fetched.not_modified:
+            caption = await caption_cache.get_caption(entry["hash"])
+            if caption is not None:
+                caption_cache.set_url(url, entry["hash"], fetched.etag, fetched.last_modified)
+                return caption
+            fetched = None
+    
+    if fetched is None:
+        fetched = await image_fetcher.fetch(url)
+    content_hash, caption = await caption_image_data(fetched.data, img_src)
+    caption_cache.set_url(url, content_hash, fetched.etag, fetched.last_modified)
+    return caption
+
+async def generate_image_alt_suggestions(image_nodes, source_code = None, caption_tasks = None):
+    """
+    Caption all image-alt nodes of a request through the shared caption service
+    
+    Args:
+        image_nodes: List of (violation, node) pairs
+        source_code: Source code dict from VS Code (optional)
+        caption_tasks: Captions already started by prefetch_image_captions (optional)
+    
+    Returns:
+        list: One suggestion per node, in the same order
+    """
+    suggestions = [None] * len(image_nodes)
+    async for index, suggestion in stream_image_alt_suggestions(image_nodes, source_code, caption_tasks):
+        suggestions[index] = suggestion
+    return suggestions
+
+async def prefetch_image_captions(image_nodes, base_url = None):
+    """
+    Start downloading and captioning image-alt nodes. Needs no source code, so
+    it can run while the developer is still picking the file in VS Code.
+    Decorative images are skipped; a local fixer handles them.
+    
+    Returns:
+        list: One task per node resolving to (img_src, caption), or None for
+              nodes that are not captioned
+    """
+    async def caption_source(img_src, url):
+        try:
+            if url:
+                return await caption_remote_image(url, img_src)
+            if img_src.startswith("data:image"):
+                _, caption = await caption_image_data(decode_data_uri(img_src), img_src)
+                return caption
+            return await caption_service.caption(img_src, base_url)
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout generating caption for {img_src}")
+            return "Descriptive alt text needed (timeout)"
+        except Exception as e:
+            return caption_for_load_error(url or img_src, e)
+    
+    async def caption_node(img_src):
+        url = resolve_image_url(img_src, base_url)
+        try:
+            # Each distinct image is downloaded and captioned once, also across concurrent requests
+            return img_src, await caption_flights.run(url or img_src, lambda: caption_source(img_src, url))
+        except Exception as e:
+            logger.error(f"Error processing image-alt violation: {e}")
+            return None, None
+    
+    tasks = []
+    for _, node in image_nodes:
+        img_src = None if is_decorative_image(node.html) else extract_image_src_from_html(node.html)
+        tasks.append(asyncio.ensure_future(caption_node(img_src)) if img_src else None)
+    return tasks
+
+async def stream_image_alt_suggestions(image_nodes, source_code = None, caption_tasks = None):
+    """
+    Caption image-alt nodes concurrently and yield (index, suggestion) pairs
+    as soon as each caption is ready. index is the node's position in image_nodes.
+    
+    Args:
+        caption_tasks: Result of prefetch_image_captions for image_nodes, if
+                       captioning was started before the source code arrived
+    """
+    if caption_tasks is None:
+        base_url = source_code.get("url") if source_code else None
+        caption_tasks = await prefetch_image_captions(image_nodes, base_url)
+    
+    tech_context = get_tech_context(source_code)
+    
+    # Decorative images get an empty alt without being captioned
+    source_content, jsx = local_fix_context(source_code)
+    
+    async def caption_node(index, task):
+        # wait() instead of await: a caption cancelled elsewhere must not end this stream
+        await asyncio.wait([task])
+        if task.cancelled():
+            return index, None, None
+        img_src, caption = task.result()
+        return index, img_src, caption
+    
+    node_tasks = []
+    for index, ((violation, node), task) in enumerate(zip(image_nodes, caption_tasks)):
+        suggestion = fix_locally(violation, node, source_content, jsx)
+        if suggestion is not None:
+            yield index, suggestion
+        elif task is None:
+            yield index, make_image_alt_suggestion(violation, None, None, tech_context)
+        else:
+            node_tasks.append(asyncio.ensure_future(caption_node(index, task)))
+    
+    try:
+        for next_done in asyncio.as_completed(node_tasks):
+            index, img_src, caption = await next_done
+            violation, _ = image_nodes[index]
+            yield index, make_image_alt_suggestion(violation, img_src, caption, tech_context)
+    finally:
+        # The consumer may stop early, e.g. when a streaming client disconnects
+        for task in [*node_tasks, *caption_tasks]:
+            if task is not None:
+                task.cancel()
+
+def split_image_nodes(violations):
+    """Split violations into image-alt (violation, node) pairs and the other violations"""
+    image_nodes = []
+    regular_violations = []
+    for violation in violations:
+        if violation.id == "image-alt":
+            image_nodes.extend((violation, node) for node in violation.nodes)
+        else:
+            regular_violations.append(violation)
+    return image_nodes, regular_violations
+
+def make_image_alt_suggestion(violation, img_src, caption, tech_context):
+    """Build the suggestion for one image-alt node from its caption"""
+    if img_src:
+        if "react" in tech_context.lower() or "jsx" in tech_context.lower():
+            code_snippet = f'<img src="{img_src}" alt="{caption}" />'
+        else:
+            code_snippet = f'<img src="{img_src}" alt="{caption}">'
+        
+        return {
+            "violationId": violation.id,
+            "fixDescription": f"Add descriptive alt text to image: '{caption}'",
+            "codeSnippet": code_snippet
+        }
+    return {
+        "violationId": violation.id,
+        "fixDescription": "Add descriptive alt text to image",
+        "codeSnippet": '<img src="..." alt="Describe the image content here">'
+    }
+
+def is_react_source(source_code):
+    return bool(source_code) and ("react" in str(source_code).lower() or "jsx" in str(source_code).lower() or ".tsx" in str(source_code.get('filePath', '')))
+
+def local_fix_context(source_code):
+    """(source content, jsx) arguments for fix_locally"""
+    content = source_code.get("content") if source_code else None
+    return content, is_react_source(source_code)
+
 def get_tech_context(source_code):
     """Determine the technology context from source code"""
     if source_code and source_code.get("content"):
@@ -367,26 +949,359 @@ def format_code_snippet(code: str) -> str:
     
     return '\n'.join(indented_lines)
 
-async def generate_regular_suggestions(violations, source_code = None):
+def split_violations_into_batches(violations, max_nodes=LLM_BATCH_MAX_NODES):
     """
-    Generate AI suggestions for non-image-alt violations using Gemini API
+    Split violations into prompt-sized batches of at most max_nodes elements
+    
+    Small violations are packed together, violations with more nodes than
+    max_nodes are split into several copies holding consecutive node ranges.
+    Batches keep the original violation and node order.
     """
-    try:
-        context = "You are an accessibility expert who will provide suggestions to developers to improve a website's accessibility.\n\n"
-        
-        if source_code and source_code.get("content"):
-            # Using .get() is safer than ['key'] as it returns None if the key doesn't exist
-            file_path = source_code.get('filePath', 'Unknown file') 
-            content = source_code.get('content', '')
-            context += f"SOURCE CODE CONTEXT:\nFile: {file_path}\n```\n{content[:2000]}...\n```\n\n"
-        
-        context += "ACCESSIBILITY VIOLATIONS:\n"
-        
-        violations_text = ""
-        element_count = 0
+    batches = []
+    current_batch = []
+    current_nodes = 0
+    
+    for violation in violations:
+        node_count = len(violation.nodes)
+        for start in range(0, max(node_count, 1), max_nodes):
+            chunk = violation.nodes[start:start + max_nodes]
+            if current_batch and current_nodes + len(chunk) > max_nodes:
+                batches.append(current_batch)
+                current_batch = []
+                current_nodes = 0
+            current_batch.append(violation if len(chunk) == node_count else violation.copy(update={"nodes": chunk}))
+            current_nodes += len(chunk)
+    
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+def iter_violation_nodes(violations):
+    """Yield (violation, node) pairs in prompt order"""
+    for violation in violations:
+        for node in violation.nodes:
+            yield violation, node
+
+def assign_suggestions_to_nodes(violations, suggestions):
+    """
+    Map suggestions back to violation nodes the same way the browser extension
+    does: the n-th suggestion for a violation id belongs to the n-th node of
+    that id. Returns one suggestion (or None) per node, in prompt order.
+    """
+    by_violation = {}
+    for suggestion in suggestions:
+        by_violation.setdefault(suggestion["violationId"], []).append(suggestion)
+    
+    assigned = []
+    counters = {}
+    for violation, node in iter_violation_nodes(violations):
+        index = counters.get(violation.id, 0)
+        matching = by_violation.get(violation.id, [])
+        assigned.append(matching[index] if index < len(matching) else None)
+        counters[violation.id] = index + 1
+    return assigned
+
+def normalize_node_html(html):
+    """Whitespace-insensitive form of a node's HTML used to find duplicates"""
+    html = re.sub(r">\s+", ">", re.sub(r"\s+<", "<", html))
+    return re.sub(r"\s+", " ", html).strip()
+
+def dedupe_violation_nodes(violations):
+    """
+    Group nodes with the same rule id and normalized HTML so that each unique
+    problem is prompted once, e.g. 30 identical nav buttons failing color-contrast
+    
+    Returns:
+        tuple: (unique_violations, groups). unique_violations keep the first
+               node of every group, in order. groups[i] lists the positions in
+               iter_violation_nodes(violations) of the nodes sharing the i-th
+               unique node.
+    """
+    unique_violations = []
+    groups = []
+    group_by_key = {}
+    position = 0
+    
+    for violation in violations:
+        unique_nodes = []
+        for node in violation.nodes:
+            key = (violation.id, normalize_node_html(node.html))
+            if key in group_by_key:
+                groups[group_by_key[key]].append(position)
+            else:
+                group_by_key[key] = len(groups)
+                groups.append([position])
+                unique_nodes.append(node)
+            position += 1
+        if unique_nodes:
+            unique_violations.append(violation if len(unique_nodes) == len(violation.nodes) else violation.copy(update={"nodes": unique_nodes}))
+    
+    if len(groups) < position:
+        logger.info(f"Deduplicated {position} elements into {len(groups)} unique groups")
+    return unique_violations, groups
+
+async def generate_batched_suggestions(violations, source_code = None):
+    """
+    Run generate_regular_suggestions concurrently over bounded batches and
+    merge the results back in violation order
+    
+    Returns:
+        list: One (suggestion, from_llm) pair per violation node, in order.
+              from_llm is False for fallback suggestions.
+    """
+    batches = split_violations_into_batches(violations)
+    if len(batches) > 1:
+        logger.info(f"Split {sum(len(v.nodes) for v in violations)} elements into {len(batches)} concurrent LLM batches")
+    
+    results = await asyncio.gather(*[
+        generate_regular_suggestions(batch, source_code) for batch in batches
+    ])
+    
+    node_results = []
+    for batch, result in zip(batches, results):
+        is_fallback = result.get("fallback", False)
+        if result.get("indexed"):
+            # Compact responses already name the element each suggestion belongs to
+            assigned = result["suggestions"]
+        else:
+            assigned = assign_suggestions_to_nodes(batch, result.get("suggestions", []))
+        for (violation, node), suggestion in zip(iter_violation_nodes(batch), assigned):
+            if suggestion is None:
+                node_results.append((make_fallback_suggestion(violation), False))
+            else:
+                node_results.append((suggestion, not is_fallback))
+    return node_results
+
+def make_suggestion_cache_key(violation_id, node, tech_context):
+    """Content hash identifying the suggestion for one violation node"""
+    key_data = json.dumps([
+        violation_id,
+        node.html,
+        node.target,
+        tech_context,
+        MODEL,
+        LLM_RESPONSE_FORMAT,
+        SUGGESTION_CACHE_VERSION,
+        # Editing the static instructions must not serve suggestions made with the old ones
+        PROMPT_PREFIX_VERSION
+    ])
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+async def generate_cached_suggestions(violations, source_code = None):
+    """
+    Serve violation nodes from the suggestion cache and only send the misses
+    to the LLM. Nodes a local fixer can handle skip both. Suggestions keep
+    the original node order.
+    """
+    tech_context = get_tech_context(source_code)
+    source_content, jsx = local_fix_context(source_code)
+    
+    node_suggestions = []
+    cache_keys = []
+    miss_violations = []
+    for violation in violations:
+        miss_nodes = []
+        for node in violation.nodes:
+            key = make_suggestion_cache_key(violation.id, node, tech_context)
+            cached = fix_locally(violation, node, source_content, jsx) or await suggestion_cache.aget(key)
+            cache_keys.append(key)
+            node_suggestions.append(cached)
+            if cached is None:
+                miss_nodes.append(node)
+        if miss_nodes:
+            miss_violations.append(violation.copy(update={"nodes": miss_nodes}))
+    
+    hit_count = sum(1 for suggestion in node_suggestions if suggestion is not None)
+    logger.info(f"Suggestion cache and local fixes: {hit_count} hits, {len(node_suggestions) - hit_count} misses")
+    
+    if miss_violations:
+        # Identical nodes are prompted once and share the generated suggestion
+        unique_violations, groups = dedupe_violation_nodes(miss_violations)
+        miss_results = [None] * sum(len(group) for group in groups)
+        for group, result in zip(groups, await generate_batched_suggestions(unique_violations, source_code)):
+            for position in group:
+                miss_results[position] = result
         
-        for violation in violations:
-            violations_text += f"""
+        generated = iter(miss_results)
+        for index, cached in enumerate(node_suggestions):
+            if cached is None:
+                suggestion, from_llm = next(generated)
+                node_suggestions[index] = suggestion
+                if from_llm:
+                    suggestion_cache.set(cache_keys[index], suggestion)
+    
+    return {"suggestions": node_suggestions}
+
+async def merge_streams(*streams):
+    """Yield the items of several async iterators as soon as any of them produces one"""
+    queue = asyncio.Queue()
+    finished = object()
+    
+    async def drain(stream):
+        try:
+            async for item in stream:
+                queue.put_nowait(item)
+        except Exception as e:
+            logger.error(f"Error in suggestion stream: {e}")
+        finally:
+            queue.put_nowait(finished)
+    
+    tasks = [asyncio.ensure_future(drain(stream)) for stream in streams]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is finished:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def stream_batch_suggestions(violations, source_code = None):
+    """
+    Stream one prompt-sized batch through Gemini and yield (node_index, suggestion,
+    from_llm) as soon as each suggestion is parsed. Compact fixes name their
+    element; legacy suggestions are assigned like assign_suggestions_to_nodes:
+    the n-th suggestion for a violation id goes to the n-th node of that id.
+    Nodes left without one get a fallback at the end.
+    """
+    nodes = list(iter_violation_nodes(violations))
+    open_nodes = {}
+    for index, (violation, _) in enumerate(nodes):
+        open_nodes.setdefault(violation.id, deque()).append(index)
+    
+    config = None
+    try:
+        contents = build_suggestion_contents(violations, source_code)
+        config = suggestion_config(source_code)
+        jsx = is_react_source(source_code)
+        parser = SuggestionStreamParser()
+        async for chunk in generate_content_stream(
+            model=MODEL,
+            contents=contents,
+            config=config,
+        ):
+            for item in parser.feed(chunk.text or ""):
+                if LLM_RESPONSE_FORMAT == "compact":
+                    expanded = expand_compact_fix(item, nodes, jsx)
+                    suggestion = normalize_suggestion(expanded[1]) if expanded else None
+                    waiting = open_nodes.get(nodes[expanded[0]][0].id) if expanded else None
+                    if suggestion is not None and expanded[0] in waiting:
+                        waiting.remove(expanded[0])
+                        yield expanded[0], suggestion, True
+                    continue
+                suggestion = normalize_suggestion(item)
+                if suggestion is None:
+                    continue
+                waiting = open_nodes.get(suggestion["violationId"])
+                if waiting:
+                    yield waiting.popleft(), suggestion, True
+    except Exception as e:
+        logger.error(f"Error streaming suggestions: {str(e)}")
+        if config is not None:
+            prompt_prefixes.discard(config, e)
+    
+    for waiting in open_nodes.values():
+        for index in waiting:
+            yield index, make_fallback_suggestion(nodes[index][0]), False
+
+async def stream_cached_suggestions(violations, source_code = None):
+    """
+    Streaming counterpart of generate_cached_suggestions. Yields (node_index,
+    suggestion) pairs: local fixes and cache hits immediately, misses as Gemini
+    produces them. node_index is the node's position in iter_violation_nodes(violations).
+    """
+    tech_context = get_tech_context(source_code)
+    source_content, jsx = local_fix_context(source_code)
+    
+    miss_indexes = []
+    miss_violations = []
+    index = 0
+    for violation in violations:
+        miss_nodes = []
+        for node in violation.nodes:
+            key = make_suggestion_cache_key(violation.id, node, tech_context)
+            cached = fix_locally(violation, node, source_content, jsx) or await suggestion_cache.aget(key)
+            if cached is None:
+                miss_indexes.append((index, key))
+                miss_nodes.append(node)
+            else:
+                yield index, cached
+            index += 1
+        if miss_nodes:
+            miss_violations.append(violation.copy(update={"nodes": miss_nodes}))
+    
+    logger.info(f"Suggestion cache and local fixes: {index - len(miss_indexes)} hits, {len(miss_indexes)} misses")
+    if not miss_violations:
+        return
+    
+    async def stream_batch(batch, offset):
+        async for batch_index, suggestion, from_llm in stream_batch_suggestions(batch, source_code):
+            yield offset + batch_index, suggestion, from_llm
+    
+    # Identical nodes are prompted once and share the generated suggestion
+    unique_violations, groups = dedupe_violation_nodes(miss_violations)
+    
+    batch_streams = []
+    offset = 0
+    for batch in split_violations_into_batches(unique_violations):
+        batch_streams.append(stream_batch(batch, offset))
+        offset += sum(len(violation.nodes) for violation in batch)
+    
+    async for unique_index, suggestion, from_llm in merge_streams(*batch_streams):
+        for position in groups[unique_index]:
+            index, key = miss_indexes[position]
+            if from_llm:
+                suggestion_cache.set(key, suggestion)
+            yield index, suggestion
+
+async def stream_suggestions(violations, source_code = None, caption_tasks = None):
+    """
+    Streaming counterpart of generate_suggestions. Yields (index, suggestion)
+    pairs as soon as each suggestion is ready, where index is the suggestion's
+    position in the generate_suggestions result: image-alt nodes first, then
+    the nodes of the other violations.
+    """
+    image_nodes, regular_violations = split_image_nodes(violations)
+    
+    async def offset_stream(stream, offset):
+        async for index, suggestion in stream:
+            yield offset + index, suggestion
+    
+    streams = []
+    if image_nodes:
+        streams.append(stream_image_alt_suggestions(image_nodes, source_code, caption_tasks))
+    if regular_violations:
+        streams.append(offset_stream(stream_cached_suggestions(regular_violations, source_code), len(image_nodes)))
+    
+    async for item in merge_streams(*streams):
+        yield item
+
+def build_suggestion_contents(violations, source_code = None):
+    """
+    Build the Gemini request contents for a batch of non-image-alt violations:
+    the source excerpt and the numbered elements. The static instructions are
+    sent separately, see suggestion_config.
+    """
+    context = ""
+    
+    if source_code and source_code.get("content"):
+        # Using .get() is safer than ['key'] as it returns None if the key doesn't exist
+        file_path = source_code.get('filePath', 'Unknown file') 
+        content = source_code.get('content', '')
+        # Only the lines around the elements to fix, numbered as in the file
+        excerpt = extract_source_context(content, [node.html for _, node in iter_violation_nodes(violations)])
+        context += f"SOURCE CODE CONTEXT (excerpts):\nFile: {file_path}\n```\n{excerpt}\n```\n\n"
+    
+    context += "ACCESSIBILITY VIOLATIONS:\n"
+    
+    violations_text = ""
+    element_count = 0
+    
+    for violation in violations:
+        violations_text += f"""
 =====================================
 VIOLATION: {violation.id}
 Description: {violation.description}
@@ -395,148 +1310,49 @@ Help: {violation.help}
 
 ELEMENTS TO FIX:
 """
-            for i, node in enumerate(violation.nodes, 1):
-                element_count += 1
-                violations_text += f"""
+        for i, node in enumerate(violation.nodes, 1):
+            element_count += 1
+            violations_text += f"""
 [ELEMENT #{element_count}] - CREATE SPECIFIC FIX FOR THIS ELEMENT:
 - Selector: {node.target}
 - Current HTML: {node.html}
 ⬆️ Fix Element #{element_count} using its exact content above ⬆️
 {'-'*50}
 """
-        
-        tech_context = get_tech_context(source_code)
-        
-        # Determine if this is React code and adjust instructions accordingly
-        is_react = source_code and ("react" in str(source_code).lower() or "jsx" in str(source_code).lower() or ".tsx" in str(source_code.get('filePath', '')))
-
-        if is_react:
-            code_instructions = """
-REACT/JSX SPECIFIC INSTRUCTIONS:
-- Use JSX syntax with camelCase props (onClick, className, etc.)
-- Use style objects: style={{{{ backgroundColor: '#fff', color: '#000' }}}}
-- For images: <img src="..." alt="..." />
-- For buttons: <button onClick={{handleClick}} aria-label="descriptive text">
-- For forms: <label htmlFor="input-id">Label</label><input id="input-id" />
-- Use semantic JSX: <main>, <nav>, <header>, <section>, <aside>
-- Include React event handlers and state references where appropriate
-- Use proper JSX self-closing tags
-"""
-        else:
-            code_instructions = """
-HTML SPECIFIC INSTRUCTIONS:
-- Use standard HTML syntax
-- Use hyphenated attributes (onclick, class, etc.)
-- Use inline styles: style="background-color: #fff; color: #000;"
-- Standard HTML tags and attributes
-"""
+    
+    contents = [
+        {
+            "role": "user",
+            "parts": [{"text": context + violations_text}]
+        }
+    ]
+    return contents
 
-        prompt = context + violations_text + f"""
-TASK: Analyze the provided source code and violations to generate specific, contextual fixes.
-
-{code_instructions}
-
-CRITICAL REQUIREMENTS:
-1. ANALYZE the actual source code provided above AND the specific HTML elements in violations
-2. MODIFY the EXACT HTML code shown in the violation nodes, don't create new generic code
-3. PRESERVE existing variable names, class names, IDs, attributes, text content, and structure
-4. TAKE the actual HTML from violation nodes and APPLY fixes directly to that HTML
-5. PROVIDE the MODIFIED version of the existing HTML, not new code
-6. PRESERVE ALL TEXT CONTENT - do not change button text, headings, or any visible text
-
-VIOLATION-SPECIFIC CODE MODIFICATION:
-- Find the EXACT HTML element from the violation node (look at the "HTML:" field)
-- Apply the accessibility fix to THAT specific element
-- Keep all existing attributes, classes, styles, and TEXT CONTENT unless they conflict with the fix
-- Return the SAME element with SAME text content but with the accessibility issue resolved
-- If fixing a button that says "About", keep it saying "About" - don't change it to "Home"
-
-EXAMPLE PROCESS:
-If violation node shows: <div style="color: #ccc;">Low contrast text</div>
-Then return: <div style="color: #333333;">Low contrast text</div>
-
-If violation node shows: <img src="photo.jpg" class="gallery-image">
-Then return: <img src="photo.jpg" class="gallery-image" alt="Description based on image content">
-
-If violation node shows: <button class="nav-button">About</button>
-Then return: <button class="nav-button" style="color: #000000;">About</button>
-
-If violation node shows: <button onClick={{handleClick}}>🛒</button>
-Then return: <button onClick={{handleClick}} aria-label="Add to cart">🛒</button>
-
-RESPONSE FORMAT - Return ONLY valid JSON with this EXACT structure:
-{{
-  "suggestions": [
-    {{
-      "violationId": "violation-type",
-      "fixDescription": "Brief explanation of what needs to be fixed",
-      "codeSnippet": "Complete HTML/code that fixes the issue"
-    }}
-  ]
-}}
-
-IMPORTANT: Create ONE suggestion for EACH element shown in the violations above.
-If there are 3 button elements with the same violation, create 3 separate suggestions.
-Each suggestion should fix the exact HTML element provided, preserving its unique content.
-
-SPECIFIC FIX GUIDELINES:
-- color-contrast violations: Take existing style attributes and modify color values to meet contrast requirements
-- region violations: Wrap the EXACT HTML content shown in violation with semantic landmarks
-- document-title violations: Add title to existing document structure
-- html-has-lang violations: Add lang attribute to the existing <html> tag shown
-- page-has-heading-one violations: Modify existing heading structure or convert existing element to h1
-- landmark-one-main violations: Wrap existing HTML structure with <main> element
-- label violations: Add labels to the EXACT form elements shown in violations
-- button-name violations: Add aria-label or text content to the EXACT button shown
-- image-alt violations: Add alt attribute to the EXACT img element shown
-
-CONTEXT-AWARE CODE MODIFICATION:
-- Take the HTML from violation.nodes[].html and modify that EXACT code
-- Preserve all existing attributes, classes, IDs unless they conflict with the fix
-- Match the syntax style (HTML vs JSX) used in the violation node
-- Keep existing event handlers, styles, and structure intact
-- Only add or modify what's needed to fix the accessibility issue
-
-CRITICAL RULES:
-1. fixDescription: ONE sentence explaining the fix (no code examples in description)
-2. codeSnippet: ONLY the actual HTML/code needed, using REAL context from source code
-3. NO generic placeholders - use actual content, class names, IDs from source
-4. NO markdown formatting in JSON strings
-5. Return ONLY valid JSON, no other text
-6. Every suggestion MUST have both fixDescription AND codeSnippet
-
-CODE FORMATTING REQUIREMENTS:
-- Format code with proper indentation (2 or 4 spaces)
-- Use line breaks for nested elements
-- Keep attributes readable (one per line for complex elements)
-- Maintain consistent formatting style
-- Ensure code is copy-paste ready for developers
-
-EXAMPLE FORMATTING:
-Instead of: <section><p>Text</p><img src="url"><div class="container"><span>Content</span></div></section>
-Use this format:
-<section>
-    <p>Text</p>
-    <img src="url" 
-         alt="Descriptive text">
-    <div class="container">
-        <span>Content</span>
-    </div>
-</section>
-"""
+def suggestion_config(source_code = None):
+    """
+    Generation config carrying the static instructions for the source's tech
+    context, as cached content when available or as system instruction
+    """
+    key = get_prefix_key(LLM_RESPONSE_FORMAT, is_react_source(source_code))
+    return prompt_prefixes.config_for(key, LLM_CONFIG)
+
+async def generate_regular_suggestions(violations, source_code = None):
+    """
+    Generate AI suggestions for non-image-alt violations using Gemini API
+    """
+    try:
+        contents = build_suggestion_contents(violations, source_code)
+        config = suggestion_config(source_code)
         
-        contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part(text=prompt)]
+        try:
+            response = await generate_content(
+                model=MODEL,
+                contents=contents,
+                config=config,
             )
-        ]
-        
-        response = client.models.generate_content(
-            model=MODEL,
-            contents=contents,
-            config=GEMINI_CONFIG,
-        )
+        except Exception as e:
+            prompt_prefixes.discard(config, e)
+            raise
         
         logger.info(f"Raw AI response: {response.text}")
         
@@ -544,22 +1360,19 @@ Use this format:
             # Try to parse as JSON first
             ai_response = json.loads(response.text.strip())
             
+            if LLM_RESPONSE_FORMAT == "compact" and isinstance(ai_response.get("fixes"), list):
+                indexed = expand_compact_fixes(violations, source_code, ai_response["fixes"])
+                if any(suggestion is not None for suggestion in indexed):
+                    return {"suggestions": indexed, "indexed": True}
+                logger.error("No valid fixes found in compact AI response")
+            
             # Validate the response structure
-            if "suggestions" in ai_response and isinstance(ai_response["suggestions"], list):
+            elif "suggestions" in ai_response and isinstance(ai_response["suggestions"], list):
                 valid_suggestions = []
                 for suggestion in ai_response["suggestions"]:
-                    # Check if suggestion has the required fields
-                    if ("violationId" in suggestion and 
-                        "fixDescription" in suggestion and 
-                        "codeSnippet" in suggestion):
-                        formatted_code = format_code_snippet(suggestion["codeSnippet"])
-                        valid_suggestions.append({
-                            "violationId": suggestion["violationId"],
-                            "fixDescription": suggestion["fixDescription"].strip(),
-                            "codeSnippet": formatted_code
-                        })
-                    else:
-                        logger.warning(f"Invalid suggestion format: {suggestion}")
+                    normalized = normalize_suggestion(suggestion)
+                    if normalized is not None:
+                        valid_suggestions.append(normalized)
                 
                 if valid_suggestions:
                     return {"suggestions": valid_suggestions}
@@ -582,7 +1395,7 @@ Use this format:
                 "codeSnippet": get_fallback_code(violation.id)
             })
         
-        return {"suggestions": fallback_suggestions}
+        return {"suggestions": fallback_suggestions, "fallback": True}
 
     except Exception as e:
         logger.error(f"Error generating suggestions: {str(e)}")
@@ -594,7 +1407,50 @@ Use this format:
                 "fixDescription": f"Fix the {violation.id} accessibility issue",
                 "codeSnippet": get_fallback_code(violation.id)
             })
-        return {"suggestions": fallback_suggestions}
+        return {"suggestions": fallback_suggestions, "fallback": True}
+
+def normalize_suggestion(suggestion):
+    """Validate one suggestion from the AI response and format its code snippet"""
+    # Check if suggestion has the required fields
+    if (isinstance(suggestion, dict) and
+        "violationId" in suggestion and 
+        "fixDescription" in suggestion and 
+        "codeSnippet" in suggestion):
+        return {
+            "violationId": suggestion["violationId"],
+            "fixDescription": suggestion["fixDescription"].strip(),
+            "codeSnippet": format_code_snippet(suggestion["codeSnippet"])
+        }
+    logger.warning(f"Invalid suggestion format: {suggestion}")
+    return None
+
+def expand_compact_fixes(violations, source_code, fixes):
+    """
+    Rebuild suggestions from the "fixes" of a compact response
+
+    Returns:
+        list: One suggestion or None per violation node, in prompt order
+    """
+    nodes = list(iter_violation_nodes(violations))
+    jsx = is_react_source(source_code)
+    indexed = [None] * len(nodes)
+    for fix in fixes:
+        expanded = expand_compact_fix(fix, nodes, jsx)
+        if expanded is None:
+            logger.warning(f"Invalid compact fix: {fix}")
+            continue
+        index, suggestion = expanded
+        if indexed[index] is None:
+            indexed[index] = normalize_suggestion(suggestion)
+    return indexed
+
+def make_fallback_suggestion(violation):
+    """Generic suggestion for a node the LLM did not answer"""
+    return {
+        "violationId": violation.id,
+        "fixDescription": f"Fix the {violation.id} accessibility issue: {violation.help}",
+        "codeSnippet": get_fallback_code(violation.id)
+    }
 
 def get_fallback_code(violation_id):
     """Generate fallback code snippets for violations"""
@@ -661,17 +1517,17 @@ def extract_code_from_text(text, violation):
 @app.get("/test-vscode-connection")
 async def test_vscode_connection():
     """Test endpoint to trigger VS Code file picker"""
-    if not vscode_connections:
+    if not len(vscode_registry):
         return {"error": "No VS Code extensions connected", "connected": False}
     
     # Create a test session and send a source request
     session_id = str(uuid.uuid4())
-    active_sessions[session_id] = {
+    await session_store.create(session_id, {
         "violations": [],
         "url": "http://test-page.com",
-        "timestamp": datetime.now(),
+        "timestamp": datetime.now().isoformat(),
         "source_code": None
-    }
+    })
     
     # Create a test violation to trigger file picker
     test_violation = {
@@ -687,48 +1543,111 @@ async def test_vscode_connection():
         "type": "request_source",
         "sessionId": session_id,
         "violations": [test_violation],
-        "url": "http://test-page.com"
+        "url": "http://test-page.com",
+        "cachedFiles": source_cache.known_files()
     }
     
-    # Send to all connected VSCode instances
-    sent_count = 0
-    dead_connections = []
-    for connection_id, ws in vscode_connections.items():
-        try:
-            await ws.send_text(json.dumps(source_request))
-            sent_count += 1
-            logger.info(f"Sent test source request to VS Code connection {connection_id}")
-        except Exception as e:
-            logger.error(f"Failed to send to connection {connection_id}: {e}")
-            dead_connections.append(connection_id)
-    
-    # Remove dead connections
-    for connection_id in dead_connections:
-        del vscode_connections[connection_id]
+    # Send to the best matching VS Code window only
+    sent_to = None
+    for connection in vscode_registry.rank(source_request["url"]):
+        if await vscode_registry.send(connection, source_request):
+            sent_to = connection.id
+            logger.info(f"Sent test source request to VS Code connection {connection.id}")
+            break
     
     return {
         "message": "Test source request sent to VS Code",
-        "connected": True,
-        "connections_sent": sent_count,
+        "connected": sent_to is not None,
+        "connections_sent": 1 if sent_to else 0,
+        "connection_id": sent_to,
         "session_id": session_id,
         "instructions": "Check VS Code for file picker dialog"
     }
 
+@app.on_event("startup")
+async def mark_ready():
+    """Start session sweeping, the VS Code heartbeat and the job workers and report startup time; models are not loaded here to keep restarts fast"""
+    global SERVER_READY, session_sweeper, vscode_heartbeat, cluster_listener
+    if cluster_bus is not None:
+        if SESSION_STORE_BACKEND == "memory":
+            logger.warning("⚠️  Several workers with the memory session store: sessions are only visible to the worker that created them")
+        vscode_registry.attach_bus(cluster_bus)
+        job_queue.attach_bus(cluster_bus)
+        for kind in ("vscode_message", "source_code", "cancel_source"):
+            cluster_bus.on(kind, handle_cluster_message)
+        cluster_listener = asyncio.create_task(cluster_bus.run())
+    session_sweeper = asyncio.create_task(session_store.run_sweeper())
+    vscode_heartbeat = asyncio.create_task(vscode_registry.run_heartbeat())
+    job_queue.start(run_analysis_job)
+    SERVER_READY = True
+    logger.info(f"🚀 Server ready in {time.perf_counter() - STARTUP_STARTED:.2f}s (models load on first use or via /warmup)")
+
+@app.post("/warmup")
+async def warmup():
+    """Load the Gemini client and the caption model in every caption worker ahead of the first request"""
+    started = time.perf_counter()
+    get_client()
+    llm_seconds = time.perf_counter() - started
+    
+    try:
+        workers_loaded = await caption_service.warmup()
+    except Exception as e:
+        logger.error(f"Error warming up caption workers: {e}")
+        raise HTTPException(status_code=500, detail=f"Caption model warmup failed: {e}")
+    
+    total_seconds = time.perf_counter() - started
+    logger.info(f"🔥 Warmup finished in {total_seconds:.2f}s ({workers_loaded} caption workers loaded)")
+    return {
+        "status": "warm",
+        "caption_workers_loaded": workers_loaded,
+        "llm_client_seconds": round(llm_seconds, 3),
+        "total_seconds": round(total_seconds, 3)
+    }
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Stop background tasks, the caption worker processes and pooled image connections"""
+    for task in (session_sweeper, vscode_heartbeat, cluster_listener):
+        if task is not None:
+            task.cancel()
+    if cluster_bus is not None:
+        cluster_bus.close()
+    job_queue.stop()
+    caption_service.shutdown()
+    await image_fetcher.close()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "active_sessions": len(active_sessions),
-        "vscode_connections": len(vscode_connections),
-        "vscode_requests_disabled": DISABLE_VSCODE_REQUESTS
+        "ready": SERVER_READY,
+        "warm": caption_service.model_loaded and get_llm_stats()["client_ready"],
+        "active_sessions": len(session_store),
+        "session_store": session_store.stats(),
+        "vscode_connections": len(vscode_registry),
+        "vscode": vscode_registry.stats(),
+        "vscode_requests_disabled": vscode_requests_disabled(),
+        "llm": get_llm_stats(),
+        "prompt_cache": prompt_prefixes.stats(),
+        "suggestion_cache": suggestion_cache.stats(),
+        "captioning": caption_service.stats(),
+        "image_fetching": image_fetcher.stats(),
+        "caption_cache": caption_cache.stats(),
+        "source_cache": source_cache.stats(),
+        "local_fixes": get_local_fix_stats(),
+        "coalescing": analysis_flights.stats(),
+        "jobs": job_queue.stats(),
+        "cluster": cluster_bus.stats() if cluster_bus else None
     }
 
 @app.post("/toggle-vscode-requests")
 async def toggle_vscode_requests():
     """Toggle VS Code source code requests on/off to prevent repeated file picker dialogs"""
     global DISABLE_VSCODE_REQUESTS
-    DISABLE_VSCODE_REQUESTS = not DISABLE_VSCODE_REQUESTS
+    DISABLE_VSCODE_REQUESTS = not vscode_requests_disabled()
+    if cluster_bus is not None:
+        cluster_bus.set_flag("disable_vscode_requests", DISABLE_VSCODE_REQUESTS)
     status = "disabled" if DISABLE_VSCODE_REQUESTS else "enabled"
     return {"message": f"VS Code source code requests {status}", "disabled": DISABLE_VSCODE_REQUESTS}
 
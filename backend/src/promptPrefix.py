@@ -0,0 +1,273 @@
+"""
+Static prompt prefixes registered once with Gemini
+
+Most of the suggestion prompt (the role, the requirements, the response
+format and the HTML or React instructions) is the same on every call; only
+the source excerpt and the violations change. The static part is kept here
+as one versioned prefix per response format and tech context, sent as the
+system instruction, and the request contents carry only the dynamic tail.
+
+The first call for a prefix registers it as Gemini cached content in the
+background; once that is done calls reference the cache by name instead of
+sending the instructions again. Prefixes below the model's minimum cache
+size are never registered. While the cache is being created, when caching
+fails or when PROMPT_CACHE_ENABLED is off, the prefix goes out as a plain
+system instruction, which Gemini's implicit prefix caching can still reuse.
+"""
+import asyncio
+import logging
+import time
+from compactResponse import COMPACT_INSTRUCTIONS
+from llmClient import create_cached_content
+from settings import (
+    MODEL, PROMPT_PREFIX_VERSION, PROMPT_CACHE_ENABLED, PROMPT_CACHE_TTL, PROMPT_CACHE_REFRESH_MARGIN,
+    PROMPT_CACHE_RETRY_AFTER, PROMPT_CACHE_CREATE_TIMEOUT, PROMPT_CACHE_MIN_TOKENS, PROMPT_CACHE_CHARS_PER_TOKEN
+)
+
+logger = logging.getLogger(__name__)
+
+# Cache creation errors that repeat on every attempt: invalid (e.g. too small), unauthorized, unknown model
+PERMANENT_CACHE_ERRORS = {400, 401, 403, 404}
+
+ROLE = "You are an accessibility expert who will provide suggestions to developers to improve a website's accessibility.\n"
+
+REACT_INSTRUCTIONS = """
+REACT/JSX SPECIFIC INSTRUCTIONS:
+- Use JSX syntax with camelCase props (onClick, className, etc.)
+- Use style objects: style={{ backgroundColor: '#fff', color: '#000' }}
+- For images: <img src="..." alt="..." />
+- For buttons: <button onClick={handleClick} aria-label="descriptive text">
+- For forms: <label htmlFor="input-id">Label</label><input id="input-id" />
+- Use semantic JSX: <main>, <nav>, <header>, <section>, <aside>
+- Include React event handlers and state references where appropriate
+- Use proper JSX self-closing tags
+"""
+
+HTML_INSTRUCTIONS = """
+HTML SPECIFIC INSTRUCTIONS:
+- Use standard HTML syntax
+- Use hyphenated attributes (onclick, class, etc.)
+- Use inline styles: style="background-color: #fff; color: #000;"
+- Standard HTML tags and attributes
+"""
+
+SUGGESTION_INSTRUCTIONS = """
+TASK: Analyze the source code and violations of the request to generate specific, contextual fixes.
+
+{code_instructions}
+
+CRITICAL REQUIREMENTS:
+1. ANALYZE the actual source code provided in the request AND the specific HTML elements in violations
+2. MODIFY the EXACT HTML code shown in the violation nodes, don't create new generic code
+3. PRESERVE existing variable names, class names, IDs, attributes, text content, and structure
+4. TAKE the actual HTML from violation nodes and APPLY fixes directly to that HTML
+5. PROVIDE the MODIFIED version of the existing HTML, not new code
+6. PRESERVE ALL TEXT CONTENT - do not change button text, headings, or any visible text
+
+VIOLATION-SPECIFIC CODE MODIFICATION:
+- Find the EXACT HTML element from the violation node (look at the "Current HTML:" field)
+- Apply the accessibility fix to THAT specific element
+- Keep all existing attributes, classes, styles, and TEXT CONTENT unless they conflict with the fix
+- Return the SAME element with SAME text content but with the accessibility issue resolved
+- If fixing a button that says "About", keep it saying "About" - don't change it to "Home"
+
+EXAMPLE PROCESS:
+If violation node shows: <div style="color: #ccc;">Low contrast text</div>
+Then return: <div style="color: #333333;">Low contrast text</div>
+
+If violation node shows: <img src="photo.jpg" class="gallery-image">
+Then return: <img src="photo.jpg" class="gallery-image" alt="Description based on image content">
+
+If violation node shows: <button class="nav-button">About</button>
+Then return: <button class="nav-button" style="color: #000000;">About</button>
+
+If violation node shows: <button onClick={{handleClick}}>🛒</button>
+Then return: <button onClick={{handleClick}} aria-label="Add to cart">🛒</button>
+
+RESPONSE FORMAT - Return ONLY valid JSON with this EXACT structure:
+{{
+  "suggestions": [
+    {{
+      "violationId": "violation-type",
+      "fixDescription": "Brief explanation of what needs to be fixed",
+      "codeSnippet": "Complete HTML/code that fixes the issue"
+    }}
+  ]
+}}
+
+IMPORTANT: Create ONE suggestion for EACH element shown in the violations of the request.
+If there are 3 button elements with the same violation, create 3 separate suggestions.
+Each suggestion should fix the exact HTML element provided, preserving its unique content.
+
+SPECIFIC FIX GUIDELINES:
+- color-contrast violations: Take existing style attributes and modify color values to meet contrast requirements
+- region violations: Wrap the EXACT HTML content shown in violation with semantic landmarks
+- document-title violations: Add title to existing document structure
+- html-has-lang violations: Add lang attribute to the existing <html> tag shown
+- page-has-heading-one violations: Modify existing heading structure or convert existing element to h1
+- landmark-one-main violations: Wrap existing HTML structure with <main> element
+- label violations: Add labels to the EXACT form elements shown in violations
+- button-name violations: Add aria-label or text content to the EXACT button shown
+- image-alt violations: Add alt attribute to the EXACT img element shown
+
+CONTEXT-AWARE CODE MODIFICATION:
+- Take the HTML from violation.nodes[].html and modify that EXACT code
+- Preserve all existing attributes, classes, IDs unless they conflict with the fix
+- Match the syntax style (HTML vs JSX) used in the violation node
+- Keep existing event handlers, styles, and structure intact
+- Only add or modify what's needed to fix the accessibility issue
+
+CRITICAL RULES:
+1. fixDescription: ONE sentence explaining the fix (no code examples in description)
+2. codeSnippet: ONLY the actual HTML/code needed, using REAL context from source code
+3. NO generic placeholders - use actual content, class names, IDs from source
+4. NO markdown formatting in JSON strings
+5. Return ONLY valid JSON, no other text
+6. Every suggestion MUST have both fixDescription AND codeSnippet
+
+CODE FORMATTING REQUIREMENTS:
+- Format code with proper indentation (2 or 4 spaces)
+- Use line breaks for nested elements
+- Keep attributes readable (one per line for complex elements)
+- Maintain consistent formatting style
+- Ensure code is copy-paste ready for developers
+
+EXAMPLE FORMATTING:
+Instead of: <section><p>Text</p><img src="url"><div class="container"><span>Content</span></div></section>
+Use this format:
+<section>
+    <p>Text</p>
+    <img src="url"
+         alt="Descriptive text">
+    <div class="container">
+        <span>Content</span>
+    </div>
+</section>
+"""
+
+PROMPT_PREFIXES = {
+    # Compact patches are converted to JSX on expansion, so one prefix serves every tech context
+    "compact": ROLE + COMPACT_INSTRUCTIONS,
+    "react": ROLE + SUGGESTION_INSTRUCTIONS.format(code_instructions=REACT_INSTRUCTIONS),
+    "html": ROLE + SUGGESTION_INSTRUCTIONS.format(code_instructions=HTML_INSTRUCTIONS),
+}
+
+def estimate_tokens(text):
+    return len(text) // PROMPT_CACHE_CHARS_PER_TOKEN
+
+def get_prefix_key(response_format, jsx):
+    """Key of the static prefix for a response format and tech context"""
+    if response_format == "compact":
+        return "compact"
+    return "react" if jsx else "html"
+
+class PromptPrefixCache:
+    def __init__(self, model=MODEL, version=PROMPT_PREFIX_VERSION, enabled=PROMPT_CACHE_ENABLED,
+                 ttl=PROMPT_CACHE_TTL, refresh_margin=PROMPT_CACHE_REFRESH_MARGIN,
+                 retry_after=PROMPT_CACHE_RETRY_AFTER, create_timeout=PROMPT_CACHE_CREATE_TIMEOUT,
+                 min_tokens=PROMPT_CACHE_MIN_TOKENS, create=create_cached_content):
+        """
+        Args:
+            model: Model the cached content is created for
+            version: PROMPT_PREFIX_VERSION, part of the cache display name
+            enabled: Create cached content; when False prefixes are always sent as system instruction
+            ttl: Seconds Gemini keeps a cached prefix
+            refresh_margin: Recreate a cached prefix this many seconds before it expires
+            retry_after: Seconds before caching a prefix is tried again after a transient failure
+            create_timeout: Seconds a cache creation may take
+            min_tokens: Smallest prefix (estimated tokens) the model accepts as cached content
+            create: Coroutine function create(model, system_instruction, ttl, display_name) returning the cache name
+        """
+        self.model = model
+        self.version = version
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.create_timeout = create_timeout
+        self.create = create
+        # Prefix key -> (cache name, monotonic expiry)
+        self._caches = {}
+        # Prefix key -> monotonic time before which caching is not tried again
+        self._unavailable = {}
+        # Prefixes that can never be cached: too small, or creation failed with a permanent error
+        self._uncacheable = {key for key, text in PROMPT_PREFIXES.items() if estimate_tokens(text) < min_tokens}
+        self._creating = {}
+        self.cached_calls = 0
+        self.uncached_calls = 0
+        self.created = 0
+        self.failed = 0
+
+    def config_for(self, key, base_config):
+        """
+        Generation config for a call with the static prefix key
+
+        References the cached prefix when one is ready; otherwise sends the
+        prefix as system instruction and starts caching it in the background.
+        """
+        cached = self._caches.get(key)
+        now = time.monotonic()
+        if cached is not None and now < cached[1]:
+            if now >= cached[1] - self.refresh_margin:
+                self._start_creating(key)
+            self.cached_calls += 1
+            return {**base_config, "cached_content": cached[0]}
+        self._start_creating(key)
+        self.uncached_calls += 1
+        return {**base_config, "system_instruction": PROMPT_PREFIXES[key]}
+
+    def discard(self, config, error):
+        """Forget a cached prefix Gemini rejected (expired or deleted) so the next call recreates it"""
+        name = config.get("cached_content")
+        status = getattr(error, "code", None) or getattr(error, "status_code", None)
+        if name is None or status not in (400, 403, 404):
+            return
+        for key, (cached_name, _) in list(self._caches.items()):
+            if cached_name == name:
+                del self._caches[key]
+                logger.warning(f"Cached prompt prefix {key} was rejected ({status}), sending it as system instruction")
+
+    def _start_creating(self, key):
+        if not self.enabled or key in self._creating or key in self._uncacheable:
+            return
+        if time.monotonic() < self._unavailable.get(key, 0):
+            return
+        task = asyncio.ensure_future(self._create(key))
+        self._creating[key] = task
+        task.add_done_callback(lambda _: self._creating.pop(key, None))
+
+    async def _create(self, key):
+        display_name = f"aware-{key}-v{self.version}"
+        try:
+            name = await asyncio.wait_for(
+                self.create(self.model, PROMPT_PREFIXES[key], self.ttl, display_name),
+                timeout=self.create_timeout
+            )
+        except Exception as e:
+            self.failed += 1
+            status = getattr(e, "code", None) or getattr(e, "status_code", None)
+            # A missing API key (ValueError) does not fix itself either
+            if status in PERMANENT_CACHE_ERRORS or isinstance(e, ValueError):
+                self._uncacheable.add(key)
+                logger.warning(f"Prompt prefix {display_name} cannot be cached ({e}), sending it as system instruction from now on")
+            else:
+                self._unavailable[key] = time.monotonic() + self.retry_after
+                logger.warning(f"Could not cache prompt prefix {display_name} ({e}), sending it as system instruction")
+            return
+        self._caches[key] = (name, time.monotonic() + self.ttl)
+        self.created += 1
+        logger.info(f"📌 Cached prompt prefix {display_name} as {name}")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "version": self.version,
+            "cached": sorted(key for key, (_, expires) in self._caches.items() if time.monotonic() < expires),
+            "uncacheable": sorted(self._uncacheable),
+            "cached_calls": self.cached_calls,
+            "uncached_calls": self.uncached_calls,
+            "created": self.created,
+            "failed": self.failed
+        }
+
+prompt_prefixes = PromptPrefixCache()
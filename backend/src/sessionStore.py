@@ -0,0 +1,291 @@
+"""
+Bounded session storage
+
+Sessions expire after SESSION_TTL seconds without an update and are evicted
+oldest-first when the store exceeds its entry or byte budget. Session data
+must be JSON serializable; its JSON size is what counts against the budget.
+
+The store methods are coroutines so that the SQLite backend, shared by the
+workers of a multi-worker deployment, runs its queries on a worker thread
+instead of the event loop.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from settings import (
+    SESSION_STORE_BACKEND, SESSION_STORE_SQLITE_PATH, SESSION_TTL, SESSION_MAX_ENTRIES,
+    SESSION_MAX_BYTES, SESSION_SWEEP_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+class SessionStore(ABC):
+    """Interface shared by the session store backends"""
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES):
+        """
+        Args:
+            ttl: Seconds a session is kept after its last update
+            max_entries: Maximum number of sessions
+            max_bytes: Maximum total JSON size of all sessions
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.expired = 0
+        self.evicted = 0
+
+    @abstractmethod
+    async def create(self, session_id, data):
+        """Store a new session"""
+
+    @abstractmethod
+    async def get(self, session_id):
+        """Return the session data or None"""
+
+    @abstractmethod
+    async def update(self, session_id, **fields):
+        """Update fields of a session. Returns False if the session no longer exists."""
+
+    @abstractmethod
+    async def delete(self, session_id):
+        """Remove a session if it exists"""
+
+    @abstractmethod
+    async def sweep(self):
+        """Remove expired sessions. Returns the number of removed sessions."""
+
+    async def exists(self, session_id):
+        return await self.get(session_id) is not None
+
+    @abstractmethod
+    def total_bytes(self):
+        """Total JSON size of all sessions"""
+
+    @abstractmethod
+    def __len__(self):
+        """Number of stored sessions"""
+
+    async def run_sweeper(self, interval=SESSION_SWEEP_INTERVAL):
+        """Background task removing expired sessions every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info(f"🧹 Removed {removed} expired sessions ({len(self)} remaining)")
+            except Exception as e:
+                logger.error(f"Error sweeping sessions: {e}")
+
+    def stats(self):
+        """Size and eviction counters for /health"""
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self),
+            "bytes": self.total_bytes(),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        # session_id -> (data, size, expires_at), oldest update first
+        self._sessions = OrderedDict()
+        self._bytes = 0
+
+    async def create(self, session_id, data):
+        self._put(session_id, dict(data))
+
+    async def get(self, session_id):
+        return self._get(session_id)
+
+    def _get(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry[2] < time.time():
+            self._remove(session_id)
+            self.expired += 1
+            return None
+        return entry[0]
+
+    async def update(self, session_id, **fields):
+        data = self._get(session_id)
+        if data is None:
+            return False
+        data.update(fields)
+        self._put(session_id, data)
+        return True
+
+    async def delete(self, session_id):
+        if session_id in self._sessions:
+            self._remove(session_id)
+
+    async def sweep(self):
+        now = time.time()
+        expired = [session_id for session_id, (_, _, expires_at) in self._sessions.items() if expires_at < now]
+        for session_id in expired:
+            self._remove(session_id)
+        self.expired += len(expired)
+        return len(expired)
+
+    def total_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _put(self, session_id, data):
+        if session_id in self._sessions:
+            self._remove(session_id)
+        size = len(json.dumps(data, default=str))
+        self._sessions[session_id] = (data, size, time.time() + self.ttl)
+        self._bytes += size
+        # Never evict the session that was just written
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._sessions))
+            self._remove(oldest)
+            self.evicted += 1
+
+    def _remove(self, session_id):
+        _, size, _ = self._sessions.pop(session_id)
+        self._bytes -= size
+
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path=SESSION_STORE_SQLITE_PATH, **limits):
+        super().__init__(**limits)
+        self._lock = threading.Lock()
+        # Several worker processes write to the file: wait for their locks instead of failing
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        # Entry count and byte total, kept up to date by triggers so eviction never scans the table
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_totals "
+            "(id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO session_totals (id, entries, bytes) SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+        )
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS sessions_insert AFTER INSERT ON sessions BEGIN "
+            "UPDATE session_totals SET entries = entries + 1, bytes = bytes + new.size WHERE id = 0; END"
+        )
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS sessions_update AFTER UPDATE OF size ON sessions BEGIN "
+            "UPDATE session_totals SET bytes = bytes + new.size - old.size WHERE id = 0; END"
+        )
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS sessions_delete AFTER DELETE ON sessions BEGIN "
+            "UPDATE session_totals SET entries = entries - 1, bytes = bytes - old.size WHERE id = 0; END"
+        )
+        self._db.commit()
+        self._entries, self._bytes = self._totals()
+        logger.info(f"Session store using SQLite at {path}")
+
+    async def create(self, session_id, data):
+        await self._run(self._put, session_id, data)
+
+    async def get(self, session_id):
+        return await self._run(self._get, session_id)
+
+    async def update(self, session_id, **fields):
+        return await self._run(self._update, session_id, fields)
+
+    async def delete(self, session_id):
+        await self._run(self._delete, session_id)
+
+    async def sweep(self):
+        return await self._run(self._sweep)
+
+    def total_bytes(self):
+        """As of this worker's last write"""
+        return self._bytes
+
+    def __len__(self):
+        """As of this worker's last write"""
+        return self._entries
+
+    async def _run(self, func, *args):
+        """Run a store operation on a worker thread, one at a time"""
+        def locked():
+            with self._lock:
+                return func(*args)
+        return await asyncio.to_thread(locked)
+
+    def _totals(self):
+        return self._db.execute("SELECT entries, bytes FROM session_totals WHERE id = 0").fetchone()
+
+    def _get(self, session_id):
+        row = self._db.execute("SELECT data, expires FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self._delete(session_id)
+            self.expired += 1
+            return None
+        return json.loads(row[0])
+
+    def _update(self, session_id, fields):
+        data = self._get(session_id)
+        if data is None:
+            return False
+        data.update(fields)
+        self._put(session_id, data)
+        return True
+
+    def _delete(self, session_id):
+        self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self._db.commit()
+        self._entries, self._bytes = self._totals()
+
+    def _sweep(self):
+        removed = self._db.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),)).rowcount
+        self._db.commit()
+        self._entries, self._bytes = self._totals()
+        self.expired += removed
+        return removed
+
+    def _put(self, session_id, data):
+        now = time.time()
+        encoded = json.dumps(data, default=str)
+        # An upsert, not INSERT OR REPLACE: the implicit delete of REPLACE does not fire the delete trigger
+        self._db.execute(
+            "INSERT INTO sessions (id, data, size, expires, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, size = excluded.size, "
+            "expires = excluded.expires, updated = excluded.updated",
+            (session_id, encoded, len(encoded), now + self.ttl, now)
+        )
+        # Evict the least recently updated sessions, never the one just written
+        count, total = self._totals()
+        while count > 1 and (count > self.max_entries or total > self.max_bytes):
+            self._db.execute(
+                "DELETE FROM sessions WHERE id = (SELECT id FROM sessions WHERE id != ? ORDER BY updated ASC LIMIT 1)",
+                (session_id,)
+            )
+            self.evicted += 1
+            count, total = self._totals()
+        self._db.commit()
+        self._entries, self._bytes = count, total
+
+def create_session_store():
+    """Create the session store configured by SESSION_STORE_BACKEND"""
+    if SESSION_STORE_BACKEND == "sqlite":
+        return SqliteSessionStore()
+    if SESSION_STORE_BACKEND == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {SESSION_STORE_BACKEND}")
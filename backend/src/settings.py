@@ -1,8 +1,10 @@
-from google.genai import types
+import os
 
 # --- GOOGLE GEMINI CONFIG ---
 MODEL = "gemini-2.5-flash"
-GEMINI_CONFIG = types.GenerateContentConfig(
+# Plain dict (accepted by the genai client as GenerateContentConfig) so that
+# importing settings does not load the genai SDK
+GEMINI_CONFIG = dict(
     temperature=0.2,
     top_p=0.1,
     max_output_tokens=65535,
@@ -27,4 +29,168 @@ GEMINI_CONFIG = types.GenerateContentConfig(
   },
   "required": ["suggestions"]
 }
-)
\ No newline at end of file
+)
+
+# "compact": elements are numbered in the prompt and the model returns the element
+# number plus a minimal attribute/style patch, applied to the node's HTML by the backend
+# "legacy": the model returns violationId and a complete codeSnippet for every element
+LLM_RESPONSE_FORMAT = "compact"
+
+GEMINI_COMPACT_CONFIG = dict(
+    temperature=0.2,
+    top_p=0.1,
+    max_output_tokens=65535,
+    response_mime_type="application/json",
+    response_schema={
+  "type": "OBJECT",
+  "properties": {
+    "fixes": {
+      "type": "ARRAY",
+      "description": "One fix per numbered element.",
+      "items": {
+        "type": "OBJECT",
+        "properties": {
+          "element": { "type": "INTEGER", "description": "The number n of the [ELEMENT #n] block being fixed." },
+          "description": { "type": "STRING", "description": "One sentence explaining the fix (no code)." },
+          "set": {
+            "type": "ARRAY",
+            "description": "Attributes to add or replace.",
+            "items": {
+              "type": "OBJECT",
+              "properties": {
+                "name": { "type": "STRING" },
+                "value": { "type": "STRING" }
+              },
+              "required": ["name", "value"]
+            }
+          },
+          "remove": { "type": "ARRAY", "description": "Attributes to remove.", "items": { "type": "STRING" } },
+          "style": {
+            "type": "ARRAY",
+            "description": "Inline CSS properties to add or replace.",
+            "items": {
+              "type": "OBJECT",
+              "properties": {
+                "property": { "type": "STRING" },
+                "value": { "type": "STRING" }
+              },
+              "required": ["property", "value"]
+            }
+          },
+          "tag": { "type": "STRING", "description": "New tag name, only when the element type must change." },
+          "html": { "type": "STRING", "description": "Complete replacement, only when the fix cannot be expressed as a patch." }
+        },
+        "required": ["element", "description"]
+      }
+    }
+  },
+  "required": ["fixes"]
+}
+)
+
+# --- VS CODE SOURCE REQUESTS ---
+SOURCE_CODE_TIMEOUT = 30  # seconds to wait for the developer to select a file in VS Code
+VSCODE_ACK_TIMEOUT = 5  # seconds a registered VS Code window has to acknowledge a request before the next one is tried
+VSCODE_HEARTBEAT_INTERVAL = 15  # seconds between pings to connected VS Code windows
+VSCODE_HEARTBEAT_TIMEOUT = 45  # seconds of silence after which a registered VS Code connection is closed
+
+# --- SOURCE FILE CACHE ---
+SOURCE_CACHE_MAX_FILES = 200  # file versions received from VS Code kept in memory
+SOURCE_CACHE_SQLITE_PATH = None  # e.g. "source_files.db" to keep received files across restarts
+SOURCE_CACHE_ADVERTISED_FILES = 50  # path/hash pairs sent with request_source
+
+# --- SOURCE CONTEXT ---
+SOURCE_CONTEXT_TOKEN_BUDGET = 1500  # approximate prompt tokens spent on source excerpts per batch
+SOURCE_CONTEXT_WINDOW_LINES = 6  # lines kept above and below each located element
+SOURCE_CONTEXT_MIN_SCORE = 5  # fingerprint score a source line needs to count as the element's location
+SOURCE_CONTEXT_CHARS_PER_TOKEN = 4  # rough token estimate for source code
+
+# --- LLM CONCURRENCY ---
+LLM_MAX_CONCURRENT_REQUESTS = 4  # Gemini calls allowed in flight at the same time
+LLM_MAX_QUEUED_REQUESTS = 32  # calls allowed to wait for a free slot before being rejected
+LLM_BATCH_MAX_NODES = 15  # violation elements per Gemini prompt; larger pages are split into concurrent batches
+
+# --- LLM RESILIENCE ---
+LLM_CALL_DEADLINE = 45  # seconds a Gemini call may take, hedges and retries included, before falling back
+LLM_HEDGE_PERCENTILE = 95  # a duplicate request is sent when the first has not answered within this latency percentile
+LLM_HEDGE_DEFAULT_DELAY = 10  # seconds before hedging until LLM_HEDGE_MIN_SAMPLES latencies are known
+LLM_HEDGE_MIN_DELAY = 2  # never hedge earlier than this (seconds)
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200  # recent successful call latencies the percentile is computed from
+LLM_MAX_RETRIES = 2  # retries after a failed or timed out attempt
+LLM_RETRY_BASE_DELAY = 0.5  # seconds, doubled per retry with full jitter
+LLM_RETRY_MAX_DELAY = 8
+LLM_BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures that open the circuit; calls then fail fast to local fallbacks
+LLM_BREAKER_RESET_TIMEOUT = 30  # seconds the circuit stays open before a single probe call is let through
+LLM_STREAM_FIRST_CHUNK_TIMEOUT = 20  # seconds a streamed response may take to start; retried like a failed call
+LLM_STREAM_IDLE_TIMEOUT = 15  # seconds allowed between two chunks of a streamed response
+
+# --- PROMPT PREFIX CACHE ---
+PROMPT_PREFIX_VERSION = 1  # bump when the static instructions in promptPrefix.py change
+PROMPT_CACHE_ENABLED = True  # register the static instructions as Gemini cached content; otherwise they are sent as system instruction
+PROMPT_CACHE_TTL = 3600  # seconds Gemini keeps a cached prefix
+PROMPT_CACHE_REFRESH_MARGIN = 120  # recreate a cached prefix this many seconds before it expires
+PROMPT_CACHE_RETRY_AFTER = 600  # seconds before trying to cache a prefix again after a transient failure (timeout, 429, 5xx)
+PROMPT_CACHE_MIN_TOKENS = 1024  # smallest prefix the model accepts as cached content; smaller prefixes are always sent as system instruction
+PROMPT_CACHE_CHARS_PER_TOKEN = 4  # rough size estimate used against PROMPT_CACHE_MIN_TOKENS
+PROMPT_CACHE_CREATE_TIMEOUT = 15  # seconds a cache creation may take
+
+# --- LOCAL FIXERS ---
+LOCAL_FIXERS_ENABLED = True  # fix trivial violations (missing lang, icon buttons, ...) with rules instead of the LLM
+LOCAL_FIX_DEFAULT_LANG = "en"  # lang set by the html-has-lang fixer when the source code declares none
+
+# --- SUGGESTION CACHE ---
+SUGGESTION_CACHE_VERSION = 3  # bump when the prompt changes to invalidate cached suggestions
+SUGGESTION_CACHE_MAX_ENTRIES = 5000
+SUGGESTION_CACHE_SQLITE_PATH = None  # e.g. "suggestion_cache.db" to keep suggestions across restarts
+
+# --- IMAGE CAPTIONING ---
+CAPTION_MODEL = "Salesforce/blip-image-captioning-base"
+CAPTION_ENGINE = "fp32"  # "fp32" or "int8" (dynamically quantized linear layers, faster on CPU)
+CAPTION_MAX_LENGTH = 50  # maximum caption length in tokens
+CAPTION_NUM_BEAMS = 1  # beam search width, 1 for greedy decoding
+CAPTION_MAX_BATCH_SIZE = 16  # images per batched BLIP generate call
+CAPTION_BATCH_WINDOW = 0.02  # seconds to wait for concurrent requests to join a caption batch
+CAPTION_WORKERS = 2  # caption worker processes, each with its own copy of the model
+CAPTION_TORCH_THREADS = 2  # torch intra-op threads per caption worker
+CAPTION_INTEROP_THREADS = 1  # torch inter-op threads per caption worker
+CAPTION_JOB_TIMEOUT = 60  # seconds before a queued or running caption job is abandoned
+
+# --- IMAGE FETCHING ---
+IMAGE_FETCH_TIMEOUT = 15  # seconds per image download
+IMAGE_FETCH_MAX_CONCURRENT = 16  # parallel downloads across all hosts
+IMAGE_FETCH_MAX_PER_HOST = 6  # parallel downloads (and pooled connections) per host
+IMAGE_FETCH_MAX_BYTES = 10 * 1024 * 1024  # downloads above this size are aborted
+
+# --- IMAGE CAPTION CACHE ---
+CAPTION_CACHE_MAX_ENTRIES = 2000  # entries per level (URL -> image hash, image hash -> caption)
+CAPTION_CACHE_SQLITE_PATH = None  # e.g. "caption_cache.db" to keep captions across restarts
+IMAGE_URL_FRESH_SECONDS = 300  # trust a cached URL -> image mapping this long before revalidating it
+
+# --- IMAGE DECODING ---
+IMAGE_MAX_BYTES = IMAGE_FETCH_MAX_BYTES  # encoded size limit for data URIs and downloaded images
+IMAGE_MAX_DECODED_PIXELS = 24_000_000  # pixels actually decoded; peak memory per image is about 4 bytes per pixel
+IMAGE_DECODE_SIZE = 384  # BLIP input resolution, images are decoded and reduced to about this size
+
+# --- SESSION STORE ---
+SESSION_STORE_BACKEND = os.environ.get("AWARE_SESSION_STORE", "memory")  # "memory" or "sqlite"; several workers need "sqlite"
+# Absolute so every worker process opens the same file whatever its working directory; AWARE_SESSION_DB overrides it
+SESSION_STORE_SQLITE_PATH = os.path.abspath(
+    os.environ.get("AWARE_SESSION_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sessions.db"))
+)
+SESSION_TTL = 3600  # seconds a session is kept after its last update
+SESSION_MAX_ENTRIES = 1000
+SESSION_MAX_BYTES = 200 * 1024 * 1024  # total JSON size of all sessions, including source code
+SESSION_SWEEP_INTERVAL = 60  # seconds between background sweeps of expired sessions
+
+# --- ANALYSIS JOBS ---
+JOB_WORKERS = 8  # analysis jobs run at the same time; a job holds its worker while waiting for the source file
+JOB_QUEUE_MAX_SIZE = 64  # jobs allowed to wait for a worker before POST /jobs is rejected
+JOB_RESULT_TTL = 600  # seconds a finished job and its result can still be retrieved
+
+# --- MULTI-WORKER DEPLOYMENT ---
+# start_server.py --workers N sets AWARE_CLUSTER_BUS and AWARE_SESSION_STORE=sqlite for every worker
+CLUSTER_BUS_PATH = os.environ.get("AWARE_CLUSTER_BUS")  # SQLite file the worker processes share state and messages through; None for a single process
+CLUSTER_POLL_INTERVAL = 0.05  # seconds between checks for messages from other workers
+CLUSTER_WORKER_TIMEOUT = 10  # seconds without a heartbeat after which a worker's VS Code connections are ignored
+CLUSTER_MESSAGE_TTL = 60  # seconds before undelivered messages are dropped
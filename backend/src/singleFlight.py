@@ -0,0 +1,128 @@
+"""
+Single-flight coalescing of identical concurrent work
+
+When several developers analyse the same page at the same time, their
+requests carry the same violations and usually the same source file. The
+first caller with a given key runs the computation; callers arriving while
+it is in flight await the same result instead of repeating captioning and
+Gemini calls. Keys are forgotten as soon as the computation finishes, so
+this only merges overlapping requests; repeated ones hit the caches.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _StreamFlight:
+    """Items of one shared async generator, replayed to every subscriber"""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def publish(self, item):
+        self.items.append(item)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def run(self, key, factory):
+        """
+        Await factory() once per key among concurrent callers
+
+        Args:
+            key: Identifies identical work
+            factory: Callable returning the coroutine to run if no call is in flight
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.joined += 1
+            logger.info(f"🔗 Joined in-flight {self.name} computation ({key[:12]})")
+        # One caller going away must not cancel the work the others wait for
+        return await asyncio.shield(task)
+
+    async def stream(self, key, factory):
+        """
+        Iterate factory() once per key among concurrent subscribers
+
+        Late subscribers first receive the items already produced. The shared
+        generator is cancelled when its last subscriber stops listening.
+
+        Args:
+            key: Identifies identical work
+            factory: Callable returning the async generator to run if none is in flight
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory()))
+        else:
+            self.joined += 1
+            logger.info(f"🔗 Joined in-flight {self.name} stream ({key[:12]}, {len(flight.items)} items so far)")
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(flight.items):
+                    yield flight.items[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+
+    async def _pump(self, key, flight, generator):
+        try:
+            async for item in generator:
+                flight.publish(item)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "joined": self.joined
+        }
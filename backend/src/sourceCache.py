@@ -0,0 +1,164 @@
+"""
+Content-addressed cache of source files received from VS Code
+
+Files are stored once per content hash and indexed by path. request_source
+advertises the hashes the backend already holds, so the extension can answer
+with just the hash of an unchanged file, or with a line delta against the
+cached version, instead of sending the whole file again. Sessions keep only
+the path and hash of their file.
+"""
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from tieredCache import TieredCache
+from settings import SOURCE_CACHE_MAX_FILES, SOURCE_CACHE_SQLITE_PATH, SOURCE_CACHE_ADVERTISED_FILES
+
+logger = logging.getLogger(__name__)
+
+LINE = re.compile(r"[^\n]*\n|[^\n]+\Z")
+
+class SourceDeltaError(Exception):
+    """Raised when a delta cannot be applied to the cached base version"""
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def apply_line_delta(base, hunks):
+    """
+    Apply line hunks to a base text
+
+    Args:
+        base: Cached file content
+        hunks: List of [start, delete_count, inserted_lines] against the base
+               lines, in ascending order of start. Lines keep their "\\n" and
+               only "\\n" separates lines, as in the VS Code extension.
+
+    Raises:
+        SourceDeltaError: a hunk is malformed or out of range
+    """
+    lines = LINE.findall(base)
+    result = []
+    position = 0
+    try:
+        for start, delete_count, inserted in hunks:
+            if start < position or start + delete_count > len(lines):
+                raise SourceDeltaError(f"Hunk {start},{delete_count} out of range")
+            result.extend(lines[position:start])
+            result.extend(inserted)
+            position = start + delete_count
+    except (TypeError, ValueError) as e:
+        raise SourceDeltaError(f"Malformed delta: {e}") from e
+    result.extend(lines[position:])
+    return "".join(result)
+
+class SourceFileCache:
+    def __init__(self, max_files=SOURCE_CACHE_MAX_FILES, sqlite_path=SOURCE_CACHE_SQLITE_PATH):
+        """
+        Args:
+            max_files: Maximum number of file versions kept in memory
+            sqlite_path: Path of the SQLite database for the persistent tier (optional)
+        """
+        self._contents = TieredCache("source_files", max_entries=max_files, sqlite_path=sqlite_path)
+        # path -> hash of the latest version, least recently used first
+        self._paths = OrderedDict()
+        self.max_paths = max_files
+        self.full = 0
+        self.unchanged = 0
+        self.deltas = 0
+        self.misses = 0
+        self.received_bytes = 0
+        self.saved_bytes = 0
+
+    def put(self, file_path, content):
+        """Store a file version and return its hash"""
+        digest = content_hash(content)
+        self._contents.set(digest, content)
+        self._remember(file_path, digest)
+        return digest
+
+    async def get(self, digest):
+        """Return the content of a file version or None; a disk lookup runs off the event loop"""
+        return await self._contents.aget(digest)
+
+    def known_files(self, limit=SOURCE_CACHE_ADVERTISED_FILES):
+        """{path: hash} of the most recently used files, advertised in request_source"""
+        return dict(list(self._paths.items())[-limit:])
+
+    async def resolve(self, message):
+        """
+        Rebuild the file content of a source_response
+
+        A response carries either the full "content", "contentHash" alone for
+        an unchanged file, or "baseHash" plus "delta" hunks. Full content is
+        stored so that the next request can be answered by hash.
+
+        Returns:
+            tuple: (content, hash), or (None, None) if the referenced version
+                   is not cached or the delta does not reproduce contentHash
+        """
+        file_path = message.get("filePath")
+        content = message.get("content")
+        expected = message.get("contentHash")
+
+        if content is not None:
+            self.full += 1
+            self.received_bytes += len(content)
+            return content, self.put(file_path, content)
+
+        if "delta" in message:
+            base = await self.get(message.get("baseHash"))
+            if base is None:
+                self.misses += 1
+                logger.info(f"Delta base for {file_path} is not cached")
+                return None, None
+            try:
+                content = apply_line_delta(base, message["delta"])
+            except SourceDeltaError as e:
+                self.misses += 1
+                logger.warning(f"Could not apply delta for {file_path}: {e}")
+                return None, None
+            digest = content_hash(content)
+            if expected and digest != expected:
+                self.misses += 1
+                logger.warning(f"Delta for {file_path} does not match its content hash")
+                return None, None
+            self.deltas += 1
+            delta_size = sum(len(line) for _, _, inserted in message["delta"] for line in inserted)
+            self.received_bytes += delta_size
+            self.saved_bytes += max(0, len(content) - delta_size)
+            self._contents.set(digest, content)
+            self._remember(file_path, digest)
+            return content, digest
+
+        content = await self.get(expected)
+        if content is None:
+            self.misses += 1
+            logger.info(f"Source file {file_path} ({expected}) is not cached")
+            return None, None
+        self.unchanged += 1
+        self.saved_bytes += len(content)
+        self._remember(file_path, expected)
+        return content, expected
+
+    def _remember(self, file_path, digest):
+        if not file_path:
+            return
+        self._paths[file_path] = digest
+        self._paths.move_to_end(file_path)
+        while len(self._paths) > self.max_paths:
+            self._paths.popitem(last=False)
+
+    def stats(self):
+        return {
+            "files": len(self._paths),
+            "full": self.full,
+            "unchanged": self.unchanged,
+            "deltas": self.deltas,
+            "misses": self.misses,
+            "received_bytes": self.received_bytes,
+            "saved_bytes": self.saved_bytes,
+            "contents": self._contents.stats()
+        }
+
+source_cache = SourceFileCache()
@@ -0,0 +1,174 @@
+"""
+Source context extraction for LLM prompts
+
+Instead of the start of the selected file, the prompt gets the lines around
+the markup that is actually broken. Each violation node's HTML is reduced to
+fingerprints (tag, id, attribute values, classes, text) that are looked up in
+the source file. Rendered HTML rarely matches JSX or templates verbatim, so
+lines are scored by the fingerprints they contain and the best candidates are
+compared fuzzily against the node's opening tag. The windows around the
+matches are merged and cut to a token budget.
+"""
+import difflib
+import html
+import logging
+import re
+from settings import (
+    SOURCE_CONTEXT_TOKEN_BUDGET, SOURCE_CONTEXT_WINDOW_LINES, SOURCE_CONTEXT_MIN_SCORE,
+    SOURCE_CONTEXT_CHARS_PER_TOKEN
+)
+
+logger = logging.getLogger(__name__)
+
+OPENING_TAG = re.compile(r"<([a-zA-Z][\w:-]*)([^>]*)>", re.S)
+ATTRIBUTE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+# Attributes whose values say little about which element this is
+IGNORED_ATTRIBUTES = {"style"}
+# Values too generic to identify an element
+MIN_VALUE_LENGTH = 3
+FUZZY_CANDIDATES = 20
+
+def estimate_tokens(text):
+    return len(text) // SOURCE_CONTEXT_CHARS_PER_TOKEN + 1
+
+def extract_fingerprints(node_html):
+    """
+    Reduce a node's rendered HTML to weighted substrings to look for in source
+
+    Returns:
+        list: (fingerprint, weight) pairs, fingerprints lowercased
+    """
+    fingerprints = []
+    match = OPENING_TAG.search(node_html)
+    if not match:
+        return fingerprints
+
+    tag, attributes = match.group(1).lower(), match.group(2)
+    fingerprints.append((f"<{tag}", 1))
+
+    for name, *values in ATTRIBUTE.findall(attributes):
+        name = name.lower()
+        value = html.unescape(next((v for v in values if v), "")).strip().lower()
+        if name in IGNORED_ATTRIBUTES or len(value) < MIN_VALUE_LENGTH:
+            continue
+        if name == "id":
+            fingerprints.append((value, 6))
+        elif name == "class":
+            # Rendered class names are often generated; each one is weak evidence
+            fingerprints.extend((class_name, 2) for class_name in value.split() if len(class_name) >= MIN_VALUE_LENGTH)
+        else:
+            fingerprints.append((value, 3))
+
+    text = html.unescape(re.sub(r"<[^>]+>", " ", node_html[match.end():]))
+    text = " ".join(text.split()).lower()
+    # Icon-only text such as emoji is short but distinctive
+    if len(text) >= MIN_VALUE_LENGTH or (text and not text.isascii()):
+        fingerprints.append((text[:60], 5))
+        # Text split across lines or interpolated in JSX still matches word by word
+        fingerprints.extend((word, 1) for word in set(text.split()[:8]) if len(word) > MIN_VALUE_LENGTH)
+
+    return fingerprints
+
+def find_node_line(lowered_lines, node_html):
+    """
+    Find the source line that most likely renders node_html
+
+    Returns:
+        tuple: (line index, score), or (None, 0) if nothing scores SOURCE_CONTEXT_MIN_SCORE
+    """
+    fingerprints = extract_fingerprints(node_html)
+    if not fingerprints:
+        return None, 0
+
+    scores = []
+    for index, line in enumerate(lowered_lines):
+        score = sum(weight for fingerprint, weight in fingerprints if fingerprint in line)
+        if score:
+            scores.append((score, index))
+    if not scores:
+        return None, 0
+
+    # Fuzzy comparison of the opening tag breaks ties between similar elements
+    opening_tag = OPENING_TAG.search(node_html).group(0).lower()
+    best_index, best_score = None, 0
+    for score, index in sorted(scores, reverse=True)[:FUZZY_CANDIDATES]:
+        similarity = difflib.SequenceMatcher(None, lowered_lines[index].strip(), opening_tag).ratio()
+        score += 4 * similarity
+        if score > best_score:
+            best_index, best_score = index, score
+
+    if best_score < SOURCE_CONTEXT_MIN_SCORE:
+        return None, best_score
+    return best_index, best_score
+
+def extract_source_context(content, node_htmls, token_budget=SOURCE_CONTEXT_TOKEN_BUDGET,
+                           window_lines=SOURCE_CONTEXT_WINDOW_LINES):
+    """
+    Build the source excerpt for a prompt from the lines around each node
+
+    Args:
+        content: Source file content
+        node_htmls: Rendered HTML of the violation nodes
+        token_budget: Approximate maximum size of the excerpt in tokens
+        window_lines: Lines kept above and below each matched line
+
+    Returns:
+        str: Numbered source lines, non-adjacent windows separated by "...".
+             The start of the file when no node could be located.
+    """
+    lines = content.splitlines()
+    lowered_lines = [line.lower() for line in lines]
+
+    # Best match per distinct node; identical nodes share a window
+    anchors = {}
+    for node_html in dict.fromkeys(node_htmls):
+        index, score = find_node_line(lowered_lines, node_html)
+        if index is not None:
+            anchors[index] = max(score, anchors.get(index, 0))
+
+    if not anchors:
+        logger.info("Source context: no violation elements located, using the first lines of the file")
+        return head_context(lines, token_budget)
+
+    # Strongest matches claim the budget first, windows shrink to fit what is left
+    selected = set()
+    remaining = token_budget
+    for anchor, _ in sorted(anchors.items(), key=lambda item: -item[1]):
+        for radius in range(window_lines, -1, -1):
+            window = set(range(max(0, anchor - radius), min(len(lines), anchor + radius + 1))) - selected
+            cost = sum(estimate_tokens(lines[index]) for index in window)
+            if cost <= remaining:
+                selected |= window
+                remaining -= cost
+                break
+
+    excerpt = format_lines(lines, sorted(selected))
+    logger.info(
+        f"Source context: {len(anchors)} elements located, {len(selected)} of {len(lines)} lines "
+        f"({len(excerpt)} of {len(content)} chars)"
+    )
+    return excerpt
+
+def head_context(lines, token_budget):
+    selected = []
+    remaining = token_budget
+    for index, line in enumerate(lines):
+        remaining -= estimate_tokens(line)
+        if remaining < 0:
+            break
+        selected.append(index)
+    return format_lines(lines, selected)
+
+def format_lines(lines, indexes):
+    """Number the selected lines and mark the gaps between windows"""
+    width = len(str(len(lines)))
+    output = []
+    previous = None
+    for index in indexes:
+        if index != (previous + 1 if previous is not None else 0):
+            output.append("...")
+        output.append(f"{index + 1:>{width}} | {lines[index]}")
+        previous = index
+    if previous is not None and previous < len(lines) - 1:
+        output.append("...")
+    return "\n".join(output)
@@ -0,0 +1,94 @@
+"""
+Tolerant incremental JSON parsing for streamed LLM output
+
+Gemini streams its JSON response in arbitrary text chunks. Instead of waiting
+for the whole document, SuggestionStreamParser yields every object of the
+suggestions array as soon as its closing brace arrives. Text around the JSON
+(markdown fences, prose) is ignored and objects that fail to parse are
+skipped, so one malformed suggestion does not lose the rest of the response.
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SuggestionStreamParser:
+    """
+    Extract the objects that are direct items of a JSON array, e.g. each
+    suggestion of {"suggestions": [{...}, {...}]} or of a bare [{...}, {...}]
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        # Open containers ("{" or "["), outermost first
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        # Buffer offset and stack depth of the array item currently being read
+        self._item_start = None
+        self._item_depth = None
+        self.skipped = 0
+
+    def feed(self, text):
+        """
+        Add the next chunk of the response
+
+        Returns:
+            list: Objects completed by this chunk, in order
+        """
+        self._buffer += text
+        items = []
+
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Strings only matter inside the JSON document, not in surrounding prose
+                self._in_string = bool(self._stack)
+            elif char in "{[":
+                if char == "{" and self._item_start is None and self._stack and self._stack[-1] == "[":
+                    self._item_start = self._position
+                    self._item_depth = len(self._stack)
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if self._item_start is not None and len(self._stack) == self._item_depth:
+                    item = self._parse(self._buffer[self._item_start:self._position + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._item_start = None
+                    self._item_depth = None
+
+            self._position += 1
+
+        self._compact()
+        return items
+
+    def _parse(self, text):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            logger.warning(f"Skipping malformed streamed item: {e}")
+            return None
+        if not isinstance(item, dict):
+            self.skipped += 1
+            return None
+        return item
+
+    def _compact(self):
+        """Drop consumed text that no pending item needs"""
+        keep_from = self._item_start if self._item_start is not None else self._position
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            self._position -= keep_from
+            if self._item_start is not None:
+                self._item_start = 0
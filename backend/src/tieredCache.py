@@ -0,0 +1,160 @@
+"""
+LRU cache with an optional SQLite tier that survives restarts
+
+Values must be JSON serializable. The memory tier is checked first; hits from
+the SQLite tier are promoted back into memory. SQLite writes (new values and
+the access times of disk hits) are queued to a writer thread that commits
+them in batches, so set() never blocks the event loop; aget() also moves the
+disk lookup of a memory miss off the loop. The row count is tracked in memory
+so the table is only trimmed once it exceeds its limit.
+"""
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TieredCache:
+    def __init__(self, name, max_entries, sqlite_path=None, max_disk_entries=None):
+        """
+        Args:
+            name: Cache name, also used as the SQLite table name
+            max_entries: Maximum number of entries kept in memory
+            sqlite_path: Path of the SQLite database for the persistent tier (optional)
+            max_disk_entries: Maximum number of rows kept in SQLite (defaults to 10x max_entries)
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Invalid cache name: {name}")
+        self.name = name
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries or max_entries * 10
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = None
+        self._disk_rows = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            # WAL: lookups are not blocked while the writer thread commits
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._disk_rows = self._db.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            self._writes = queue.SimpleQueue()
+            threading.Thread(target=self._write_loop, args=(sqlite_path,), name=f"{name}-cache-writer", daemon=True).start()
+            logger.info(f"Cache '{name}' using SQLite tier at {sqlite_path}")
+
+    def get(self, key):
+        """Return the cached value or None"""
+        value = self._get_from_memory(key)
+        if value is not None or self._db is None:
+            return value
+        return self._get_from_disk(key)
+
+    async def aget(self, key):
+        """get() for coroutines: a memory miss is looked up in SQLite on a worker thread"""
+        value = self._get_from_memory(key)
+        if value is not None or self._db is None:
+            return value
+        return await asyncio.to_thread(self._get_from_disk, key)
+
+    def _get_from_memory(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def _get_from_disk(self, key):
+        with self._lock:
+            row = self._db.execute(f"SELECT value FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value = json.loads(row[0])
+            self._store_in_memory(key, value)
+            self.hits += 1
+            self.disk_hits += 1
+        # Access times only order trimming; they are written with the next batch
+        self._writes.put(("touch", key, time.time()))
+        return value
+
+    def set(self, key, value):
+        """Store a value in memory and, if configured, queue it for SQLite"""
+        with self._lock:
+            self._store_in_memory(key, value)
+        if self._writes is not None:
+            self._writes.put(("set", key, json.dumps(value), time.time()))
+
+    def _store_in_memory(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _write_loop(self, sqlite_path):
+        """Writer thread: apply queued writes in batches, one commit per batch"""
+        db = sqlite3.connect(sqlite_path)
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for write in batch:
+                    if write[0] == "set":
+                        _, key, value, now = write
+                        cursor = db.execute(
+                            f"INSERT OR IGNORE INTO {self.name} (key, value, last_used) VALUES (?, ?, ?)", (key, value, now)
+                        )
+                        if cursor.rowcount:
+                            self._disk_rows += 1
+                        else:
+                            db.execute(f"UPDATE {self.name} SET value = ?, last_used = ? WHERE key = ?", (value, now, key))
+                    else:
+                        _, key, now = write
+                        db.execute(f"UPDATE {self.name} SET last_used = ? WHERE key = ?", (now, key))
+                if self._disk_rows > self.max_disk_entries:
+                    db.execute(
+                        f"DELETE FROM {self.name} WHERE key IN (SELECT key FROM {self.name} ORDER BY last_used ASC LIMIT ?)",
+                        (self._disk_rows - self.max_disk_entries,)
+                    )
+                    self._disk_rows = self.max_disk_entries
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                logger.error(f"Cache '{self.name}' failed to write {len(batch)} entries to SQLite: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters for /health"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "persistent": self._db is not None,
+            "disk_entries": self._disk_rows
+        }
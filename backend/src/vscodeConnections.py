@@ -0,0 +1,257 @@
+"""
+Registry of connected VS Code extensions
+
+Extensions register their workspace folders and the page URLs they serve so
+that a source request can be routed to the one editor that owns the analysed
+page, instead of popping a file picker in every window. Connections are kept
+alive with a heartbeat; a registered connection that stops answering pings is
+closed even if the socket never reported an error.
+
+In a multi-worker deployment the registry also lists the connections held by
+the other workers (from the cluster bus) and sends to them through the bus.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from urllib.parse import urlparse
+from settings import VSCODE_HEARTBEAT_INTERVAL, VSCODE_HEARTBEAT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+def url_origin(url):
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if not parsed.scheme or not parsed.netloc:
+        return None
+    return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+class VSCodeConnection:
+    remote = False
+
+    def __init__(self, websocket):
+        self.id = str(uuid.uuid4())
+        self.websocket = websocket
+        self.workspace_folders = []
+        # Page URL prefixes served from this workspace, e.g. "http://localhost:3000"
+        self.urls = []
+        self.focused = False
+        # Registered extensions acknowledge request_source and answer pings
+        self.registered = False
+        self.connected_at = time.time()
+        self.last_seen = time.monotonic()
+        self.last_answer = 0.0
+
+    def shared_info(self):
+        """Registration state published to the other workers"""
+        return {
+            "workspaceFolders": self.workspace_folders,
+            "urls": self.urls,
+            "focused": self.focused,
+            "registered": self.registered,
+            "connectedAt": self.connected_at,
+            # Wall clock, monotonic time is not comparable across processes
+            "answeredAt": time.time() - (time.monotonic() - self.last_answer) if self.last_answer else 0.0
+        }
+
+    @property
+    def workspace_key(self):
+        """Identifies the workspace across reconnects of the same window"""
+        return tuple(sorted(self.workspace_folders)) or None
+
+    def serves(self, url):
+        """True if one of the registered URL prefixes matches the page URL"""
+        if not url:
+            return False
+        url = url.lower()
+        return any(url.startswith(prefix.lower()) or url_origin(url) == url_origin(prefix) for prefix in self.urls)
+
+    def info(self):
+        return {
+            "id": self.id,
+            "workspaceFolders": self.workspace_folders,
+            "urls": self.urls,
+            "focused": self.focused,
+            "registered": self.registered,
+            "idleSeconds": round(time.monotonic() - self.last_seen, 1)
+        }
+
+class RemoteVSCodeConnection(VSCodeConnection):
+    """A connection held by another worker process"""
+    remote = True
+
+    def __init__(self, connection_id, worker, info):
+        self.id = connection_id
+        self.worker = worker
+        self.websocket = None
+        self.workspace_folders = info.get("workspaceFolders") or []
+        self.urls = info.get("urls") or []
+        self.focused = bool(info.get("focused"))
+        self.registered = bool(info.get("registered"))
+        self.connected_at = info.get("connectedAt") or 0.0
+        self.last_seen = time.monotonic()
+        answered_at = info.get("answeredAt") or 0.0
+        self.last_answer = time.monotonic() - (time.time() - answered_at) if answered_at else 0.0
+
+    def info(self):
+        return {**super().info(), "worker": self.worker}
+
+class VSCodeConnectionRegistry:
+    def __init__(self, heartbeat_interval=VSCODE_HEARTBEAT_INTERVAL, heartbeat_timeout=VSCODE_HEARTBEAT_TIMEOUT):
+        """
+        Args:
+            heartbeat_interval: Seconds between pings to every connection
+            heartbeat_timeout: Seconds without any message after which a registered connection is dropped
+        """
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self._connections = {}
+        # Page origin -> workspace that last answered a source request for it
+        self._origin_affinity = {}
+        self.dropped = 0
+        self.bus = None
+
+    def attach_bus(self, bus):
+        """Share connections with the other workers of a multi-worker deployment"""
+        self.bus = bus
+        bus.on("vscode_send", self._deliver)
+        for connection in self._connections.values():
+            self._publish(connection)
+
+    def add(self, websocket):
+        connection = VSCodeConnection(websocket)
+        self._connections[connection.id] = connection
+        self._publish(connection)
+        return connection
+
+    def remove(self, connection_id):
+        if self.bus is not None:
+            self.bus.remove_connection(connection_id)
+        return self._connections.pop(connection_id, None)
+
+    def get(self, connection_id):
+        connection = self._connections.get(connection_id)
+        if connection is None:
+            connection = next((remote for remote in self._remote_connections() if remote.id == connection_id), None)
+        return connection
+
+    def __len__(self):
+        return len(self._connections) + len(self._remote_connections())
+
+    def __iter__(self):
+        """Connections held by this worker"""
+        return iter(list(self._connections.values()))
+
+    def _remote_connections(self):
+        if self.bus is None:
+            return []
+        return [RemoteVSCodeConnection(*row) for row in self.bus.remote_connections()]
+
+    def _publish(self, connection):
+        if self.bus is not None and not connection.remote:
+            self.bus.put_connection(connection.id, connection.shared_info())
+
+    def register(self, connection, message):
+        """Apply a register message from the extension"""
+        connection.workspace_folders = [folder for folder in message.get("workspaceFolders") or [] if isinstance(folder, str)]
+        connection.urls = [url for url in message.get("urls") or [] if isinstance(url, str)]
+        connection.focused = bool(message.get("focused", connection.focused))
+        connection.registered = True
+        self._publish(connection)
+        logger.info(f"VS Code connection {connection.id} registered workspace {connection.workspace_folders} for {connection.urls or 'any URL'}")
+
+    def set_focus(self, connection, focused):
+        connection.focused = bool(focused)
+        self._publish(connection)
+
+    def touch(self, connection):
+        connection.last_seen = time.monotonic()
+
+    def record_answer(self, connection, url):
+        """Remember which workspace answered for a page so the next request goes there first"""
+        connection.last_answer = time.monotonic()
+        self._publish(connection)
+        origin = url_origin(url)
+        if origin and connection.workspace_key:
+            self._origin_affinity[origin] = connection.workspace_key
+
+    def rank(self, url=None):
+        """
+        Connections ordered by how likely they own the page: registered URL
+        match, then the workspace that answered last time for the same origin,
+        then the focused window, then the most recently answering one.
+        Includes the connections held by other workers.
+        """
+        origin = url_origin(url)
+        learned = self._origin_affinity.get(origin) if origin else None
+
+        def score(connection):
+            return (
+                connection.serves(url),
+                learned is not None and connection.workspace_key == learned,
+                connection.focused,
+                connection.registered,
+                connection.last_answer,
+                connection.connected_at
+            )
+        return sorted([*self._connections.values(), *self._remote_connections()], key=score, reverse=True)
+
+    async def send(self, connection, message):
+        """
+        Send a message, dropping the connection if the socket is dead. Returns True on success.
+        Messages for connections of other workers go through the bus and count as sent.
+        """
+        if connection.remote:
+            self.bus.publish(connection.worker, "vscode_send", connectionId=connection.id, message=message)
+            return True
+        try:
+            await connection.websocket.send_text(json.dumps(message))
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to send to connection {connection.id}: {e}")
+            self._drop(connection)
+            return False
+
+    async def run_heartbeat(self):
+        """Background task pinging registered connections and dropping the silent ones"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for connection in self:
+                # Extensions that never registered do not know "ping" and would log it as an unknown
+                # message every interval; only a failed send reveals that they are gone
+                if not connection.registered:
+                    continue
+                if now - connection.last_seen > self.heartbeat_timeout:
+                    logger.warning(f"💔 VS Code connection {connection.id} missed its heartbeat, closing it")
+                    self._drop(connection)
+                    try:
+                        await connection.websocket.close()
+                    except Exception:
+                        pass
+                    continue
+                await self.send(connection, {"type": "ping"})
+
+    async def _deliver(self, payload):
+        """Send a message another worker routed to one of this worker's connections"""
+        connection = self._connections.get(payload.get("connectionId"))
+        if connection is None:
+            logger.warning(f"Connection {payload.get('connectionId')} is no longer held by this worker")
+            return
+        await self.send(connection, payload["message"])
+
+    def _drop(self, connection):
+        if self._connections.pop(connection.id, None) is not None:
+            self.dropped += 1
+            if self.bus is not None:
+                self.bus.remove_connection(connection.id)
+
+    def stats(self):
+        return {
+            "connections": [connection.info() for connection in [*self, *self._remote_connections()]],
+            "dropped": self.dropped
+        }
+
+vscode_registry = VSCodeConnectionRegistry()
@@ -2,7 +2,11 @@
 """
 AWARE Backend Server Launcher
 Run this script to start the FastAPI backend server
+
+    python start_server.py                 # development: one process, reloads on code changes
+    python start_server.py --workers 4     # production: 4 worker processes, no reload
 """
+import argparse
 import os
 import sys
 import uvicorn
@@ -11,19 +15,48 @@ import uvicorn
 src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
 sys.path.insert(0, src_dir)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the AWARE backend server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5500)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; more than one disables reload and shares state through --bus")
+    parser.add_argument("--bus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "aware_cluster.db"),
+                        help="SQLite file the workers share sessions, VS Code connections and messages through")
+    parser.add_argument("--no-reload", action="store_true", help="Do not reload on code changes (single worker)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    # Import after path setup
-    from processor import app
-    
+    args = parse_args()
+    production = args.workers > 1 or args.no_reload
+
+    if args.workers > 1:
+        # Read by settings.py in every worker process
+        os.environ["AWARE_CLUSTER_BUS"] = args.bus
+        os.environ.setdefault("AWARE_SESSION_STORE", "sqlite")
+        # A bus left over from a previous run would route to workers that no longer exist
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.bus + suffix):
+                os.remove(args.bus + suffix)
+
     print("Starting AWARE Backend Server...")
-    print("Server will be available at: http://127.0.0.1:5500")
-    print("API docs will be available at: http://127.0.0.1:5500/docs")
+    print(f"Server will be available at: http://{args.host}:{args.port}")
+    print(f"API docs will be available at: http://{args.host}:{args.port}/docs")
+    if args.workers > 1:
+        print(f"Running {args.workers} workers sharing state through {args.bus}")
     print("Press Ctrl+C to stop the server")
-    
+
+    # Workers and reload need the app as an import string
     uvicorn.run(
-        app,
-        host="127.0.0.1",
-        port=5500,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+        "processor:app",
+        app_dir=src_dir,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=not production,
+        reload_dirs=[src_dir] if not production else None,
+        log_level="info",
+        ws_max_size=16777216,
+        ws_ping_interval=20,
+        ws_ping_timeout=10
+    )
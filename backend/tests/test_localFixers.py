@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from localFixers import fix_missing_main, is_decorative_image
+
+def test_decorative_class_names():
+    assert is_decorative_image('<img class="divider" src="line.png">')
+    assert is_decorative_image('<img class="hero spacer" src="x.png">')
+
+def test_hyphenated_class_names_are_content():
+    assert not is_decorative_image('<img class="section-divider-photo" src="team.jpg">')
+    assert not is_decorative_image('<img className="spacer-hero" src="team.jpg" />')
+
+def test_main_fix_wraps_the_whole_container():
+    document = '<html><body><header>Logo</header><div class="content"><div>News</div></div><footer>Contact</footer></body></html>'
+    _, snippet = fix_missing_main(document, "", False)
+    assert snippet == '<main class="content"><div>News</div></main>'
+
+def test_main_fix_skips_truncated_containers():
+    assert fix_missing_main('<html><body><div class="content"><div>News</div>...', "", False) is None
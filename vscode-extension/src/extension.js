@@ -2,11 +2,16 @@ const vscode = require('vscode');
 const WebSocket = require('ws');
 const fs = require('fs');
 const path = require('path');
+const crypto = require('crypto');
 
 let ws = null;
 let isConnected = false;
 let reconnectInterval = null;
 
+// Last version of each file sent to the backend, used as the base for deltas
+const MAX_SENT_FILES = 20;
+const sentFiles = new Map();
+
 function activate(context) {
     console.log('Accessibility Source Code Extension activated');
 
@@ -78,6 +83,7 @@ function activate(context) {
             ws.on('open', () => {
                 isConnected = true;
                 updateStatusBar();
+                registerWithBackend();
                 vscode.window.showInformationMessage('Connected to Accessibility Engine Backend');
                 
                 // Clear reconnection attempts
@@ -123,6 +129,33 @@ function activate(context) {
         }
     }
 
+    // Tell the backend which workspace and pages this window serves so source requests are routed here
+    function registerWithBackend() {
+        const config = vscode.workspace.getConfiguration('accessibilityEngine');
+        sendMessage({
+            type: 'register',
+            workspaceFolders: (vscode.workspace.workspaceFolders || []).map(folder => folder.uri.fsPath),
+            urls: config.get('pageUrls', []),
+            focused: vscode.window.state.focused
+        });
+    }
+
+    context.subscriptions.push(
+        vscode.window.onDidChangeWindowState(state => sendMessage({ type: 'focus', focused: state.focused })),
+        vscode.workspace.onDidChangeWorkspaceFolders(registerWithBackend),
+        vscode.workspace.onDidChangeConfiguration(event => {
+            if (event.affectsConfiguration('accessibilityEngine.pageUrls')) {
+                registerWithBackend();
+            }
+        })
+    );
+
+    function sendMessage(message) {
+        if (ws && isConnected) {
+            ws.send(JSON.stringify(message));
+        }
+    }
+
     function disconnectFromBackend() {
         if (ws) {
             ws.close();
@@ -141,22 +174,45 @@ function activate(context) {
             case 'request_source':
                 await handleSourceCodeRequest(message);
                 break;
+            case 'request_source_content':
+                await handleSourceContentRequest(message);
+                break;
+            case 'cancel_source':
+                cancelSourceRequest(message.sessionId);
+                break;
+            case 'ping':
+                sendMessage({ type: 'pong' });
+                break;
             default:
                 console.log('Unknown message type:', message.type);
         }
     }
 
     let isHandlingSourceRequest = false;
+    // sessionId -> CancellationTokenSource of the file picker shown for it
+    const activeSourceRequests = new Map();
+
+    function cancelSourceRequest(sessionId) {
+        const tokenSource = activeSourceRequests.get(sessionId);
+        if (tokenSource) {
+            console.log('🛑 Source request cancelled by backend:', sessionId);
+            tokenSource.cancel();
+        }
+    }
 
     async function handleSourceCodeRequest(message) {
+        // Prevent multiple concurrent source code requests; the backend tries another window
+        if (isHandlingSourceRequest) {
+            console.log('⚠️  Already handling a source code request, declining');
+            sendMessage({ type: 'source_request_declined', sessionId: message.sessionId });
+            return;
+        }
+
+        const tokenSource = new vscode.CancellationTokenSource();
+        activeSourceRequests.set(message.sessionId, tokenSource);
         try {
-            // Prevent multiple concurrent source code requests
-            if (isHandlingSourceRequest) {
-                console.log('⚠️  Already handling a source code request, ignoring duplicate');
-                return;
-            }
-            
             isHandlingSourceRequest = true;
+            sendMessage({ type: 'source_request_ack', sessionId: message.sessionId });
             
             const { sessionId, violations, url } = message;
             
@@ -201,14 +257,20 @@ function activate(context) {
                 placeHolder: `Select source file for accessibility analysis (${items.length} files found)`,
                 matchOnDescription: true,
                 matchOnDetail: true
-            });
+            }, tokenSource.token);
+            
+            if (tokenSource.token.isCancellationRequested) {
+                // The backend gave up on this request or routed it elsewhere, nobody waits for an answer
+                console.log('🛑 File picker closed, request cancelled by backend');
+                return;
+            }
             
             if (selected) {
                 console.log('✅ User selected:', selected.file.path);
                 
                 // Read file content
                 const content = await fs.promises.readFile(selected.file.path, 'utf-8');
-                sendSourceCodeResponse(sessionId, selected.file.path, content);
+                sendSourceFile(sessionId, selected.file.path, content, message.cachedFiles);
                 
                 // Show success notification
                 vscode.window.showInformationMessage(
@@ -227,21 +289,97 @@ function activate(context) {
             sendSourceCodeResponse(message.sessionId, null, null);
         } finally {
             isHandlingSourceRequest = false;
+            activeSourceRequests.delete(message.sessionId);
+            tokenSource.dispose();
         }
     }
 
-    function sendSourceCodeResponse(sessionId, filePath, content) {
+    async function handleSourceContentRequest(message) {
+        // The backend no longer has the version we referenced, send the whole file
+        const { sessionId, filePath } = message;
+        try {
+            const sent = sentFiles.get(filePath);
+            const content = sent ? sent.content : await fs.promises.readFile(filePath, 'utf-8');
+            sendSourceCodeResponse(sessionId, filePath, content, { contentHash: hashContent(content) });
+        } catch (error) {
+            console.error('❌ Error re-sending source file:', error);
+            sendSourceCodeResponse(sessionId, null, null);
+        }
+    }
+
+    function sendSourceCodeResponse(sessionId, filePath, content, extra = {}) {
         if (ws && isConnected) {
             const response = {
                 type: 'source_response',
                 sessionId: sessionId,
                 filePath: filePath,
-                content: content
+                content: content,
+                ...extra
             };
             ws.send(JSON.stringify(response));
         }
     }
 
+    // Send only a hash or a line delta when the backend already has a version of the file
+    function sendSourceFile(sessionId, filePath, content, cachedFiles) {
+        const contentHash = hashContent(content);
+        const cachedHash = cachedFiles ? cachedFiles[filePath] : undefined;
+        const previous = sentFiles.get(filePath);
+        rememberSentFile(filePath, content, contentHash);
+
+        if (cachedHash === contentHash) {
+            console.log(`📦 Backend already has ${path.basename(filePath)}, sending hash only`);
+            sendSourceCodeResponse(sessionId, filePath, null, { contentHash });
+            return;
+        }
+
+        if (cachedHash && previous && previous.hash === cachedHash) {
+            const delta = computeLineDelta(previous.content, content);
+            const deltaSize = delta.reduce((size, [, , inserted]) => size + inserted.join('').length, 0);
+            if (deltaSize < content.length / 2) {
+                console.log(`📦 Sending ${deltaSize} changed characters of ${path.basename(filePath)}`);
+                sendSourceCodeResponse(sessionId, filePath, null, { contentHash, baseHash: cachedHash, delta });
+                return;
+            }
+        }
+
+        sendSourceCodeResponse(sessionId, filePath, content, { contentHash });
+    }
+
+    function rememberSentFile(filePath, content, hash) {
+        sentFiles.delete(filePath);
+        sentFiles.set(filePath, { content, hash });
+        if (sentFiles.size > MAX_SENT_FILES) {
+            sentFiles.delete(sentFiles.keys().next().value);
+        }
+    }
+
+    function hashContent(content) {
+        return crypto.createHash('sha256').update(content, 'utf8').digest('hex');
+    }
+
+    // Lines including their line break, split the same way as the backend
+    function splitLines(text) {
+        return text.match(/[^\n]*\n|[^\n]+$/g) || [];
+    }
+
+    // Single hunk [start, deleteCount, insertedLines] covering everything between
+    // the common leading and trailing lines
+    function computeLineDelta(base, content) {
+        const baseLines = splitLines(base);
+        const lines = splitLines(content);
+        let prefix = 0;
+        while (prefix < baseLines.length && prefix < lines.length && baseLines[prefix] === lines[prefix]) {
+            prefix++;
+        }
+        let suffix = 0;
+        while (suffix < baseLines.length - prefix && suffix < lines.length - prefix &&
+               baseLines[baseLines.length - 1 - suffix] === lines[lines.length - 1 - suffix]) {
+            suffix++;
+        }
+        return [[prefix, baseLines.length - prefix - suffix, lines.slice(prefix, lines.length - suffix)]];
+    }
+
     async function findRelevantSourceFiles(violations, url) {
         const workspaceFolders = vscode.workspace.workspaceFolders;
         if (!workspaceFolders || workspaceFolders.length === 0) {